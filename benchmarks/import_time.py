@@ -0,0 +1,152 @@
+"""
+Code location import-time benchmark.
+
+Loads the code location the way the webserver, the daemon and every run
+process do (``import src`` and building the repository of ``src.defs``),
+each sample in a fresh interpreter. Reports the time spent importing
+Dagster itself and the time the location adds on top of it, and which
+heavy compute modules (NumPy, SciPy, ...) were imported while loading it,
+as JSON that can be compared across commits.
+
+Exits with status 1 if loading the location imports a heavy module, takes
+longer than ``--max-seconds`` on top of Dagster, or is more than
+``--tolerance`` slower than the ``--compare`` results.
+
+Usage:
+    python -m benchmarks.import_time --samples 10 --output import_time.json
+    python -m benchmarks.import_time --compare import_time.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+# Modules only the asset computations need: the location must load without them
+HEAVY_MODULES = ("numpy", "scipy", "pandas", "pydicom", "skimage", "sklearn", "matplotlib", "PIL")
+
+# Default budget, in seconds, for loading the location on top of importing Dagster
+MAX_LOCATION_SECONDS = 0.3
+
+# Relative slowdown against --compare results that counts as a regression
+REGRESSION_TOLERANCE = 0.25
+
+_REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_SAMPLE_SCRIPT = """
+import json, sys, time, warnings
+warnings.simplefilter("ignore")
+start = time.perf_counter()
+import dagster
+dagster_loaded = time.perf_counter()
+import src
+src.defs.get_repository_def()
+location_loaded = time.perf_counter()
+heavy = sorted({{name.split(".")[0] for name in sys.modules}} & set({heavy_modules!r}))
+print(json.dumps({{
+    "dagster_seconds": dagster_loaded - start,
+    "location_seconds": location_loaded - dagster_loaded,
+    "heavy_modules": heavy,
+}}))
+"""
+
+
+def _sample():
+    """Import time of Dagster and of the code location, in a fresh interpreter"""
+    completed = subprocess.run(
+        [sys.executable, "-c", _SAMPLE_SCRIPT.format(heavy_modules=HEAVY_MODULES)],
+        capture_output=True, text=True, check=True, cwd=_REPOSITORY_ROOT,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _git_commit():
+    """Current commit of the repository, if available"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=_REPOSITORY_ROOT,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(samples):
+    """
+    Load the code location ``samples`` times, each in a fresh process.
+
+    Returns:
+        dict: Benchmark results, with the median of each timing
+    """
+    runs = [_sample() for _ in range(samples)]
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "samples": samples,
+        "dagster_seconds": statistics.median(run["dagster_seconds"] for run in runs),
+        "location_seconds": statistics.median(run["location_seconds"] for run in runs),
+        "location_seconds_max": max(run["location_seconds"] for run in runs),
+        "heavy_modules": sorted({name for run in runs for name in run["heavy_modules"]}),
+    }
+
+
+def check(results, max_seconds, baseline=None, tolerance=REGRESSION_TOLERANCE):
+    """
+    Reasons the results fail the import-time budget.
+
+    Returns:
+        list: One message per failure, empty if the location loads fast enough
+    """
+    failures = []
+    if results["heavy_modules"]:
+        failures.append(f"Loading the code location imported {', '.join(results['heavy_modules'])}")
+    if results["location_seconds"] > max_seconds:
+        failures.append(f"Loading the code location took {results['location_seconds']:.3f}s "
+                        f"on top of Dagster, over the {max_seconds:.3f}s budget")
+    if baseline is not None and baseline.get("location_seconds"):
+        ratio = results["location_seconds"] / baseline["location_seconds"]
+        if ratio > 1 + tolerance:
+            failures.append(f"Loading the code location is {ratio:.2f}x slower than at {baseline.get('commit')} "
+                            f"({results['location_seconds']:.3f}s against {baseline['location_seconds']:.3f}s)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=5, help="Fresh interpreters the location is loaded in")
+    parser.add_argument("--max-seconds", type=float, default=MAX_LOCATION_SECONDS,
+                        help="Budget for loading the location on top of importing Dagster")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="Relative slowdown against --compare that fails the benchmark")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Results JSON of a previous commit to compare against")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.samples)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        results["comparison"] = {
+            "baseline_commit": baseline.get("commit"),
+            "location_seconds_ratio": (
+                results["location_seconds"] / baseline["location_seconds"] if baseline.get("location_seconds") else None
+            ),
+        }
+    results["failures"] = check(results, args.max_seconds, baseline, args.tolerance)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    if results["failures"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
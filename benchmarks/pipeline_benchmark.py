@@ -0,0 +1,241 @@
+"""
+End-to-end pipeline benchmark.
+
+Materializes the whole asset graph of ``src.defs`` in-process for N
+synthetic patients, for every combination of simulated cost scale, volume
+dimensions and patient count. Each scenario runs in a fresh process so its
+peak RSS is not inflated by the previous ones. Reports end-to-end latency,
+per-asset wall and CPU time, input load time, serialization bytes and time, and
+peak RSS as JSON that can be compared across commits.
+
+Usage:
+    python -m benchmarks.pipeline_benchmark --cost-scale 0 --patients 1 4 \\
+        --cbct-dimensions 300x300x150 600x600x400 --output results.json
+    python -m benchmarks.pipeline_benchmark --cost-scale 0 --compare results.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+import warnings
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from dagster import DagsterEventType, DagsterInstance, ExperimentalWarning
+
+# Metrics compared by --compare (lower is better for all of them)
+COMPARED_METRICS = ("latency_mean_seconds", "wall_seconds", "peak_rss_mb")
+
+
+def _parse_dimensions(text):
+    """Parse "300x300x150" into [300, 300, 150]"""
+    dimensions = [int(value) for value in text.lower().split("x")]
+    if len(dimensions) != 3:
+        raise argparse.ArgumentTypeError(f"Expected three dimensions like 300x300x150, got {text!r}")
+    return dimensions
+
+
+def _peak_rss_mb():
+    """Peak resident set size of this process (ru_maxrss is in KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if platform.system() == "Darwin" else peak / 1024
+
+
+def _step_timings(instance, run_id):
+    """Wall and input load seconds per step, from the run's event log"""
+    starts = {}
+    inputs_loaded = {}
+    timings = {}
+    for entry in instance.all_logs(run_id):
+        event = entry.dagster_event
+        if event is None or entry.step_key is None:
+            continue
+        if event.event_type == DagsterEventType.STEP_START:
+            starts[entry.step_key] = entry.timestamp
+        elif event.event_type == DagsterEventType.LOADED_INPUT:
+            inputs_loaded[entry.step_key] = entry.timestamp
+        elif event.event_type == DagsterEventType.STEP_SUCCESS and entry.step_key in starts:
+            start = starts[entry.step_key]
+            timings[entry.step_key] = {
+                "wall_seconds": entry.timestamp - start,
+                "input_seconds": inputs_loaded.get(entry.step_key, start) - start,
+            }
+    return timings
+
+
+def _run_scenario(cost_scale, cbct_dimensions, ios_dimensions, patients):
+    """Materialize every asset for ``patients`` cases, in the current process"""
+    warnings.filterwarnings("ignore", category=ExperimentalWarning)
+    from src import defs
+
+    baseline_rss_mb = _peak_rss_mb()
+    partition_keys = [f"benchmark_{index:05d}" for index in range(patients)]
+    latencies = []
+    failures = []
+    per_asset = defaultdict(lambda: defaultdict(list))
+
+    with tempfile.TemporaryDirectory() as storage_dir, DagsterInstance.ephemeral() as instance:
+        instance.add_dynamic_partitions("patients", partition_keys)
+        run_config = {
+            "resources": {
+                "io_manager": {"config": {"base_dir": storage_dir, "metrics_file": ""}},
+                "segmentation_cache": {"config": {"enabled": False}},
+                "simulated_costs": {"config": {"scale": cost_scale}},
+            },
+            "ops": {
+                "cbct_scan_data": {"config": {
+                    "dimensions": cbct_dimensions,
+                    "intake_dir": os.path.join(storage_dir, "no_intake"),
+                }},
+                "ios_scan_data": {"config": {
+                    "dimensions": ios_dimensions,
+                    "intake_dir": os.path.join(storage_dir, "no_intake"),
+                }},
+                "aligned_model": {"config": {"output_dir": os.path.join(storage_dir, "exports")}},
+                "crown_design": {"config": {"output_dir": os.path.join(storage_dir, "exports")}},
+            },
+        }
+
+        start = time.perf_counter()
+        for partition_key in partition_keys:
+            case_start = time.perf_counter()
+            result = defs.get_job_def("materialize_all").execute_in_process(
+                partition_key=partition_key,
+                instance=instance,
+                run_config=run_config,
+                raise_on_error=False,
+            )
+            latencies.append(time.perf_counter() - case_start)
+            if not result.success:
+                failures.append(partition_key)
+
+            for step_key, timing in _step_timings(instance, result.run_id).items():
+                for name, value in timing.items():
+                    per_asset[step_key][name].append(value)
+            for event in result.get_asset_materialization_events():
+                materialization = event.step_materialization_data.materialization
+                metadata = {key: value.value for key, value in materialization.metadata.items()}
+                asset_name = materialization.asset_key.to_user_string()
+                for name in ("stored_mb", "write_seconds", "cpu_seconds", "peak_rss_delta_mb",
+                             "mesh_triangles", "mesh_extract_seconds", "mesh_write_seconds"):
+                    if name in metadata:
+                        per_asset[asset_name][name].append(metadata[name])
+        elapsed = time.perf_counter() - start
+
+    return {
+        "cost_scale": cost_scale,
+        "cbct_dimensions": cbct_dimensions,
+        "ios_dimensions": ios_dimensions,
+        "patients": patients,
+        "failed": failures,
+        "wall_seconds": elapsed,
+        "latency_mean_seconds": statistics.mean(latencies),
+        "latency_max_seconds": max(latencies),
+        "baseline_rss_mb": baseline_rss_mb,
+        "peak_rss_mb": _peak_rss_mb(),
+        "assets": {
+            asset_name: {f"{name}_mean": statistics.mean(values) for name, values in sorted(metrics.items())}
+            for asset_name, metrics in sorted(per_asset.items())
+        },
+    }
+
+
+def _git_commit():
+    """Current commit of the repository, if available"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(cost_scales, cbct_dimensions, ios_dimensions, patient_counts):
+    """
+    Run every scenario, each in a fresh process.
+
+    Returns:
+        dict: Benchmark results
+    """
+    scenarios = []
+    for cost_scale in cost_scales:
+        for dimensions in cbct_dimensions:
+            for patients in patient_counts:
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    scenario = executor.submit(_run_scenario, cost_scale, dimensions, ios_dimensions, patients).result()
+                scenarios.append(scenario)
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "scenarios": scenarios,
+    }
+
+
+def _scenario_key(scenario):
+    return (scenario["cost_scale"], tuple(scenario["cbct_dimensions"]), scenario["patients"])
+
+
+def compare(baseline, current):
+    """
+    Relative change of the main metrics between two result files.
+
+    Returns:
+        list: One row per scenario present in both, with the ratio
+            current / baseline of each metric
+    """
+    baseline_scenarios = {_scenario_key(scenario): scenario for scenario in baseline["scenarios"]}
+    rows = []
+    for scenario in current["scenarios"]:
+        reference = baseline_scenarios.get(_scenario_key(scenario))
+        if reference is None:
+            continue
+        row = {
+            "cost_scale": scenario["cost_scale"],
+            "cbct_dimensions": scenario["cbct_dimensions"],
+            "patients": scenario["patients"],
+        }
+        for metric in COMPARED_METRICS:
+            row[f"{metric}_ratio"] = scenario[metric] / reference[metric] if reference[metric] else None
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cost-scale", type=float, nargs="+", default=[0.0],
+                        help="Scales of the simulated processing times (0 measures pure overhead)")
+    parser.add_argument("--cbct-dimensions", type=_parse_dimensions, nargs="+", default=[[300, 300, 150]],
+                        help="CBCT jaw volume sizes, e.g. 300x300x150")
+    parser.add_argument("--ios-dimensions", type=_parse_dimensions, default=[200, 200, 100],
+                        help="IOS volume size")
+    parser.add_argument("--patients", type=int, nargs="+", default=[1], help="Patient counts")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Results JSON of a previous commit to compare against")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.cost_scale, args.cbct_dimensions, args.ios_dimensions, args.patients)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        results["comparison"] = {
+            "baseline_commit": baseline.get("commit"),
+            "scenarios": compare(baseline, results),
+        }
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
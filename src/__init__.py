@@ -1,6 +1,8 @@
 from .assets import *
 from .sensors import *
 from .jobs import *
+from .io_managers import *
+from .resources import *
 from dagster import Definitions
 
 
@@ -10,6 +12,7 @@ defs = Definitions(
         ios_scan_data,
         cbct_scan_data,
         ios_segmentation,
+        cbct_teeth_preview,
         cbct_teeth_segmentation,
         cbct_gum_detection,
         cbct_nerve_detection,
@@ -22,7 +25,8 @@ defs = Definitions(
       cbct_gum_seg_sensor,
       ios_scan_data_sensor,
       alignment_sensor,
-      crown_design_sensor
+      crown_design_sensor,
+      new_patient_sensor
     ],
     jobs=[
       materialize_all_job,
@@ -34,6 +38,13 @@ defs = Definitions(
       ios_scan_job,
       ios_seg_job,
       alignment_job,
-      crown_design_job
-    ]
+      crown_design_job,
+      patient_fast_path_job
+    ],
+    resources={
+      "io_manager": VolumeIOManager(),
+      "segmentation_cache": SegmentationCache(),
+      "simulated_costs": SimulatedCosts(),
+      "model_registry": ModelRegistry()
+    }
 )
\ No newline at end of file
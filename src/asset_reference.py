@@ -0,0 +1,111 @@
+from dagster import (
+    get_dagster_logger,
+)
+
+logger = get_dagster_logger()
+
+
+class StaleReferenceError(ValueError):
+    """The object an AssetReference points at was rematerialized since it was referenced"""
+
+
+class AssetReference:
+    """
+    A lightweight pointer to an object persisted by the VolumeIOManager.
+
+    Objects that hold on to their inputs (segmentations, aligned models,
+    crown designs) persist one of these instead of a full copy of the
+    upstream volumes, and re-hydrate it the first time it is accessed.
+    """
+    def __init__(self, asset_key, partition_key, storage_path, selector=(), content_hash=None):
+        """
+        Initialize an asset reference.
+
+        Args:
+            asset_key (AssetKey): Key of the asset that produced the object
+            partition_key (str, optional): Partition of the asset, if any
+            storage_path (str): Directory where the IO manager stored the asset
+            selector (tuple): Dict keys leading from the asset output to the object
+            content_hash (str, optional): Hash of the arrays backing the object
+        """
+        self.asset_key = asset_key
+        self.partition_key = partition_key
+        self.storage_path = storage_path
+        self.selector = tuple(selector)
+        self.content_hash = content_hash
+
+    def load(self):
+        """
+        Load the referenced object from storage.
+
+        Returns:
+            The referenced object, with its large arrays memory-mapped
+
+        Raises:
+            StaleReferenceError: If the stored object no longer matches the
+                content hash recorded with the reference. The version that
+                was referenced is gone, so the caller has to rematerialize
+                the object holding the reference.
+        """
+        # Imported here to keep this module free of IO manager dependencies
+        from .io_managers.volume_io_manager import read_volume_object, content_hash_of
+
+        value = read_volume_object(self.storage_path)
+        for key in self.selector:
+            value = value[key]
+
+        if self.content_hash is not None:
+            current_hash = content_hash_of(value, self.storage_path)
+            if current_hash != self.content_hash:
+                raise StaleReferenceError(
+                    f"{self!r} was rematerialized since it was referenced "
+                    f"(expected content {self.content_hash}, found {current_hash}); "
+                    f"rematerialize the assets depending on it"
+                )
+        value.asset_ref = self
+        return value
+
+    def __repr__(self):
+        """String representation of the asset reference"""
+        name = self.asset_key.to_user_string()
+        if self.partition_key is not None:
+            name = f"{name}[{self.partition_key}]"
+        if self.selector:
+            name = f"{name}/{'/'.join(map(str, self.selector))}"
+        return f"AssetReference({name})"
+
+
+def to_references(value):
+    """
+    Replace objects loaded from storage by their AssetReference.
+
+    Dicts are walked recursively; objects that were not loaded through the
+    VolumeIOManager are kept as they are.
+
+    Args:
+        value: An object or a (nested) dict of objects
+
+    Returns:
+        The same structure with references in place of stored objects
+    """
+    if isinstance(value, dict):
+        return {key: to_references(item) for key, item in value.items()}
+    ref = getattr(value, "asset_ref", None)
+    return ref if ref is not None else value
+
+
+def resolve_references(value):
+    """
+    Inverse of to_references: load every AssetReference in a structure.
+
+    Args:
+        value: A reference or a (nested) dict containing references
+
+    Returns:
+        The same structure with the referenced objects loaded
+    """
+    if isinstance(value, dict):
+        return {key: resolve_references(item) for key, item in value.items()}
+    if isinstance(value, AssetReference):
+        return value.load()
+    return value
@@ -9,6 +9,7 @@ from .ios_scan import ios_scan_data
 from .cbct_scan import cbct_scan_data
 from .ios_segment_teeth import ios_segmentation
 from .cbct_segment_teeth import cbct_teeth_segmentation
+from .cbct_teeth_preview import cbct_teeth_preview
 from .cbct_gum_region import cbct_gum_detection
 from .cbct_nerve_channels import cbct_nerve_detection
 from .alignment import aligned_model
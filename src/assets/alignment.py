@@ -1,4 +1,4 @@
-import time
+import os
 from dagster import (
     asset,
     AssetIn,
@@ -6,72 +6,158 @@ from dagster import (
     MetadataValue,
     get_dagster_logger,
 )
+from ..asset_reference import to_references, resolve_references
 from ..constants import *
+from ..partitions import patients_partitions
+from ..instrumentation import instrumented
+from ..run_costs import asset_cost_metadata
+from ..mesh_export import MeshExportConfig, export_surfaces, mesh_export_metadata
+from ..registration import RegistrationConfig, surface_points, icp
+from ..safe_data import safe_float
+from ..voxel_grid import to_millimetres
 from .ios_segment_teeth import ios_segmentation
 from .cbct_nerve_channels import cbct_nerve_key
-from .cbct_gum_region import cbct_gum_key
-from .cbct_segment_teeth import cbct_teeth_key
+from .cbct_gum_region import cbct_gum_keys
+from .cbct_segment_teeth import cbct_teeth_keys
+from ..lazy_imports import lazy_import
+
+np = lazy_import("numpy")
 
 
 logger = get_dagster_logger()
 
+
+class AlignmentConfig(MeshExportConfig, RegistrationConfig):
+    """Surface registration and mesh export for aligned_model"""
+
+
 class AlignedModel:
     """
     Represents an aligned 3D model created from multiple segmentation results.
+
+    ``transform`` is the 4x4 rigid transform mapping IOS positions onto
+    CBCT positions (both in mm, see voxel_grid), and ``residual`` the RMS
+    distance (in mm) between the registered surfaces.
     """
-    def __init__(self, name, source_segmentations):
+    def __init__(self, name, source_segmentations, transform=None, residual=None):
         self.name = name
-        self.source_segmentations = source_segmentations
-        self.aligned = True
+        # Segmentations loaded from storage are persisted as references
+        self._source_segmentation_refs = to_references(source_segmentations)
+        self._source_segmentations = source_segmentations
+        self.transform = np.eye(4) if transform is None else np.asarray(transform, dtype=np.float64)
+        self.residual = residual
+        self.aligned = transform is not None
+        # Surface mesh files keyed by format, once exported
+        self.mesh_files = {}
+
+    @property
+    def source_segmentations(self):
+        """The source segmentations, re-hydrated from their references on first access"""
+        if self._source_segmentations is None:
+            self._source_segmentations = resolve_references(self._source_segmentation_refs)
+        return self._source_segmentations
+
+    def __getstate__(self):
+        """Only the references to the segmentations are pickled"""
+        state = self.__dict__.copy()
+        state["_source_segmentations"] = None
+        return state
 
     def __repr__(self):
-        return f"AlignedModel(name={self.name}, aligned={self.aligned})"
+        return f"AlignedModel(name={self.name}, aligned={self.aligned}, residual={self.residual})"
 
 @asset(
+    partitions_def=patients_partitions,
     ins={
         "ios_seg": AssetIn(key=ios_segmentation.key),
-        "teeth_seg": AssetIn(key=cbct_teeth_key),
-        "gum_det": AssetIn(key=cbct_gum_key),
+        "upper_teeth": AssetIn(key=cbct_teeth_keys["upper_jaw"]),
+        "lower_teeth": AssetIn(key=cbct_teeth_keys["lower_jaw"]),
+        "upper_gum": AssetIn(key=cbct_gum_keys["upper_jaw"]),
+        "lower_gum": AssetIn(key=cbct_gum_keys["lower_jaw"]),
         "nerve_det": AssetIn(key=cbct_nerve_key)
     },
     group_name=GROUP_OUTPUT,
     metadata={
         "processing_time": f"{ALIGNMENT_TIME}s",
         "description": "Aligns IOS and CBCT segmentations into a unified model",
+        **asset_cost_metadata("aligned_model"),
     }
 )
+@instrumented
 def aligned_model(
     context: AssetExecutionContext,
+    config: AlignmentConfig,
     ios_seg,
-    teeth_seg,
-    gum_det,
+    upper_teeth,
+    lower_teeth,
+    upper_gum,
+    lower_gum,
     nerve_det
 ):
     """
     Align the results from IOS and CBCT segmentations to create a single detailed file.
+
+    The IOS teeth surface is registered onto the CBCT teeth surface (both
+    jaws) with multi-scale ICP on sampled surface points, bounded by
+    ``config.surface_points`` and ``config.icp_scales`` so the cost does
+    not grow with the size of the scans. The IOS and CBCT volumes have
+    unrelated voxel grids, so the points are mapped to millimetres with
+    each segmentation's spacing and origin before registering. The
+    surface of every segmentation is then extracted, decimated and written
+    as one mesh file per configured format, with a group per structure, in
+    the CBCT frame (mm): the IOS surface is moved by the registration
+    transform.
     """
     logger.info("Aligning segmentation results...")
-    time.sleep(ALIGNMENT_TIME)
-
-    # In a real implementation, this would combine the segmentation results
-    # into a single coherent 3D model
+    teeth_seg = {"upper_jaw": upper_teeth, "lower_jaw": lower_teeth}
+    gum_det = {"upper_jaw": upper_gum, "lower_jaw": lower_gum}
+    jaw_points = config.surface_points // len(CBCT_JAWS)
+    target = np.concatenate([
+        to_millimetres(surface_points(teeth_seg[jaw].data, jaw_points, seed=index), teeth_seg[jaw])
+        for index, jaw in enumerate(CBCT_JAWS)
+    ])
+    source = to_millimetres(surface_points(ios_seg.data, config.surface_points), ios_seg)
+    registration = icp(
+        source,
+        target,
+        config.icp_scales,
+        config.icp_max_iterations,
+        config.icp_tolerance,
+        config.icp_reject_factor,
+    )
+    logger.info(f"Registered IOS onto CBCT: residual {registration['residual']:.3f} mm "
+                f"after {registration['iterations']} iterations")
 
     # Create the aligned model using the class defined at module level
-    aligned = AlignedModel("patient_aligned_model", {
+    patient_id = context.partition_key
+    aligned = AlignedModel(f"{patient_id}_aligned_model", {
         "ios": ios_seg,
         "teeth": teeth_seg,
         "gums": gum_det,
         "nerves": nerve_det
-    })
+    }, transform=registration["transform"], residual=registration["residual"])
+
+    export = export_surfaces(
+        aligned.source_segmentations,
+        os.path.join(config.output_dir, patient_id, f"{patient_id}_aligned_model"),
+        config.target_triangles,
+        config.formats,
+        transforms={"ios": aligned.transform},
+    )
+    aligned.mesh_files = export["files"]
 
-    # Convert Python boolean to standard Python int for metadata
-    aligned_bool = 1 if aligned.aligned else 0
     seg_count = len(aligned.source_segmentations)
 
     context.add_output_metadata({
         "aligned": MetadataValue.bool(aligned.aligned),
         "source_segmentations": MetadataValue.int(seg_count),
-        "output_file": f"patient_aligned_model{OUTPUT_FILE_EXTENSION}"
+        "registration_residual": MetadataValue.float(safe_float(registration["residual"])),
+        "registration_iterations": MetadataValue.int(registration["iterations"]),
+        "registration_converged": MetadataValue.bool(registration["converged"]),
+        "registration_seconds": MetadataValue.float(safe_float(registration["seconds"])),
+        "registration_points": MetadataValue.json({"source": len(source), "target": len(target)}),
+        "transform": MetadataValue.json(aligned.transform.round(6).tolist()),
+        **mesh_export_metadata(export),
     })
 
     return aligned
\ No newline at end of file
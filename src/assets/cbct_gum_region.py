@@ -1,60 +1,153 @@
-import time
-import numpy as np
 from dagster import (
-    asset,
-    AssetIn,
+    multi_asset,
     AssetExecutionContext,
     MetadataValue,
+    ResourceParam,
+    Output,
     get_dagster_logger,
-    AssetKey
 )
-from ..constants import CBCT_GUM_DETECTION_TIME, GROUP_SEGMENTATION
+from ..constants import CBCT_GUM_DETECTION_TIME, CBCT_JAWS, GROUP_SEGMENTATION, GUM_ROI_PADDING
+from ..partitions import patients_partitions
+from ..instrumentation import instrumented
+from ..jaw_assets import (
+    DataVersionConfig,
+    derived_version,
+    is_up_to_date,
+    jaw_inputs,
+    jaw_keys,
+    jaw_outputs,
+    load_selected_jaws,
+    selected_jaws,
+    up_to_date_output,
+)
+from ..run_costs import asset_cost_metadata
 from ..safe_data import safe_float
+from ..parallel import JawParallelismConfig, run_per_jaw
+from ..slabs import StreamingConfig
+from ..roi import RoiConfig, bounding_box, box_to_list, crop_ratio, crop_scan, paste_mask
+from ..resources import SegmentationCache, SimulatedCosts, ModelRegistry
+from ..io_managers import VolumeIOManager
+from ..resources.simulated_costs import simulate_cost
 from ..segmentation_result import SegmentationResult
-from .cbct_scan import cbct_scan_data
-from .cbct_segment_teeth import cbct_teeth_key
+from .cbct_scan import cbct_scan_keys
+from .cbct_segment_teeth import cbct_teeth_keys
 
 logger = get_dagster_logger()
 
-cbct_gum_key = AssetKey("cbct_gum_detection")
+cbct_gum_keys = jaw_keys("cbct_gum_detection")
+
+class CbctGumDetectionConfig(JawParallelismConfig, StreamingConfig, RoiConfig, DataVersionConfig):
+    """Jaw parallelism, streaming, region-of-interest cropping and data versions for cbct_gum_detection"""
+    roi_padding: int = GUM_ROI_PADDING
+
 
-@asset(
-    ins={
-        "cbct_data": AssetIn(key=cbct_scan_data.key),
-        "teeth_segmentation": AssetIn(key=cbct_teeth_key),
-    },
-    key=cbct_gum_key,
+def _detect_gum(jaw, model, scan, mask_path=None, cost_scale=1.0, box=None):
+    """Detect the gums of one jaw, within ``box`` if given"""
+    name = f"{jaw.split('_')[0]}_gum"
+    # The simulated cost covers both jaws, each jaw takes its share of the
+    # voxels actually processed
+    simulate_cost(CBCT_GUM_DETECTION_TIME / len(CBCT_JAWS) * crop_ratio(scan.data.shape, box), cost_scale)
+    if box is None:
+        return SegmentationResult(name, scan, positive_fraction=model.positive_fraction, mask_path=mask_path)
+    roi = SegmentationResult(name, crop_scan(scan, box), positive_fraction=model.positive_fraction)
+    return SegmentationResult(name, scan, segmented_data=paste_mask(scan.data.shape, box, roi.data, mask_path))
+
+@multi_asset(
+    name="cbct_gum_detection",
+    partitions_def=patients_partitions,
+    ins={**jaw_inputs("scan", cbct_scan_keys), **jaw_inputs("teeth", cbct_teeth_keys)},
+    outs=jaw_outputs(
+        "cbct_gum_detection",
+        code_version="1",
+        metadata={
+            "processing_time": f"{CBCT_GUM_DETECTION_TIME / len(CBCT_JAWS)}s",
+            "description": "Detected gum regions of one jaw from CBCT scan",
+            **asset_cost_metadata("cbct_gum_detection", jaws=1),
+        },
+    ),
+    internal_asset_deps={jaw: {cbct_scan_keys[jaw], cbct_teeth_keys[jaw]} for jaw in CBCT_JAWS},
     group_name=GROUP_SEGMENTATION,
-    metadata={
-        "processing_time": f"{CBCT_GUM_DETECTION_TIME}s",
-        "description": "Detected gum regions from CBCT scan",
-    }
+    can_subset=True,
 )
-def cbct_gum_detection(context: AssetExecutionContext, cbct_data, teeth_segmentation):
+@instrumented
+def cbct_gum_detection(context: AssetExecutionContext, config: CbctGumDetectionConfig,
+                       segmentation_cache: SegmentationCache, simulated_costs: SimulatedCosts,
+                       model_registry: ModelRegistry, io_manager: ResourceParam[VolumeIOManager]):
     """
     Perform gum detection on CBCT scan data.
 
     This is the second step in the CBCT segmentation pipeline, which starts
-    after teeth segmentation is complete.
+    after teeth segmentation is complete. Each jaw is a separate asset, and
+    the selected jaws are processed concurrently. With
+    ``config.roi_cropping`` each jaw is cropped to the bounding box of its
+    teeth mask, padded by ``config.roi_padding`` voxels, and the detected
+    gums are pasted back into the full volume. Jaw scans already processed
+    by the same code version are answered from ``segmentation_cache``, and
+    jaws whose inputs, model and parameters did not change are reported up
+    to date.
     """
-    upper_jaw = cbct_data["upper_jaw"]
-    lower_jaw = cbct_data["lower_jaw"]
-
     # Step 2: Gum detection (depends on teeth segmentation being done)
     logger.info("Detecting gums from CBCT...")
-    time.sleep(CBCT_GUM_DETECTION_TIME)
+    model, model_metadata = model_registry.load("cbct_gum")
+    scans = load_selected_jaws(context, io_manager, cbct_scan_keys)
+    teeth = load_selected_jaws(context, io_manager, cbct_teeth_keys)
+    roi = {"roi_cropping": config.roi_cropping, "roi_padding": config.roi_padding}
+    versions = {
+        jaw: derived_version(context, cbct_gum_keys[jaw], model_version=model.version, **roi)
+        for jaw in selected_jaws(context)
+    }
+    jaws = [jaw for jaw, version in versions.items()
+            if not is_up_to_date(context, config, cbct_gum_keys[jaw], version)]
 
-    gum_upper = SegmentationResult("upper_gum", upper_jaw)
-    gum_lower = SegmentationResult("lower_gum", lower_jaw)
-    gum_result = {
-        "upper_jaw": gum_upper,
-        "lower_jaw": gum_lower
+    boxes = {
+        jaw: bounding_box(teeth[jaw].data, config.roi_padding) if config.roi_cropping else None
+        for jaw in jaws
     }
+    cache_keys = {
+        jaw: segmentation_cache.key_for(context, scans[jaw], asset_key=cbct_gum_keys[jaw],
+                                        model_version=model.version, roi=box_to_list(boxes[jaw]))
+        for jaw in jaws
+    }
+    gums = {}
+    for jaw in jaws:
+        mask = segmentation_cache.get(cache_keys[jaw])
+        if mask is not None:
+            gums[jaw] = SegmentationResult(f"{jaw.split('_')[0]}_gum", scans[jaw], segmented_data=mask)
+    misses = [jaw for jaw in jaws if jaw not in gums]
+
+    detected, jaw_seconds = run_per_jaw(
+        _detect_gum,
+        {
+            jaw: (jaw, model, scans[jaw], config.scratch_file(f"{context.partition_key}_{jaw}_gum"),
+                  simulated_costs.scale, boxes[jaw])
+            for jaw in misses
+        },
+        config,
+    )
+    for jaw, result in detected.items():
+        gums[jaw] = result
+        segmentation_cache.put(cache_keys[jaw], result.data)
 
-    context.add_output_metadata({
-        "upper_segmented": MetadataValue.float(safe_float(np.mean(gum_upper.data) * 100)),
-        "lower_segmented": MetadataValue.float(safe_float(np.mean(gum_lower.data) * 100))
-    })
+    for jaw, version in versions.items():
+        if jaw not in gums:
+            yield up_to_date_output(version, jaw)
+            continue
+        yield Output(
+            gums[jaw],
+            output_name=jaw,
+            data_version=version,
+            metadata={
+                "segmented": MetadataValue.float(safe_float(gums[jaw].data.mean() * 100)),
+                "roi_cropping": config.roi_cropping,
+                "crop_ratio": MetadataValue.float(safe_float(crop_ratio(scans[jaw].data.shape, boxes[jaw]))),
+                "roi_box": MetadataValue.json(box_to_list(boxes[jaw]) or []),
+                "cache_hits": MetadataValue.int(0 if jaw in misses else 1),
+                "cache_misses": MetadataValue.int(1 if jaw in misses else 0),
+                "model_version": model_metadata["model_version"],
+                "model_load_seconds": MetadataValue.float(safe_float(model_metadata["model_load_seconds"])),
+                "model_cache_hit": MetadataValue.bool(model_metadata["model_cache_hit"]),
+                "jaw_seconds": MetadataValue.float(safe_float(jaw_seconds.get(jaw, 0.0))),
+            },
+        )
 
     logger.info("CBCT gum detection complete")
-    return gum_result
\ No newline at end of file
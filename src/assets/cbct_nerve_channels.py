@@ -1,65 +1,116 @@
-import time
-import numpy as np
 from dagster import (
     asset,
     AssetIn,
     AssetExecutionContext,
     MetadataValue,
+    Output,
     get_dagster_logger,
     AssetKey
 )
-from ..constants import CBCT_NERVE_DETECTION_TIME, GROUP_SEGMENTATION
+from ..constants import CBCT_NERVE_DETECTION_TIME, GROUP_SEGMENTATION, NERVE_ROI_PADDING
+from ..partitions import patients_partitions
+from ..instrumentation import instrumented
+from ..jaw_assets import DataVersionConfig, derived_version, is_up_to_date, up_to_date_output
+from ..run_costs import asset_cost_metadata
 from ..safe_data import safe_float
 from ..segmentation_result import SegmentationResult
-from .cbct_scan import cbct_scan_data
-from .cbct_gum_region import cbct_gum_key
+from ..slabs import StreamingConfig
+from ..roi import RoiConfig, bounding_box, box_to_list, crop_ratio, crop_scan, paste_mask
+from ..resources import SegmentationCache, SimulatedCosts, ModelRegistry
+from .cbct_scan import cbct_scan_keys
+from .cbct_gum_region import cbct_gum_keys
 
 
 logger = get_dagster_logger()
 
 cbct_nerve_key = AssetKey("cbct_nerve_detection")
 
+
+class CbctNerveDetectionConfig(StreamingConfig, RoiConfig, DataVersionConfig):
+    """Streaming, region-of-interest cropping and data versions for cbct_nerve_detection"""
+    roi_padding: int = NERVE_ROI_PADDING
+
+
 @asset(
+    partitions_def=patients_partitions,
     ins={
-        "cbct_data": AssetIn(key=cbct_scan_data.key),
-        "gum_detection": AssetIn(key=cbct_gum_key),
+        "lower_jaw": AssetIn(key=cbct_scan_keys["lower_jaw"]),
+        "lower_gum": AssetIn(key=cbct_gum_keys["lower_jaw"]),
     },
     key=cbct_nerve_key,
     group_name=GROUP_SEGMENTATION,
+    code_version="1",
     metadata={
         "processing_time": f"{CBCT_NERVE_DETECTION_TIME}s",
         "description": "Detected nerve channels from CBCT scan",
+        **asset_cost_metadata("cbct_nerve_detection"),
     }
 )
-def cbct_nerve_detection(context: AssetExecutionContext, cbct_data, gum_detection):
+@instrumented
+def cbct_nerve_detection(context: AssetExecutionContext, config: CbctNerveDetectionConfig,
+                         segmentation_cache: SegmentationCache, simulated_costs: SimulatedCosts,
+                         model_registry: ModelRegistry, lower_jaw, lower_gum):
     """
     Perform nerve detection on CBCT scan data.
 
     This is the third step in the CBCT segmentation pipeline, which starts
-    after gum detection is complete.
+    after gum detection is complete. Nerves are only detected in the lower
+    jaw, so only the lower jaw's scan and gums are loaded. With
+    ``config.roi_cropping`` the lower jaw is cropped to the bounding box of
+    its gum mask, padded by ``config.roi_padding`` voxels, and the detected
+    canals are pasted back into the full volume. Scans already processed
+    by the same code version are answered from ``segmentation_cache``, and
+    the result is reported up to date while its inputs, model and
+    parameters do not change.
     """
-    lower_jaw = cbct_data["lower_jaw"]
+    model, model_metadata = model_registry.load("cbct_nerve")
+    version = derived_version(context, cbct_nerve_key, model_version=model.version,
+                              roi_cropping=config.roi_cropping, roi_padding=config.roi_padding)
+    if is_up_to_date(context, config, cbct_nerve_key, version):
+        return up_to_date_output(version)
+
+    box = bounding_box(lower_gum.data, config.roi_padding) if config.roi_cropping else None
+    ratio = crop_ratio(lower_jaw.data.shape, box)
 
     # Step 3: Nerve detection (depends on gum detection being done)
     logger.info("Detecting nerves from CBCT...")
-    time.sleep(CBCT_NERVE_DETECTION_TIME)
+    cache_key = segmentation_cache.key_for(context, lower_jaw, model_version=model.version, roi=box_to_list(box))
+    mask = segmentation_cache.get(cache_key)
+    if mask is not None:
+        nerve_lower = SegmentationResult("lower_nerve", lower_jaw, segmented_data=mask)
+    else:
+        # The simulated cost scales with the voxels actually processed
+        simulated_costs.wait(CBCT_NERVE_DETECTION_TIME * ratio)
 
-    # Nerves are typically only in the lower jaw
-    nerve_lower = SegmentationResult("lower_nerve", lower_jaw)
-    # For nerve detection, we want fewer positive voxels
-    nerve_lower.data = np.random.choice(
-        [True, False],
-        size=lower_jaw.data.shape,
-        p=[0.05, 0.95]  # Only 5% of voxels are nerve tissue
-    )
+        # Nerves are typically only in the lower jaw, and the model only
+        # segments a small fraction of the voxels as nerve tissue
+        mask_path = config.scratch_file(f"{context.partition_key}_lower_nerve")
+        if box is None:
+            nerve_lower = SegmentationResult("lower_nerve", lower_jaw, positive_fraction=model.positive_fraction,
+                                             mask_path=mask_path)
+        else:
+            roi = SegmentationResult("lower_nerve", crop_scan(lower_jaw, box),
+                                     positive_fraction=model.positive_fraction)
+            nerve_lower = SegmentationResult(
+                "lower_nerve",
+                lower_jaw,
+                segmented_data=paste_mask(lower_jaw.data.shape, box, roi.data, mask_path),
+            )
+        segmentation_cache.put(cache_key, nerve_lower.data)
 
     nerve_result = {
         "lower_jaw": nerve_lower
     }
 
-    context.add_output_metadata({
-        "nerve_volume_percentage": MetadataValue.float(safe_float(np.mean(nerve_lower.data) * 100))
-    })
-
     logger.info("CBCT nerve detection complete")
-    return nerve_result
\ No newline at end of file
+    return Output(nerve_result, data_version=version, metadata={
+        "nerve_volume_percentage": MetadataValue.float(safe_float(nerve_lower.data.mean() * 100)),
+        "roi_cropping": config.roi_cropping,
+        "crop_ratio": MetadataValue.float(safe_float(ratio)),
+        "roi_box": MetadataValue.json(box_to_list(box) or []),
+        "cache_hits": MetadataValue.int(0 if mask is None else 1),
+        "cache_misses": MetadataValue.int(1 if mask is None else 0),
+        "model_version": model_metadata["model_version"],
+        "model_load_seconds": MetadataValue.float(safe_float(model_metadata["model_load_seconds"])),
+        "model_cache_hit": MetadataValue.bool(model_metadata["model_cache_hit"]),
+    })
\ No newline at end of file
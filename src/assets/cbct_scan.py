@@ -1,47 +1,206 @@
+import os
 import time
+from typing import List
 from dagster import (
-    asset,
+    multi_asset,
     AssetExecutionContext,
     MetadataValue,
+    Output,
     get_dagster_logger
 )
-from ..constants import GROUP_INPUT, CBCT_LOAD_TIME
+from ..constants import (
+    GROUP_INPUT,
+    CBCT_LOAD_TIME,
+    CBCT_VOXEL_DTYPE,
+    CBCT_HU_RANGE,
+    CBCT_JAWS,
+    CBCT_DIMENSIONS,
+    CBCT_FILE_EXTENSION,
+    PATIENT_INTAKE_DIR,
+    DICOM_DECODE_WORKERS,
+    CBCT_PYRAMID_FACTORS,
+)
+from ..partitions import patients_partitions
+from ..instrumentation import instrumented
+from ..run_costs import asset_cost_metadata
 from ..safe_data import safe_float
 from ..dental_scan import DentalScan
+from ..parallel import JawParallelismConfig, run_per_jaw
+from ..slabs import StreamingConfig
+from ..dicom_series import DicomSeries
+from ..pyramid import build_pyramid
+from ..jaw_assets import (
+    DataVersionConfig,
+    array_version,
+    derived_version,
+    is_up_to_date,
+    jaw_keys,
+    jaw_outputs,
+    selected_jaws,
+    up_to_date_output,
+)
+from ..resources import SimulatedCosts
+from ..resources.simulated_costs import simulate_cost
+from ..lazy_imports import lazy_import
+
+np = lazy_import("numpy")
 
 logger = get_dagster_logger()
 
-@asset(
+class CbctScanConfig(JawParallelismConfig, StreamingConfig, DataVersionConfig):
+    """Intake location, volume size, jaw parallelism, streaming and data versions for cbct_scan_data"""
+    intake_dir: str = PATIENT_INTAKE_DIR
+    decode_workers: int = DICOM_DECODE_WORKERS  # Concurrent slice decodes per jaw
+    dimensions: List[int] = list(CBCT_DIMENSIONS)  # Size of simulated volumes
+    pyramid_factors: List[int] = list(CBCT_PYRAMID_FACTORS)  # Downsampled levels stored with each jaw
+
+
+def _load_jaw(name, dimensions, path=None, cost_scale=1.0, pyramid_factors=()):
+    """Load the scan of one jaw, streaming it to ``path`` if given"""
+    simulate_cost(CBCT_LOAD_TIME / len(CBCT_JAWS), cost_scale)  # Simulate loading time
+
+    # Create a simulated scan object, stored as 16-bit Hounsfield units
+    # like the DICOM pixel data. The jaws are stacked like in a series:
+    # the upper jaw's slices follow the lower jaw's.
+    origin = (float(dimensions[0]), 0.0, 0.0) if name == "upper_jaw" else (0.0, 0.0, 0.0)
+    scan = DentalScan(name, "CBCT", dimensions=dimensions,
+                      dtype=CBCT_VOXEL_DTYPE, value_range=CBCT_HU_RANGE, path=path, origin=origin)
+    scan.pyramid = build_pyramid(scan, pyramid_factors)
+    return scan
+
+def _load_dicom_jaw(name, series, slices, workers, path=None, pyramid_factors=()):
+    """Decode the slices of one jaw from a DICOM series, streaming them to ``path`` if given"""
+    out = None
+    if path is not None:
+        shape = (len(range(len(series.files))[slices]), series.rows, series.columns)
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=CBCT_VOXEL_DTYPE, shape=shape)
+    data = series.read(slices, out=out, workers=workers)
+    if isinstance(data, np.memmap):
+        data.flush()
+
+    # Keep the stored pixel values, mapped to Hounsfield units by the
+    # series' rescale slope/intercept
+    slope, intercept = series.rescale
+    spacing, origin = series.grid(slices)
+    scan = DentalScan.from_stored(name, "CBCT", data, scale=slope, offset=intercept, value_range=CBCT_HU_RANGE,
+                                  spacing=spacing, origin=origin)
+    scan.pyramid = build_pyramid(scan, pyramid_factors)
+    return scan
+
+cbct_scan_keys = jaw_keys("cbct_scan_data")
+
+
+@multi_asset(
+    name="cbct_scan_data",
+    partitions_def=patients_partitions,
+    outs=jaw_outputs(
+        "cbct_scan_data",
+        code_version="1",
+        metadata={
+            "file_type": "DICOM",
+            "description": "CBCT scan data of one jaw",
+            **asset_cost_metadata("cbct_scan_data", jaws=1),
+        },
+    ),
     group_name=GROUP_INPUT,
-    metadata={
-        "file_type": "DICOM",
-        "description": "CBCT scan data for upper and lower jaw",
-    }
+    can_subset=True,
 )
-def cbct_scan_data(context: AssetExecutionContext):
+@instrumented
+def cbct_scan_data(context: AssetExecutionContext, config: CbctScanConfig, simulated_costs: SimulatedCosts):
     """
     Load CBCT (Cone Beam Computed Tomography) scan data from file system.
+
+    Each jaw is a separate asset, and only the selected jaws are loaded.
+    The case's DICOM series is indexed from the slice headers only, then
+    the slices of the upper and lower jaw are decoded concurrently (and in
+    parallel within each jaw) into int16 volumes. Cases without DICOM
+    files fall back to simulated data. With ``config.streaming`` the
+    volumes are written to disk as they are loaded rather than held in
+    memory. Each jaw also carries a pyramid of block-averaged levels
+    (``config.pyramid_factors``) for previews and coarse-to-fine
+    segmentation, stored alongside the full volume.
+
+    The data version of a jaw is derived from its raw slice files, so a
+    jaw whose files did not change since its last materialization is
+    reported up to date without being decoded (``config.skip_unchanged``).
     """
-    logger.info("Loading CBCT scan data...")
-    time.sleep(CBCT_LOAD_TIME)  # Simulate loading time
-
-    # Create simulated scan objects for upper and lower jaw
-    upper_jaw = DentalScan("upper_jaw", "CBCT", dimensions=(300, 300, 150))
-    lower_jaw = DentalScan("lower_jaw", "CBCT", dimensions=(300, 300, 150))
-
-    # Log some information about the loaded data
-    total_size_mb = (upper_jaw.data.nbytes + lower_jaw.data.nbytes) / 1024 / 1024
-    # Convert to standard Python float
-    total_size_mb = safe_float(total_size_mb)
-
-    context.add_output_metadata({
-        "upper_jaw_dimensions": MetadataValue.json(tuple(map(int, upper_jaw.dimensions))),
-        "lower_jaw_dimensions": MetadataValue.json(tuple(map(int, lower_jaw.dimensions))),
-        "file_size_mb": MetadataValue.float(total_size_mb),
-        "scan_type": "CBCT"
-    })
-
-    return {
-        "upper_jaw": upper_jaw,
-        "lower_jaw": lower_jaw
-    }
\ No newline at end of file
+    jaws = selected_jaws(context)
+    logger.info(f"Loading CBCT scan data of {', '.join(jaws)} for {context.partition_key}...")
+    start = time.perf_counter()
+    series = DicomSeries.index(os.path.join(config.intake_dir, context.partition_key), config.decode_workers)
+    series_metadata = {}
+
+    if series is not None:
+        logger.info(f"Indexed {series}")
+        jaw_slices = series.jaw_slices()
+        versions = {
+            jaw: derived_version(
+                context,
+                cbct_scan_keys[jaw],
+                slices=series.fingerprint(jaw_slices[jaw], config.decode_workers),
+                pyramid_factors=config.pyramid_factors,
+            )
+            for jaw in jaws
+        }
+        changed = [jaw for jaw in jaws if not is_up_to_date(context, config, cbct_scan_keys[jaw], versions[jaw])]
+        loaded, jaw_seconds = run_per_jaw(
+            _load_dicom_jaw,
+            {
+                jaw: (jaw, series, jaw_slices[jaw], config.decode_workers,
+                      config.scratch_file(f"{context.partition_key}_{jaw}"), config.pyramid_factors)
+                for jaw in changed
+            },
+            config,
+        )
+        series_metadata = {
+            "slices": MetadataValue.int(len(series.files)),
+            "slice_spacing_mm": MetadataValue.float(safe_float(series.slice_spacing)),
+            "pixel_spacing_mm": MetadataValue.json(list(series.pixel_spacing)),
+            "rescale": MetadataValue.json(list(series.rescale)),
+            "load_seconds": MetadataValue.float(safe_float(time.perf_counter() - start)),
+        }
+    else:
+        logger.warning(
+            f"No {CBCT_FILE_EXTENSION} files for {context.partition_key} in {config.intake_dir}, "
+            f"using simulated CBCT data"
+        )
+        loaded, jaw_seconds = run_per_jaw(
+            _load_jaw,
+            {
+                jaw: (jaw, tuple(config.dimensions), config.scratch_file(f"{context.partition_key}_{jaw}"),
+                      simulated_costs.scale, config.pyramid_factors)
+                for jaw in jaws
+            },
+            config,
+        )
+        # Simulated volumes differ on every load, so are never up to date
+        versions = {
+            jaw: derived_version(context, cbct_scan_keys[jaw], voxels=array_version(scan.data).value,
+                                 pyramid_factors=config.pyramid_factors)
+            for jaw, scan in loaded.items()
+        }
+
+    for jaw in jaws:
+        if jaw not in loaded:
+            yield up_to_date_output(versions[jaw], jaw, series_metadata)
+            continue
+        scan = loaded[jaw]
+        yield Output(
+            scan,
+            output_name=jaw,
+            data_version=versions[jaw],
+            metadata={
+                "dimensions": MetadataValue.json(tuple(map(int, scan.dimensions))),
+                # Convert to standard Python float
+                "file_size_mb": MetadataValue.float(safe_float(scan.nbytes / 1024 / 1024)),
+                "voxel_dtype": str(scan.data.dtype),
+                "pyramid_levels": MetadataValue.json({
+                    str(factor): list(map(int, level.dimensions)) for factor, level in sorted(scan.pyramid.items())
+                }),
+                "streaming": config.streaming,
+                "simulated": series is None,
+                "jaw_seconds": MetadataValue.float(safe_float(jaw_seconds[jaw])),
+                "scan_type": "CBCT",
+                **series_metadata
+            },
+        )
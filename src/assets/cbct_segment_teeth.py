@@ -1,57 +1,249 @@
 import time
-import numpy as np
 from dagster import (
-    asset,
-    AssetIn,
+    multi_asset,
     AssetExecutionContext,
+    BackfillPolicy,
     MetadataValue,
+    ResourceParam,
+    Output,
     get_dagster_logger,
-    AssetKey
 )
-from ..constants import CBCT_TEETH_SEGMENTATION_TIME, GROUP_SEGMENTATION
+from ..constants import (
+    CBCT_TEETH_SEGMENTATION_TIME,
+    CBCT_JAWS,
+    SEGMENTATION_PARTITIONS_PER_RUN,
+    GROUP_SEGMENTATION,
+)
+from ..partitions import patients_partitions
+from ..instrumentation import instrumented
+from ..jaw_assets import (
+    DataVersionConfig,
+    derived_version,
+    is_up_to_date,
+    jaw_inputs,
+    jaw_keys,
+    jaw_outputs,
+    load_selected_jaws,
+    selected_jaws,
+    up_to_date_output,
+)
+from ..run_costs import asset_cost_metadata
 from ..safe_data import safe_float
+from ..parallel import JawParallelismConfig, run_per_jaw
+from ..segmentation import SegmentationBatchConfig, iter_batches
+from ..slabs import StreamingConfig
+from ..pyramid import CoarseToFineConfig
+from ..resources import SegmentationCache, SimulatedCosts, ModelRegistry
+from ..io_managers import VolumeIOManager
+from ..resources.simulated_costs import simulate_cost
 from ..segmentation_result import SegmentationResult
-from .cbct_scan import cbct_scan_data
+from .cbct_scan import cbct_scan_keys
 
 logger = get_dagster_logger()
 
-cbct_teeth_key = AssetKey("cbct_teeth_segmentation")
+cbct_teeth_keys = jaw_keys("cbct_teeth_segmentation")
+
+class CbctTeethSegmentationConfig(SegmentationBatchConfig, JawParallelismConfig, StreamingConfig, CoarseToFineConfig,
+                                  DataVersionConfig):
+    """Batch size, jaw parallelism, streaming, coarse-to-fine and data versions for cbct_teeth_segmentation"""
+
+
+def _segment_jaw(jaw, model, scans, batch_size, streaming=None, cost_scale=1.0, coarse_to_fine=None):
+    """
+    Segment the teeth of one jaw for every partition in the run.
+
+    Args:
+        jaw (str): "upper_jaw" or "lower_jaw"
+        model (SegmentationModel): The CBCT teeth model
+        scans (dict): DentalScan of this jaw, keyed by partition
+        batch_size (int): Scans per vectorized model call
+        streaming (tuple, optional): (slab_size, halo, mask paths by
+            partition) to segment each scan slab by slab instead of stacking
+            whole volumes
+        cost_scale (float): Scale of the simulated processing time
+        coarse_to_fine (tuple, optional): (factor, margin, mask paths by
+            partition) to segment each scan on its pyramid level and refine
+            only around the coarse boundary
+
+    Returns:
+        tuple: (SegmentationResult per partition, number of batches,
+            fraction of the voxels refined at full resolution per partition)
+    """
+    name = f"{jaw.split('_')[0]}_teeth"
+    results = {}
+    refined = {}
+    batches = 0
+    if coarse_to_fine is not None:
+        factor, margin, mask_paths = coarse_to_fine
+        for partition_key, scan in scans.items():
+            mask, refined[partition_key] = model.segment_coarse_to_fine(
+                scan, factor, margin, path=mask_paths[partition_key]
+            )
+            # The model only runs on the coarse level and the refined voxels
+            simulate_cost(
+                CBCT_TEETH_SEGMENTATION_TIME / len(CBCT_JAWS) * (1.0 / factor ** 3 + refined[partition_key]),
+                cost_scale,
+            )
+            results[partition_key] = SegmentationResult(name, scan, segmented_data=mask)
+            batches += 1
+        return results, batches, refined
+
+    for batch_keys in iter_batches(list(scans), batch_size):
+        batch_scans = [scans[key] for key in batch_keys]
+        # The simulated cost covers both jaws, each jaw takes its share
+        simulate_cost(CBCT_TEETH_SEGMENTATION_TIME / len(CBCT_JAWS), cost_scale)
 
-@asset(
-    ins={
-        "cbct_data": AssetIn(key=cbct_scan_data.key),
-    },
-    key=cbct_teeth_key,
+        if streaming is not None:
+            slab_size, halo, mask_paths = streaming
+            masks = [
+                model.segment_streaming(scan, slab_size, halo, mask_paths[key])
+                for key, scan in zip(batch_keys, batch_scans)
+            ]
+        else:
+            masks = model.segment(batch_scans)
+        for partition_key, scan, mask in zip(batch_keys, batch_scans, masks):
+            results[partition_key] = SegmentationResult(name, scan, segmented_data=mask)
+        batches += 1
+    return results, batches, refined
+
+
+@multi_asset(
+    name="cbct_teeth_segmentation",
+    partitions_def=patients_partitions,
+    ins=jaw_inputs("scan", cbct_scan_keys),
+    outs=jaw_outputs(
+        "cbct_teeth_segmentation",
+        code_version="1",
+        metadata={
+            "processing_time": f"{CBCT_TEETH_SEGMENTATION_TIME / len(CBCT_JAWS)}s",
+            "description": "Segmented teeth of one jaw from CBCT scan",
+            **asset_cost_metadata("cbct_teeth_segmentation", jaws=1),
+        },
+    ),
+    internal_asset_deps={jaw: {cbct_scan_keys[jaw]} for jaw in CBCT_JAWS},
     group_name=GROUP_SEGMENTATION,
-    metadata={
-        "processing_time": f"{CBCT_TEETH_SEGMENTATION_TIME}s",
-        "description": "Segmented teeth from CBCT scan",
-    }
+    can_subset=True,
+    backfill_policy=BackfillPolicy.multi_run(max_partitions_per_run=SEGMENTATION_PARTITIONS_PER_RUN),
 )
-def cbct_teeth_segmentation(context: AssetExecutionContext, cbct_data):
+@instrumented
+def cbct_teeth_segmentation(context: AssetExecutionContext, config: CbctTeethSegmentationConfig,
+                            segmentation_cache: SegmentationCache, simulated_costs: SimulatedCosts,
+                            model_registry: ModelRegistry, io_manager: ResourceParam[VolumeIOManager]):
     """
     Perform teeth segmentation on CBCT scan data.
 
-    This is the first step in the CBCT segmentation pipeline.
+    This is the first step in the CBCT segmentation pipeline. Each jaw is
+    a separate asset, and the selected jaws are segmented concurrently.
+    Backfills run this asset for several patient partitions at once; the
+    jaw volumes of all of them are segmented in batches of
+    ``config.batch_size`` scans per model call. With ``config.streaming``
+    each scan is instead segmented slab by slab, so that no whole float
+    volume is ever materialized. With ``config.coarse_to_fine`` each scan
+    is segmented on its ``config.coarse_factor`` pyramid level first, and
+    only the voxels near the coarse boundary are segmented again at full
+    resolution. Jaw scans already segmented by the same code version are
+    answered from ``segmentation_cache``, and in single-partition runs
+    jaws whose scan, model and parameters did not change are reported up
+    to date.
     """
-    upper_jaw = cbct_data["upper_jaw"]
-    lower_jaw = cbct_data["lower_jaw"]
+    partition_keys = list(context.partition_keys)
+    scans = load_selected_jaws(context, io_manager, cbct_scan_keys)
+    if len(partition_keys) > 1:
+        cbct_by_jaw = scans
+    else:
+        cbct_by_jaw = {jaw: {partition_keys[0]: scan} for jaw, scan in scans.items()}
+
+    model, model_metadata = model_registry.load("cbct_teeth")
+    coarse_to_fine_params = [config.coarse_factor, config.refine_margin] if config.coarse_to_fine else None
+    versions = {
+        jaw: derived_version(context, cbct_teeth_keys[jaw], model_version=model.version,
+                             coarse_to_fine=coarse_to_fine_params)
+        for jaw in selected_jaws(context)
+    }
+    jaws = [jaw for jaw, version in versions.items()
+            if not is_up_to_date(context, config, cbct_teeth_keys[jaw], version)]
 
     # Step 1: Teeth segmentation
-    logger.info("Segmenting teeth from CBCT...")
-    time.sleep(CBCT_TEETH_SEGMENTATION_TIME)
-
-    teeth_upper = SegmentationResult("upper_teeth", upper_jaw)
-    teeth_lower = SegmentationResult("lower_teeth", lower_jaw)
-    teeth_result = {
-        "upper_jaw": teeth_upper,
-        "lower_jaw": teeth_lower
+    logger.info(f"Segmenting teeth of {', '.join(jaws) or 'no jaws'} from {len(partition_keys)} CBCT scans...")
+    def streaming(jaw):
+        if not config.streaming:
+            return None
+        mask_paths = {key: config.scratch_file(f"{key}_{jaw}_teeth") for key in partition_keys}
+        return config.slab_size, config.halo, mask_paths
+
+    def coarse_to_fine(jaw):
+        if not config.coarse_to_fine:
+            return None
+        mask_paths = {key: config.scratch_file(f"{key}_{jaw}_teeth") for key in partition_keys}
+        return config.coarse_factor, config.refine_margin, mask_paths
+
+    start = time.perf_counter()
+    results = {jaw: {} for jaw in jaws}
+    cache_keys = {}
+    for jaw in jaws:
+        for partition_key in partition_keys:
+            scan = cbct_by_jaw[jaw][partition_key]
+            cache_keys[partition_key, jaw] = segmentation_cache.key_for(
+                context, scan, asset_key=cbct_teeth_keys[jaw], model_version=model.version,
+                coarse_to_fine=coarse_to_fine_params,
+            )
+            mask = segmentation_cache.get(cache_keys[partition_key, jaw])
+            if mask is not None:
+                results[jaw][partition_key] = SegmentationResult(f"{jaw.split('_')[0]}_teeth", scan, segmented_data=mask)
+    misses = {
+        jaw: [key for key in partition_keys if key not in results[jaw]]
+        for jaw in jaws
     }
+    cache_misses = sum(len(keys) for keys in misses.values())
+    logger.info(f"Result cache: {len(partition_keys) * len(jaws) - cache_misses} hits, {cache_misses} misses")
+
+    jaw_results, jaw_seconds = run_per_jaw(
+        _segment_jaw,
+        {
+            jaw: (jaw, model, {key: cbct_by_jaw[jaw][key] for key in misses[jaw]}, config.batch_size, streaming(jaw),
+                  simulated_costs.scale, coarse_to_fine(jaw))
+            for jaw in jaws
+            if misses[jaw]
+        },
+        config,
+    )
+    elapsed = time.perf_counter() - start
+
+    for jaw, (jaw_segmentations, _, _) in jaw_results.items():
+        for partition_key, result in jaw_segmentations.items():
+            results[jaw][partition_key] = result
+            segmentation_cache.put(cache_keys[partition_key, jaw], result.data)
 
-    context.add_output_metadata({
-        "upper_segmented": MetadataValue.float(safe_float(np.mean(teeth_upper.data) * 100)),
-        "lower_segmented": MetadataValue.float(safe_float(np.mean(teeth_lower.data) * 100))
-    })
+    for jaw, version in versions.items():
+        if jaw not in results:
+            yield up_to_date_output(version, jaw)
+            continue
+        _, batches, refined = jaw_results.get(jaw, ({}, 0, {}))
+        refined = list(refined.values())
+        segmented = sum(result.data.mean() for result in results[jaw].values()) / len(partition_keys)
+        yield Output(
+            results[jaw] if len(partition_keys) > 1 else results[jaw][partition_keys[0]],
+            output_name=jaw,
+            data_version=version,
+            metadata={
+                "segmented": MetadataValue.float(safe_float(segmented * 100)),
+                "batch_size": MetadataValue.int(config.batch_size),
+                "streaming": config.streaming,
+                "batches": MetadataValue.int(batches),
+                "coarse_to_fine": config.coarse_to_fine,
+                "refined_percentage": MetadataValue.float(
+                    safe_float(sum(refined) / len(refined) * 100 if refined else 0.0)
+                ),
+                "scans_per_second": MetadataValue.float(
+                    safe_float(len(partition_keys) * len(jaws) / elapsed if elapsed else 0.0)
+                ),
+                "cache_hits": MetadataValue.int(len(partition_keys) - len(misses[jaw])),
+                "cache_misses": MetadataValue.int(len(misses[jaw])),
+                "model_version": model_metadata["model_version"],
+                "model_load_seconds": MetadataValue.float(safe_float(model_metadata["model_load_seconds"])),
+                "model_cache_hit": MetadataValue.bool(model_metadata["model_cache_hit"]),
+                "jaw_seconds": MetadataValue.float(safe_float(jaw_seconds.get(jaw, 0.0))),
+            },
+        )
 
     logger.info("CBCT teeth segmentation complete - crown design can begin")
-    return teeth_result
\ No newline at end of file
@@ -0,0 +1,129 @@
+import time
+from dagster import (
+    multi_asset,
+    AssetExecutionContext,
+    MetadataValue,
+    ResourceParam,
+    Output,
+    get_dagster_logger,
+)
+from ..constants import (
+    CBCT_TEETH_SEGMENTATION_TIME,
+    CBCT_JAWS,
+    CBCT_PREVIEW_FACTOR,
+    COARSE_CHECK_TOLERANCE,
+    GROUP_SEGMENTATION,
+)
+from ..partitions import patients_partitions
+from ..instrumentation import instrumented
+from ..jaw_assets import (
+    DataVersionConfig,
+    derived_version,
+    is_up_to_date,
+    jaw_inputs,
+    jaw_keys,
+    jaw_outputs,
+    load_selected_jaws,
+    selected_jaws,
+    up_to_date_output,
+)
+from ..run_costs import asset_cost_metadata
+from ..safe_data import safe_float
+from ..resources import SimulatedCosts, ModelRegistry
+from ..io_managers import VolumeIOManager
+from ..resources.simulated_costs import simulate_cost
+from ..segmentation_result import SegmentationResult
+from .cbct_scan import cbct_scan_keys
+
+logger = get_dagster_logger()
+
+
+class CbctTeethPreviewConfig(DataVersionConfig):
+    """Run configuration for cbct_teeth_preview"""
+    preview_factor: int = CBCT_PREVIEW_FACTOR  # Pyramid level the preview is segmented on
+    publish_unverified: bool = False  # Publish previews failing the check against full resolution
+
+
+cbct_preview_keys = jaw_keys("cbct_teeth_preview")
+
+
+@multi_asset(
+    name="cbct_teeth_preview",
+    partitions_def=patients_partitions,
+    ins=jaw_inputs("scan", cbct_scan_keys),
+    outs=jaw_outputs(
+        "cbct_teeth_preview",
+        code_version="1",
+        metadata={
+            "processing_time": f"{CBCT_TEETH_SEGMENTATION_TIME / len(CBCT_JAWS) / CBCT_PREVIEW_FACTOR ** 3:.3f}s",
+            "description": "Low resolution teeth segmentation preview of one jaw from CBCT scan",
+            **asset_cost_metadata("cbct_teeth_preview", jaws=1),
+        },
+    ),
+    internal_asset_deps={jaw: {cbct_scan_keys[jaw]} for jaw in CBCT_JAWS},
+    group_name=GROUP_SEGMENTATION,
+    can_subset=True,
+)
+@instrumented
+def cbct_teeth_preview(context: AssetExecutionContext, config: CbctTeethPreviewConfig,
+                       simulated_costs: SimulatedCosts, model_registry: ModelRegistry,
+                       io_manager: ResourceParam[VolumeIOManager]):
+    """
+    Segment the teeth on a downsampled level of the CBCT scan pyramid.
+
+    The preview runs the teeth model on the ``config.preview_factor`` level
+    of each selected jaw, a fraction of the voxels of the full volume, so a
+    coarse mask is published well before cbct_teeth_segmentation completes.
+    The masks have the dimensions of the pyramid level. Jaws whose scan,
+    model and preview factor did not change are reported up to date.
+
+    The preview is only representative when the scan is smooth at the
+    preview scale: averaging noise pulls the level towards its mean, and
+    the preview may then segment far fewer voxels than the full
+    resolution model (none at all on the simulated scans). A sample of the
+    level is checked against full resolution and published as
+    ``coarse_disagreement``. Above COARSE_CHECK_TOLERANCE the preview of the
+    jaw is not materialized, unless ``config.publish_unverified`` is set.
+    """
+    logger.info(f"Segmenting teeth preview at {config.preview_factor}x for {context.partition_key}...")
+    model, model_metadata = model_registry.load("cbct_teeth")
+    scans = load_selected_jaws(context, io_manager, cbct_scan_keys)
+
+    for jaw in selected_jaws(context):
+        version = derived_version(context, cbct_preview_keys[jaw], model_version=model.version,
+                                  preview_factor=config.preview_factor)
+        if is_up_to_date(context, config, cbct_preview_keys[jaw], version):
+            yield up_to_date_output(version, jaw)
+            continue
+
+        start = time.perf_counter()
+        level = scans[jaw].level(config.preview_factor)
+        # The model cost scales with the voxels it runs on
+        simulate_cost(CBCT_TEETH_SEGMENTATION_TIME / len(CBCT_JAWS) / config.preview_factor ** 3,
+                      simulated_costs.scale)
+        mask, = model.segment([level])
+        disagreement = model.coarse_disagreement(scans[jaw], config.preview_factor, mask)
+        if disagreement > COARSE_CHECK_TOLERANCE:
+            logger.warning(
+                f"{jaw} preview at {config.preview_factor}x disagrees with full resolution on "
+                f"{disagreement:.1%} of the checked voxels; it is not representative of cbct_teeth_segmentation"
+                + ("" if config.publish_unverified else ", skipping it")
+            )
+            if not config.publish_unverified:
+                continue
+        result = SegmentationResult(f"{jaw.split('_')[0]}_teeth_preview", level, segmented_data=mask)
+        yield Output(
+            result,
+            output_name=jaw,
+            data_version=version,
+            metadata={
+                "preview_factor": MetadataValue.int(config.preview_factor),
+                "preview_dimensions": MetadataValue.json(list(map(int, result.data.shape))),
+                "segmented": MetadataValue.float(safe_float(result.data.mean() * 100)),
+                "coarse_disagreement": MetadataValue.float(safe_float(disagreement * 100)),
+                "preview_seconds": MetadataValue.float(safe_float(time.perf_counter() - start)),
+                "model_version": model_metadata["model_version"],
+            },
+        )
+
+    logger.info("CBCT teeth preview complete")
@@ -1,4 +1,6 @@
+import os
 import time
+from typing import List
 from dagster import (
     asset,
     AssetIn,
@@ -7,64 +9,157 @@ from dagster import (
     get_dagster_logger,
 
 )
-from ..constants import CROWN_DESIGN_TIME, OUTPUT_FILE_EXTENSION, GROUP_OUTPUT
+from ..asset_reference import to_references, resolve_references
+from ..constants import (
+    CROWN_DESIGN_TIME,
+    CROWN_TOOTH_NUMBERS,
+    CROWN_EXECUTOR,
+    CROWN_MAX_WORKERS,
+    GROUP_OUTPUT,
+)
+from ..partitions import patients_partitions
+from ..instrumentation import instrumented
+from ..run_costs import asset_cost_metadata
+from ..mesh_export import MeshExportConfig, export_surfaces, mesh_export_metadata
+from ..parallel import run_parallel
+from ..safe_data import safe_float
+from ..resources import SimulatedCosts
+from ..resources.simulated_costs import simulate_cost
 from .ios_segment_teeth import ios_segmentation
-from .cbct_segment_teeth import cbct_teeth_key
+from .cbct_segment_teeth import cbct_teeth_keys
 
 logger = get_dagster_logger()
 
+
+class CrownDesignConfig(MeshExportConfig):
+    """Teeth to design crowns for, design parallelism and mesh export for crown_design"""
+    tooth_numbers: List[int] = list(CROWN_TOOTH_NUMBERS)  # FDI numbers, one crown each
+    crown_executor: str = CROWN_EXECUTOR  # "thread", "process" or "serial"
+    crown_max_workers: int = CROWN_MAX_WORKERS
+
+
 class CrownDesign:
     """
     Represents a dental crown design based on segmentation data.
+
+    ``mesh_files`` holds the IOS arch surface the crown is designed on.
+    The masks carry no tooth labels, so no per-tooth surface can be cropped
+    from them yet: the crowns of a case share the same arch mesh files.
     """
     def __init__(self, name, tooth_number, segmentations):
         self.name = name
         self.tooth_number = tooth_number
-        self.segmentations = segmentations
+        # Segmentations loaded from storage are persisted as references
+        self._segmentation_refs = to_references(segmentations)
+        self._segmentations = segmentations
         self.design_complete = True
+        # Surface mesh files keyed by format, once exported
+        self.mesh_files = {}
+
+    @property
+    def segmentations(self):
+        """The source segmentations, re-hydrated from their references on first access"""
+        if self._segmentations is None:
+            self._segmentations = resolve_references(self._segmentation_refs)
+        return self._segmentations
+
+    def __getstate__(self):
+        """Only the references to the segmentations are pickled"""
+        state = self.__dict__.copy()
+        state["_segmentations"] = None
+        return state
 
     def __repr__(self):
         return f"CrownDesign(name={self.name}, tooth={self.tooth_number})"
 
+
+def _design_crown(patient_id, tooth_number, segmentations, arch_files, cost_scale=1.0):
+    """Design the crown of one tooth on the exported arch surface"""
+    simulate_cost(CROWN_DESIGN_TIME, cost_scale)
+
+    # In a real implementation, this would use the segmentation results
+    # to design a crown that fits the patient's tooth
+    crown = CrownDesign(f"{patient_id}_crown_tooth{tooth_number}", tooth_number, segmentations)
+    crown.mesh_files = dict(arch_files)
+    return crown
+
 @asset(
+    partitions_def=patients_partitions,
     ins={
         "ios_seg": AssetIn(key=ios_segmentation.key),
-        "teeth_seg": AssetIn(key=cbct_teeth_key)
+        "upper_teeth": AssetIn(key=cbct_teeth_keys["upper_jaw"]),
+        "lower_teeth": AssetIn(key=cbct_teeth_keys["lower_jaw"]),
     },
     group_name=GROUP_OUTPUT,
     metadata={
-        "processing_time": f"{CROWN_DESIGN_TIME}s",
-        "description": "Designs a dental crown based on segmentation results",
+        "processing_time": f"{CROWN_DESIGN_TIME}s per crown, crowns in parallel",
+        "description": "Designs dental crowns based on segmentation results",
+        **asset_cost_metadata("crown_design"),
     }
 )
+@instrumented
 def crown_design(
     context: AssetExecutionContext,
+    config: CrownDesignConfig,
+    simulated_costs: SimulatedCosts,
     ios_seg,
-    teeth_seg
+    upper_teeth,
+    lower_teeth
 ):
     """
-    Design a crown using IOS segmentation and CBCT teeth segmentation.
-    """
-    logger.info("Designing crown...")
-    time.sleep(CROWN_DESIGN_TIME)
+    Design crowns using IOS segmentation and CBCT teeth segmentation.
 
-    # In a real implementation, this would use the segmentation results
-    # to design a crown that fits the patient's teeth
+    One design task runs per tooth in ``config.tooth_numbers`` (a bridge
+    lists each of its teeth), concurrently on a ``config.crown_executor``
+    pool, so several crowns take about the wall time of one.
+
+    The IOS teeth surface is extracted, decimated and written once per
+    configured format before the design tasks run. The segmentation masks
+    carry no tooth labels, so the surface cannot be cropped per tooth yet:
+    every crown refers to the same arch mesh rather than writing its own
+    copy of it.
+
+    Returns:
+        dict: CrownDesign per tooth number
+    """
+    tooth_numbers = list(dict.fromkeys(int(tooth) for tooth in config.tooth_numbers))
+    if not tooth_numbers:
+        raise ValueError("crown_design needs at least one tooth number")
+    logger.info(f"Designing {len(tooth_numbers)} crowns for teeth {tooth_numbers}...")
 
-    # Create the crown design using the class defined at module level
-    crown = CrownDesign("patient_crown_design", 14, {
+    patient_id = context.partition_key
+    segmentations = {
         "ios": ios_seg,
-        "teeth": teeth_seg
-    })
+        "teeth": {"upper_jaw": upper_teeth, "lower_jaw": lower_teeth}
+    }
+    export = export_surfaces(
+        {"ios": ios_seg},
+        os.path.join(config.output_dir, patient_id, f"{patient_id}_crown_arch"),
+        config.target_triangles,
+        config.formats,
+    )
 
-    # Make sure we're using standard Python types in metadata
-    tooth_num = int(crown.tooth_number)
-    design_complete = bool(crown.design_complete)
+    start = time.perf_counter()
+    crowns, tooth_seconds = run_parallel(
+        _design_crown,
+        {
+            tooth: (patient_id, tooth, segmentations, export["files"], simulated_costs.scale)
+            for tooth in tooth_numbers
+        },
+        config.crown_executor,
+        config.crown_max_workers,
+    )
+    elapsed = time.perf_counter() - start
 
+    # Make sure we're using standard Python types in metadata
     context.add_output_metadata({
-        "design_complete": MetadataValue.bool(design_complete),
-        "tooth_number": MetadataValue.int(tooth_num),
-        "output_file": f"patient_crown_tooth{tooth_num}{OUTPUT_FILE_EXTENSION}"
+        "design_complete": MetadataValue.bool(all(bool(crown.design_complete) for crown in crowns.values())),
+        "tooth_numbers": MetadataValue.json(tooth_numbers),
+        "crowns": MetadataValue.int(len(crowns)),
+        **mesh_export_metadata(export),
+        "design_seconds": MetadataValue.float(safe_float(elapsed)),
+        "slowest_crown_seconds": MetadataValue.float(safe_float(max(tooth_seconds.values()))),
     })
 
-    return crown
\ No newline at end of file
+    logger.info(f"Designed crowns for teeth {tooth_numbers} in {elapsed:.2f}s")
+    return crowns
\ No newline at end of file
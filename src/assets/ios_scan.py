@@ -1,47 +1,121 @@
+import os
 import time
-import numpy as np
+from typing import List
 from dagster import (
     asset,
     AssetExecutionContext,
+    Config,
     MetadataValue,
     get_dagster_logger
 )
 
-from ..constants import IOS_LOAD_TIME, GROUP_INPUT
+from ..constants import (
+    IOS_LOAD_TIME,
+    GROUP_INPUT,
+    IOS_VOXEL_DTYPE,
+    IOS_VOXEL_SCALE,
+    IOS_DIMENSIONS,
+    IOS_FILE_EXTENSION,
+    PATIENT_INTAKE_DIR,
+)
+from ..partitions import patients_partitions
+from ..instrumentation import instrumented
+from ..run_costs import asset_cost_metadata
 from ..safe_data import safe_float
 from ..dental_scan import DentalScan
+from ..stl import read_stl, voxelize, voxelize_grid
+from ..resources import SimulatedCosts
+from ..lazy_imports import lazy_import
+
+np = lazy_import("numpy")
 
 logger = get_dagster_logger()
 
+class IosScanConfig(Config):
+    """Where ios_scan_data finds the STL files of a case, and the volume size"""
+    intake_dir: str = PATIENT_INTAKE_DIR
+    dimensions: List[int] = list(IOS_DIMENSIONS)
+
+
+def _case_stl_files(intake_dir, patient_id):
+    """STL files of a case (any extension case), in a stable order"""
+    case_dir = os.path.join(intake_dir, patient_id)
+    if not os.path.isdir(case_dir):
+        return []
+    return sorted(
+        os.path.join(case_dir, file_name)
+        for file_name in os.listdir(case_dir)
+        if file_name.lower().endswith(IOS_FILE_EXTENSION)
+    )
+
 @asset(
+    partitions_def=patients_partitions,
     group_name=GROUP_INPUT,
     metadata={
         "file_type": "IOS STL",
         "description": "Intraoral scanner data in STL format",
+        **asset_cost_metadata("ios_scan_data"),
     }
 )
-def ios_scan_data(context: AssetExecutionContext):
+@instrumented
+def ios_scan_data(context: AssetExecutionContext, config: IosScanConfig, simulated_costs: SimulatedCosts):
     """
     Load IOS (Intraoral Scanner) data from file system.
 
+    The STL meshes in the case's intake directory (binary or ASCII) are
+    loaded and voxelized into a single volume, which records the size and
+    position of its voxels in the meshes' coordinates (mm). Cases without STL files fall
+    back to simulated data.
+
     Returns:
-        DentalScan: Object containing simulated IOS scan data
+        DentalScan: Object containing the IOS scan data
     """
     try:
-        logger.info("Loading IOS scan data...")
+        logger.info(f"Loading IOS scan data for {context.partition_key}...")
+        dimensions = tuple(config.dimensions)
+        name = f"{context.partition_key}_ios_scan"
+        stl_files = _case_stl_files(config.intake_dir, context.partition_key)
+        mesh_metadata = {}
 
-        # Simulate loading time
-        time.sleep(IOS_LOAD_TIME)
-
-        # Create a simulated scan object with explicit dimensions
-        dimensions = (200, 200, 100)
-        logger.info(f"Creating DentalScan with dimensions {dimensions}")
+        if stl_files:
+            start = time.perf_counter()
+            meshes = [read_stl(path) for path in stl_files]
+            logger.info(f"Loaded {len(meshes)} STL meshes: {meshes}")
+            spacing, origin = voxelize_grid(meshes, dimensions)
+            scan = DentalScan.from_values(
+                name,
+                "IOS",
+                voxelize(meshes, dimensions),
+                dtype=IOS_VOXEL_DTYPE,
+                scale=IOS_VOXEL_SCALE,
+                spacing=spacing,
+                origin=origin,
+            )
+            mesh_metadata = {
+                "voxel_spacing_mm": MetadataValue.json([round(value, 6) for value in spacing]),
+                "stl_files": MetadataValue.json([os.path.basename(path) for path in stl_files]),
+                "stl_formats": MetadataValue.json([mesh.file_format for mesh in meshes]),
+                "triangles": MetadataValue.int(sum(mesh.triangle_count for mesh in meshes)),
+                "vertices": MetadataValue.int(sum(mesh.vertex_count for mesh in meshes)),
+                "load_seconds": MetadataValue.float(safe_float(time.perf_counter() - start)),
+            }
+        else:
+            logger.warning(
+                f"No {IOS_FILE_EXTENSION} files for {context.partition_key} in {config.intake_dir}, "
+                f"using simulated IOS data"
+            )
+            # Simulate loading time
+            simulated_costs.wait(IOS_LOAD_TIME)
 
-        scan = DentalScan(
-            name="patient_ios_scan",
-            scan_type="IOS",
-            dimensions=dimensions
-        )
+            # Create a simulated scan object with explicit dimensions
+            logger.info(f"Creating DentalScan with dimensions {dimensions}")
+            scan = DentalScan(
+                name=name,
+                scan_type="IOS",
+                dimensions=dimensions,
+                dtype=IOS_VOXEL_DTYPE,
+                scale=IOS_VOXEL_SCALE
+            )
 
         # Verify the scan was created correctly
         logger.info(f"Successfully created DentalScan: {scan}")
@@ -54,7 +128,7 @@ def ios_scan_data(context: AssetExecutionContext):
 
         # Log some information about the loaded data
         try:
-            file_size_mb = scan.data.nbytes / 1024 / 1024
+            file_size_mb = scan.nbytes / 1024 / 1024
             # Convert to standard Python float
             file_size_mb = safe_float(file_size_mb)
 
@@ -64,7 +138,10 @@ def ios_scan_data(context: AssetExecutionContext):
             context.add_output_metadata({
                 "dimensions": MetadataValue.json(dimensions),
                 "file_size_mb": MetadataValue.float(file_size_mb),
-                "scan_type": "IOS"
+                "voxel_dtype": str(scan.data.dtype),
+                "simulated": not stl_files,
+                "scan_type": "IOS",
+                **mesh_metadata
             })
         except Exception as e:
             logger.error(f"Error adding metadata: {str(e)}")
@@ -1,84 +1,150 @@
 import time
-import numpy as np
 from dagster import (
     asset,
     AssetIn,
     AssetExecutionContext,
+    BackfillPolicy,
     MetadataValue,
     get_dagster_logger
 )
-from ..constants import IOS_SEGMENTATION_TIME, GROUP_SEGMENTATION
+from ..constants import (
+    IOS_SEGMENTATION_TIME,
+    SEGMENTATION_PARTITIONS_PER_RUN,
+    GROUP_SEGMENTATION,
+)
+from ..partitions import patients_partitions
+from ..instrumentation import instrumented
+from ..run_costs import asset_cost_metadata
 from ..safe_data import safe_float
 from ..dental_scan import DentalScan
+from ..segmentation import SegmentationBatchConfig, iter_batches
 from ..segmentation_result import SegmentationResult
+from ..resources import SegmentationCache, SimulatedCosts, ModelRegistry
 from .ios_scan import ios_scan_data
 
 logger = get_dagster_logger()
 
 @asset(
+    partitions_def=patients_partitions,
     ins={
         "ios_data": AssetIn(key=ios_scan_data.key)
     },
     group_name=GROUP_SEGMENTATION,
+    code_version="1",
+    backfill_policy=BackfillPolicy.multi_run(max_partitions_per_run=SEGMENTATION_PARTITIONS_PER_RUN),
     metadata={
         "processing_time": f"{IOS_SEGMENTATION_TIME}s",
         "description": "Segments teeth and other structures from IOS scan",
+        **asset_cost_metadata("ios_segmentation"),
     }
 )
-def ios_segmentation(context: AssetExecutionContext, ios_data):
+@instrumented
+def ios_segmentation(context: AssetExecutionContext, config: SegmentationBatchConfig,
+                     segmentation_cache: SegmentationCache, simulated_costs: SimulatedCosts,
+                     model_registry: ModelRegistry, ios_data):
     """
     Perform segmentation on IOS scan data.
 
+    Backfills run this asset for several patient partitions at once; their
+    scans are stacked and segmented in batches of ``config.batch_size``
+    scans per model call. Scans whose bytes were already segmented by the
+    same code version are answered from ``segmentation_cache``.
+
     Args:
         context: The Dagster execution context
-        ios_data: The IOS scan data to process, expected to be a DentalScan object
+        config: Batch size for the vectorized segmentation
+        segmentation_cache: Content-addressed cache of segmentation results
+        simulated_costs: Scale of the simulated processing time
+        model_registry: Provides the IOS teeth model, loaded once per process
+        ios_data: The IOS scan data to process, expected to be a DentalScan
+            object (a dict of them keyed by partition for multi-partition runs)
 
     Returns:
-        SegmentationResult: The segmentation result for the IOS scan
+        SegmentationResult: The segmentation result for the IOS scan (a dict
+            of them keyed by partition for multi-partition runs)
     """
     try:
+        partition_keys = list(context.partition_keys)
+        if len(partition_keys) > 1:
+            scans = ios_data
+        else:
+            scans = {partition_keys[0]: ios_data}
+
         # Detailed logging for debugging
-        logger.info(f"Starting IOS segmentation...")
-        logger.info(f"Received ios_data of type: {type(ios_data)}")
+        logger.info(f"Starting IOS segmentation of {len(scans)} scans...")
 
         # Input validation
-        if not isinstance(ios_data, DentalScan):
-            logger.warning(f"Expected DentalScan object, but got {type(ios_data)}. Attempting to continue...")
+        for partition_key, scan in scans.items():
+            if not isinstance(scan, DentalScan):
+                logger.warning(f"Expected DentalScan object for {partition_key}, but got {type(scan)}. Attempting to continue...")
 
         # More robust handling - extract name regardless of input type
-        scan_name = getattr(ios_data, 'name', 'unknown_scan')
-        logger.info(f"Segmenting IOS data from {scan_name}...")
+        scan_names = [getattr(scan, 'name', 'unknown_scan') for scan in scans.values()]
+        logger.info(f"Segmenting IOS data from {', '.join(scan_names)}...")
 
-        # Simulate processing time
-        time.sleep(IOS_SEGMENTATION_TIME)
+        model, model_metadata = model_registry.load("ios_teeth")
 
-        # Create a simulated segmentation result with enhanced error handling
-        try:
-            result = SegmentationResult("ios_teeth_segmentation", ios_data)
+        start = time.perf_counter()
+        results = {}
+        cache_keys = {
+            key: segmentation_cache.key_for(context, scan, model_version=model.version)
+            for key, scan in scans.items()
+        }
+        for key, scan in scans.items():
+            mask = segmentation_cache.get(cache_keys[key])
+            if mask is not None:
+                results[key] = SegmentationResult("ios_teeth_segmentation", scan, segmented_data=mask)
+        misses = [key for key in scans if key not in results]
+        logger.info(f"Result cache: {len(results)} hits, {len(misses)} misses")
+
+        batches = 0
+        for batch_keys in iter_batches(misses, config.batch_size):
+            batch_scans = [scans[key] for key in batch_keys]
 
-            # Calculate percentage of segmented voxels - with error handling
+            # Simulate processing time, paid once per model call
+            simulated_costs.wait(IOS_SEGMENTATION_TIME)
+
+            # Create simulated segmentation results with enhanced error handling
             try:
-                segmented_percent = np.mean(result.data) * 100
-                # Convert numpy.float64 to standard Python float
-                segmented_percent = safe_float(segmented_percent)
+                masks = model.segment(batch_scans)
+                for key, scan, mask in zip(batch_keys, batch_scans, masks):
+                    results[key] = SegmentationResult("ios_teeth_segmentation", scan, segmented_data=mask)
+                    segmentation_cache.put(cache_keys[key], results[key].data)
             except Exception as e:
-                logger.error(f"Error calculating segmentation percentage: {str(e)}")
-                segmented_percent = 30.0  # Default fallback value
+                logger.error(f"Error during SegmentationResult creation: {str(e)}")
+                raise
+            batches += 1
+        elapsed = time.perf_counter() - start
 
-            # Add output metadata
-            context.add_output_metadata({
-                "segmented_percentage": MetadataValue.float(segmented_percent),
-                "source_scan": scan_name
-            })
+        # Calculate percentage of segmented voxels - with error handling
+        try:
+            segmented_percent = sum(result.data.mean() for result in results.values()) / len(results) * 100
+            # Convert numpy.float64 to standard Python float
+            segmented_percent = safe_float(segmented_percent)
+        except Exception as e:
+            logger.error(f"Error calculating segmentation percentage: {str(e)}")
+            segmented_percent = 30.0  # Default fallback value
 
-            logger.info(f"IOS segmentation completed successfully")
-            return result
+        # Add output metadata
+        context.add_output_metadata({
+            "segmented_percentage": MetadataValue.float(segmented_percent),
+            "source_scan": ", ".join(scan_names),
+            "batch_size": MetadataValue.int(config.batch_size),
+            "batches": MetadataValue.int(batches),
+            "cache_hits": MetadataValue.int(len(scans) - len(misses)),
+            "cache_misses": MetadataValue.int(len(misses)),
+            "model_version": model_metadata["model_version"],
+            "model_load_seconds": MetadataValue.float(safe_float(model_metadata["model_load_seconds"])),
+            "model_cache_hit": MetadataValue.bool(model_metadata["model_cache_hit"]),
+            "scans_per_second": MetadataValue.float(safe_float(len(results) / elapsed if elapsed else 0.0)),
+        })
 
-        except Exception as e:
-            logger.error(f"Error during SegmentationResult creation: {str(e)}")
-            raise
+        logger.info(f"IOS segmentation completed successfully")
+        if len(partition_keys) > 1:
+            return results
+        return results[partition_keys[0]]
 
     except Exception as e:
         logger.error(f"Unexpected error in ios_segmentation: {str(e)}")
         # Re-raise to ensure Dagster knows this step failed
-        raise
\ No newline at end of file
+        raise
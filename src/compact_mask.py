@@ -0,0 +1,272 @@
+from dagster import (
+    get_dagster_logger,
+)
+from .lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+
+logger = get_dagster_logger()
+
+ENCODINGS = ("packed", "sparse", "rle")
+
+
+class CompactMask:
+    """
+    A boolean volume mask stored in a compact encoding.
+
+    Three encodings are supported, and the smallest one for a given mask
+    is picked at construction time:
+
+    - ``packed``: one bit per voxel (``np.packbits``), best for dense masks
+    - ``sparse``: flat indices of the positive voxels, best for very sparse masks
+    - ``rle``: start/end of each run of positive voxels, best for blob-like masks
+
+    The dense mask is only expanded on demand (``to_dense`` or slicing),
+    while ``count`` and ``mean`` are answered without unpacking anything.
+    """
+    def __init__(self, shape, encoding, arrays, count):
+        """
+        Initialize a compact mask from already encoded arrays.
+
+        Use CompactMask.from_dense to build one from a boolean array.
+
+        Args:
+            shape (tuple): Shape of the dense mask
+            encoding (str): One of "packed", "sparse" or "rle"
+            arrays (dict): Encoded arrays for the chosen encoding
+            count (int): Number of positive voxels
+        """
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown mask encoding {encoding!r}, expected one of {ENCODINGS}")
+        self.shape = tuple(int(dim) for dim in shape)
+        self.encoding = encoding
+        self.arrays = arrays
+        self._count = int(count)
+
+    @classmethod
+    def from_dense(cls, mask, encoding=None):
+        """
+        Encode a dense boolean mask.
+
+        Args:
+            mask (ndarray): Boolean (or 0/1) mask of any shape
+            encoding (str, optional): Force an encoding instead of picking the smallest
+
+        Returns:
+            CompactMask: The encoded mask
+        """
+        mask = np.asarray(mask)
+        flat = mask.astype(bool, copy=False).ravel()
+        count = int(np.count_nonzero(flat))
+        index_dtype = np.uint32 if flat.size < 2 ** 32 else np.int64
+
+        candidates = {}
+        if encoding in (None, "packed"):
+            candidates["packed"] = lambda: {"bits": np.packbits(flat)}
+        if encoding in (None, "sparse"):
+            candidates["sparse"] = lambda: {"indices": np.flatnonzero(flat).astype(index_dtype)}
+        if encoding in (None, "rle"):
+            candidates["rle"] = lambda: _encode_runs(flat, index_dtype)
+
+        if encoding is None:
+            itemsize = np.dtype(index_dtype).itemsize
+            estimated = {
+                "packed": (flat.size + 7) // 8,
+                "sparse": count * itemsize,
+                "rle": _count_runs(flat) * 2 * itemsize,
+            }
+            encoding = min(estimated, key=estimated.get)
+        elif encoding not in candidates:
+            raise ValueError(f"Unknown mask encoding {encoding!r}, expected one of {ENCODINGS}")
+
+        compact = cls(mask.shape, encoding, candidates[encoding](), count)
+        logger.debug(f"Encoded mask {mask.shape} as {compact.encoding} ({compact.nbytes} bytes)")
+        return compact
+
+    @classmethod
+    def from_slabs(cls, shape, slabs, path=None):
+        """
+        Encode a mask produced slab by slab along the first axis.
+
+        Each slab is bit-packed as soon as it arrives, so the dense mask never
+        exists in memory as a whole. Streamed masks always use the ``packed``
+        encoding, since the density is only known once every slab was seen.
+
+        Args:
+            shape (tuple): Shape of the full dense mask
+            slabs (iterable): Boolean arrays that concatenate to ``shape`` along axis 0
+            path (str, optional): .npy file to write the packed bits to
+                incrementally, instead of keeping them in memory
+
+        Returns:
+            CompactMask: The encoded mask
+        """
+        shape = tuple(int(dim) for dim in shape)
+        total = int(np.prod(shape, dtype=np.int64))
+        nbytes = (total + 7) // 8
+        if path is not None:
+            bits = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(nbytes,))
+        else:
+            bits = np.empty(nbytes, dtype=np.uint8)
+
+        position = 0
+        voxels = 0
+        count = 0
+        # Bits of the previous slab that did not fill a whole byte
+        pending = np.zeros(0, dtype=bool)
+        for slab in slabs:
+            flat = np.asarray(slab).astype(bool, copy=False).ravel()
+            voxels += flat.size
+            count += int(np.count_nonzero(flat))
+            if pending.size:
+                flat = np.concatenate((pending, flat))
+            usable = flat.size - flat.size % 8
+            packed = np.packbits(flat[:usable])
+            bits[position:position + packed.size] = packed
+            position += packed.size
+            pending = flat[usable:].copy()
+        if pending.size:
+            bits[position] = np.packbits(pending)[0]
+            position += 1
+
+        if voxels != total:
+            raise ValueError(f"Slabs cover {voxels} voxels, expected {total} for shape {shape}")
+        if path is not None:
+            bits.flush()
+
+        compact = cls(shape, "packed", {"bits": bits}, count)
+        logger.debug(f"Streamed mask {shape} as packed ({compact.nbytes} bytes)")
+        return compact
+
+    @property
+    def size(self):
+        """Number of voxels in the dense mask"""
+        return int(np.prod(self.shape, dtype=np.int64))
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def dtype(self):
+        return np.dtype(bool)
+
+    @property
+    def nbytes(self):
+        """Bytes used by the encoded arrays"""
+        return int(sum(array.nbytes for array in self.arrays.values()))
+
+    def count(self):
+        """Number of positive voxels"""
+        return self._count
+
+    def mean(self, axis=None, **kwargs):
+        """
+        Fraction of positive voxels, as np.mean would return for the dense mask.
+
+        Reductions along an axis (or with extra np.mean arguments) fall back
+        to the dense mask.
+        """
+        if axis is not None or any(value is not None for value in kwargs.values()):
+            return self.to_dense().mean(axis=axis, **kwargs)
+        return self._count / self.size if self.size else 0.0
+
+    def to_dense(self):
+        """
+        Expand the mask into a dense boolean array.
+
+        Returns:
+            ndarray: Boolean array with the original shape
+        """
+        return self._decode_flat(0, self.size).reshape(self.shape)
+
+    def _decode_flat(self, start, stop):
+        """Decode the flat (C-order) voxel range [start, stop)"""
+        length = stop - start
+        if self.encoding == "packed":
+            bits = self.arrays["bits"]
+            first_byte = start // 8
+            last_byte = (stop + 7) // 8
+            unpacked = np.unpackbits(np.asarray(bits[first_byte:last_byte]))
+            offset = start - first_byte * 8
+            return unpacked[offset:offset + length].astype(bool)
+
+        dense = np.zeros(length, dtype=bool)
+        if self.encoding == "sparse":
+            indices = self.arrays["indices"]
+            lo, hi = np.searchsorted(indices, [start, stop])
+            dense[np.asarray(indices[lo:hi], dtype=np.int64) - start] = True
+            return dense
+
+        starts = self.arrays["starts"]
+        ends = self.arrays["ends"]
+        # Runs overlapping the requested range, clipped to it
+        lo = np.searchsorted(ends, start, side="right")
+        hi = np.searchsorted(starts, stop, side="left")
+        run_starts = np.clip(np.asarray(starts[lo:hi], dtype=np.int64), start, stop) - start
+        run_ends = np.clip(np.asarray(ends[lo:hi], dtype=np.int64), start, stop) - start
+        delta = np.zeros(length + 1, dtype=np.int8)
+        np.add.at(delta, run_starts, 1)
+        np.add.at(delta, run_ends, -1)
+        return np.cumsum(delta[:-1], dtype=np.int8).astype(bool)
+
+    def __getitem__(self, key):
+        """
+        Slice the mask, decoding only the planes along the first axis that
+        the key selects.
+        """
+        if not isinstance(key, tuple):
+            key = (key,)
+        first, rest = key[0], key[1:]
+
+        if isinstance(first, (int, np.integer)):
+            index = range(self.shape[0])[first]
+            planes = slice(index, index + 1)
+            squeeze = True
+        elif isinstance(first, slice):
+            planes = first
+            squeeze = False
+        else:
+            # Fancy indexing on the first axis: fall back to the dense mask
+            return self.to_dense()[key]
+
+        start, stop, step = planes.indices(self.shape[0])
+        if step < 0:
+            return self.to_dense()[key]
+        stop = max(stop, start)
+        plane_size = int(np.prod(self.shape[1:], dtype=np.int64))
+        block = self._decode_flat(start * plane_size, stop * plane_size)
+        block = block.reshape((stop - start,) + self.shape[1:])[::step]
+        if squeeze:
+            return block[0][rest] if rest else block[0]
+        return block[(slice(None),) + rest] if rest else block
+
+    def __array__(self, dtype=None):
+        """Allow numpy functions to treat the mask as its dense equivalent"""
+        dense = self.to_dense()
+        return dense if dtype is None else dense.astype(dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        """String representation of the compact mask"""
+        return f"CompactMask(shape={self.shape}, encoding='{self.encoding}', positive={self._count})"
+
+
+def _count_runs(flat):
+    """Number of runs of positive voxels in a flat boolean mask"""
+    if flat.size == 0:
+        return 0
+    rising = np.count_nonzero(flat[1:] & ~flat[:-1])
+    return int(rising + flat[0])
+
+
+def _encode_runs(flat, index_dtype):
+    """Start (inclusive) and end (exclusive) flat indices of every positive run"""
+    padded = np.concatenate(([False], flat, [False]))
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+    return {
+        "starts": changes[0::2].astype(index_dtype),
+        "ends": changes[1::2].astype(index_dtype),
+    }
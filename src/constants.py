@@ -6,14 +6,144 @@ CBCT_TEETH_SEGMENTATION_TIME = 20.0  # Part of the 1-minute process
 CBCT_GUM_DETECTION_TIME = 15.0  # Part of the 1-minute process
 CBCT_NERVE_DETECTION_TIME = 25.0  # Part of the 1-minute process
 ALIGNMENT_TIME = 15.0
-CROWN_DESIGN_TIME = 30.0
+CROWN_DESIGN_TIME = 30.0  # Per crown
+
+# Segmentation constants
+IOS_SEGMENTED_FRACTION = 0.3  # Fraction of voxels the simulated models segment
+CBCT_TEETH_SEGMENTED_FRACTION = 0.3
+CBCT_GUM_SEGMENTED_FRACTION = 0.3
+CBCT_NERVE_SEGMENTED_FRACTION = 0.05  # Only 5% of voxels are nerve tissue
+SEGMENTATION_BATCH_SIZE = 8  # Scans segmented per vectorized model call
+SEGMENTATION_PARTITIONS_PER_RUN = 16  # Patient partitions per backfill run
+
+# Upper and lower jaws are processed concurrently on a thread or process pool
+CBCT_JAWS = ("upper_jaw", "lower_jaw")
+JAW_EXECUTOR = "thread"  # "thread", "process" or "serial"
+JAW_MAX_WORKERS = 2
+# Each jaw is a separate asset; jaws whose data version (derived from the
+# input content) did not change are reported up to date instead of recomputed
+SKIP_UNCHANGED_OUTPUTS = True
+VERSION_HASH_CHUNK_BYTES = 64 * 1024 * 1024  # Voxels hashed at once for a data version
+
+# Crown design: one task per tooth, run concurrently
+CROWN_TOOTH_NUMBERS = (14,)  # FDI numbers of the teeth to design crowns for
+CROWN_EXECUTOR = "thread"  # "thread", "process" or "serial"
+CROWN_MAX_WORKERS = 8
+
+# Slab-wise streaming of CBCT volumes along the first axis
+CBCT_DIMENSIONS = (300, 300, 150)
+STREAMING_ENABLED = False
+STREAMING_SLAB_SIZE = 16  # Planes per slab
+STREAMING_HALO = 2  # Extra planes of context on each side of a slab
+STREAMING_SCRATCH_DIR = "/app/storage/scratch"
+
+# Multi-resolution pyramid of the CBCT volumes, for previews and coarse-to-fine segmentation
+CBCT_PYRAMID_FACTORS = (2, 4)  # Downsampling factors stored alongside each jaw volume
+CBCT_PREVIEW_FACTOR = 4  # Pyramid level segmented by the preview asset
+COARSE_TO_FINE_ENABLED = False
+COARSE_TO_FINE_FACTOR = 4  # Pyramid level of the coarse pass
+COARSE_TO_FINE_MARGIN = 1  # Coarse voxels around the coarse boundary refined at full resolution
+COARSE_CHECK_CELLS = 256  # Coarse voxels sampled and segmented at full resolution to check a coarse pass
+COARSE_CHECK_TOLERANCE = 0.02  # Fraction of sampled voxels the coarse pass may get wrong
+
+# Region-of-interest cropping: gum and nerve detection only run on the
+# padded bounding box of their upstream masks
+ROI_CROPPING_ENABLED = True
+ROI_PADDING_VOXELS = 8  # Default margin around the upstream mask's bounding box
+GUM_ROI_PADDING = 12  # Gums surround the teeth
+NERVE_ROI_PADDING = 24  # The mandibular canal runs below the tooth roots
+
+# IOS to CBCT surface registration (multi-scale ICP)
+ICP_SURFACE_POINTS = 50_000  # Points sampled from each surface
+ICP_SCALES = (1_000, 5_000, 20_000)  # Source points used by each level, coarse to fine
+ICP_MAX_ITERATIONS = 30  # Iterations per level
+ICP_TOLERANCE = 1e-4  # Relative residual change considered converged
+ICP_REJECT_FACTOR = 3.0  # Pairs further than this times the median distance are ignored
+
+# Segmentation models: weights are memory-mapped from
+# MODEL_WEIGHTS_DIR/<name>/<version>.npy and cached per worker process
+MODEL_WEIGHTS_DIR = "/app/models"
+MODEL_SPECS = {
+    "ios_teeth": {"version": "1", "weights_mb": 8, "positive_fraction": IOS_SEGMENTED_FRACTION},
+    "cbct_teeth": {"version": "1", "weights_mb": 32, "positive_fraction": CBCT_TEETH_SEGMENTED_FRACTION},
+    "cbct_gum": {"version": "1", "weights_mb": 16, "positive_fraction": CBCT_GUM_SEGMENTED_FRACTION},
+    "cbct_nerve": {"version": "1", "weights_mb": 16, "positive_fraction": CBCT_NERVE_SEGMENTED_FRACTION},
+}
+
+# Multiplier of all the simulated processing times above (0 disables them)
+SIMULATED_COST_SCALE = 1.0
+
+# Content-addressed cache of segmentation results
+RESULT_CACHE_DIR = "/app/storage/cache"
+RESULT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # Least recently used entries are evicted beyond this
+
+# Voxel storage constants
+CBCT_VOXEL_DTYPE = "int16"  # Hounsfield units fit in 16 bits
+CBCT_HU_RANGE = (-1000.0, 3000.0)
+IOS_VOXEL_DTYPE = "uint16"
+IOS_VOXEL_SCALE = 1.0 / 65535  # Stored as fixed point over [0, 1]
+SCAN_FILL_CHUNK_BYTES = 16 * 1024 * 1024  # Bound on temporaries when filling a volume
+MASK_FILL_CHUNK_BYTES = 16 * 1024 * 1024  # Bound on temporaries when simulating a mask
 
 # Metadata constants
 IOS_FILE_EXTENSION = ".stl"
 CBCT_FILE_EXTENSION = ".dcm"
 OUTPUT_FILE_EXTENSION = ".obj"
 
+# Patient intake: one sub-directory per case, named after the case id
+PATIENT_INTAKE_DIR = "/app/data/patients"
+
+# Synthetic cohorts for load testing (see synthetic_cohort): every case is
+# generated from a stream seeded by the cohort seed and the case id
+SYNTHETIC_COHORT_SEED = 0
+SYNTHETIC_COHORT_WORKERS = 8  # Cases generated in parallel processes
+SYNTHETIC_VOXEL_SPACING_MM = 0.3  # Isotropic CBCT voxel size
+SYNTHETIC_NOISE_HU = 30.0  # Standard deviation of the CBCT noise
+SYNTHETIC_MISSING_TOOTH_PROBABILITY = 0.05
+SYNTHETIC_IOS_TRIANGLES = 100_000  # Approximate triangles of the IOS surface
+
+# IOS mesh loading
+IOS_DIMENSIONS = (200, 200, 100)  # Volume the IOS meshes are voxelized into
+STL_ASCII_CHUNK_BYTES = 64 * 1024 * 1024  # Bytes parsed per chunk of an ASCII STL file
+
+# CBCT DICOM series loading
+DICOM_DECODE_WORKERS = 8  # Concurrent slice header reads / pixel decodes
+DICOM_HASH_CHUNK_BYTES = 1024 * 1024  # Bytes of a slice file hashed at once
+
+# Execution modes: the sensor chain (one run per asset) or a single
+# multiprocess run per case. Runs are tagged with their mode.
+EXECUTION_MODE_TAG = "dental/execution_mode"
+FAST_PATH_MODE = "fast_path"
+SENSOR_CHAIN_MODE = "sensor_chain"
+NEW_CASE_EXECUTION_MODE = FAST_PATH_MODE
+FAST_PATH_MAX_CONCURRENT = 4  # Steps running at once inside a fast path run
+
+# Run admission: jobs are tagged with an estimate of their peak memory and
+# CPUs, and the run coordinator only dequeues runs that fit in its budget
+RUN_MEMORY_TAG = "dental/memory_mb"
+RUN_CPUS_TAG = "dental/cpus"
+RUN_COST_TAG = "dental/run_cost"  # "<memory_mb>mb_<cpus>cpu", the value the coordinator limits
+RUN_BASE_MEMORY_MB = 250  # Interpreter, Dagster and the memory-mapped models of a run process
+RUN_MEMORY_BUDGET_MB = 8192
+RUN_CPU_BUDGET = 8
+RUN_STARVATION_SECONDS = 600  # Queued runs older than this are no longer skipped over
+
 # Group names for organizing assets
 GROUP_INPUT = "input_files"
 GROUP_SEGMENTATION = "segmentation_processes"
-GROUP_OUTPUT = "final_outputs"
\ No newline at end of file
+GROUP_OUTPUT = "final_outputs"
+
+# Storage constants for the volume IO manager
+VOLUME_STORAGE_DIR = "/app/storage/volumes"
+VOLUME_ARRAY_MIN_BYTES = 64 * 1024  # Smaller arrays stay inline in the header
+
+# Per-asset performance metrics, one JSON line per materialized step
+ASSET_METRICS_FILE = "/app/storage/metrics/asset_metrics.jsonl"
+
+# Surface mesh export of the output assets
+MESH_EXPORT_DIR = "/app/storage/exports"
+MESH_EXPORT_FORMATS = ("obj", "ply")
+MESH_TARGET_TRIANGLES = 200_000  # Approximate triangle count after decimation
+MESH_SLAB_VOXELS = 2 * 1024 * 1024  # Mask voxels processed at once during extraction
+MESH_WRITE_CHUNK_ROWS = 1_000_000  # Vertices/faces formatted per write
+MESH_OBJ_DECIMALS = 4  # Decimals of the OBJ vertex coordinates
@@ -1,15 +1,27 @@
-import numpy as np
 from dagster import (
     get_dagster_logger
 )
+from .constants import SCAN_FILL_CHUNK_BYTES
+from .pyramid import block_mean
+from .voxel_grid import DEFAULT_SPACING, DEFAULT_ORIGIN, downsampled_grid
+from .lazy_imports import lazy_import
+
+np = lazy_import("numpy")
 
 logger = get_dagster_logger()
 
 class DentalScan:
     """
     A simple class to simulate dental scan data.
+
+    Voxels are stored in a compact dtype (e.g. int16 Hounsfield units) and
+    mapped to physical values with ``value = stored * scale + offset``,
+    the same convention as the DICOM rescale slope/intercept. Voxel
+    ``(i, j, k)`` sits at ``origin + (i, j, k) * spacing`` (mm).
     """
-    def __init__(self, name, scan_type, dimensions=(100, 100, 100)):
+    def __init__(self, name, scan_type, dimensions=(100, 100, 100), dtype="float64",
+                 scale=1.0, offset=0.0, value_range=(0.0, 1.0), path=None, rng=None,
+                 spacing=DEFAULT_SPACING, origin=DEFAULT_ORIGIN):
         """
         Initialize a dental scan with simulated data.
 
@@ -17,24 +29,213 @@ class DentalScan:
             name (str): The name/identifier of the scan
             scan_type (str): The type of scan (e.g., "IOS", "CBCT")
             dimensions (tuple): 3D dimensions of the scan data
+            dtype: Storage dtype of the voxels (e.g. int16, uint16, float32)
+            scale (float): Multiplier from stored voxel values to physical values
+            offset (float): Offset from stored voxel values to physical values
+            value_range (tuple): Range of the simulated physical values
+            path (str, optional): .npy file backing the voxels. The volume is
+                then written to disk chunk by chunk instead of held in memory.
+            spacing (tuple): Voxel size along each axis (mm)
+            origin (tuple): Position of voxel (0, 0, 0) (mm)
         """
         self.name = name
         self.scan_type = scan_type
         self.dimensions = dimensions
+        self.scale = float(scale)
+        self.offset = float(offset)
+        self.value_range = (float(value_range[0]), float(value_range[1]))
+        self.spacing = tuple(float(value) for value in spacing)
+        self.origin = tuple(float(value) for value in origin)
+        # Downsampled versions of the scan keyed by factor, see pyramid.build_pyramid
+        self.pyramid = {}
 
         # Ensure dimensions is a tuple of 3 integers
         if not (isinstance(dimensions, tuple) and len(dimensions) == 3):
             raise ValueError(f"Dimensions must be a tuple of 3 integers, got {dimensions}")
 
-        # Simulate voxel data with a random array
+        # Simulate voxel data with a random array, filled chunk by chunk
+        rng = np.random.default_rng() if rng is None else rng
         try:
-            self.data = np.random.rand(*dimensions)
-            logger.debug(f"Created random data array with shape {self.data.shape}")
+            if path is not None:
+                self.data = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=dimensions)
+            else:
+                self.data = np.empty(dimensions, dtype=dtype)
+            self._fill_random(rng)
+            logger.debug(f"Created random data array with shape {self.data.shape} and dtype {self.data.dtype}")
         except Exception as e:
             logger.error(f"Error creating random data array: {str(e)}")
             # Create a small default array as fallback
-            self.data = np.random.rand(10, 10, 10)
+            self.data = np.empty((10, 10, 10), dtype=dtype)
+            self._fill_random(rng)
+
+    @classmethod
+    def from_values(cls, name, scan_type, values, dtype="float64",
+                    scale=1.0, offset=0.0, value_range=(0.0, 1.0), spacing=DEFAULT_SPACING, origin=DEFAULT_ORIGIN):
+        """
+        Create a scan from physical voxel values instead of simulated data.
+
+        Args:
+            name (str): The name/identifier of the scan
+            scan_type (str): The type of scan (e.g., "IOS", "CBCT")
+            values (ndarray): 3D array of physical values
+            dtype: Storage dtype of the voxels
+            scale (float): Multiplier from stored voxel values to physical values
+            offset (float): Offset from stored voxel values to physical values
+            value_range (tuple): Range of the physical values
+            spacing (tuple): Voxel size along each axis (mm)
+            origin (tuple): Position of voxel (0, 0, 0) (mm)
+
+        Returns:
+            DentalScan: The scan, with values quantized to ``dtype``
+        """
+        stored = (np.asarray(values, dtype=np.float64) - float(offset)) / float(scale)
+        if np.issubdtype(np.dtype(dtype), np.integer):
+            info = np.iinfo(dtype)
+            stored = np.clip(np.rint(stored), info.min, info.max)
+        return cls.from_stored(name, scan_type, stored.astype(dtype), scale, offset, value_range, spacing, origin)
+
+    @classmethod
+    def from_stored(cls, name, scan_type, data, scale=1.0, offset=0.0, value_range=(0.0, 1.0),
+                    spacing=DEFAULT_SPACING, origin=DEFAULT_ORIGIN):
+        """
+        Create a scan around already stored voxel values (e.g. DICOM pixel data).
+
+        Args:
+            name (str): The name/identifier of the scan
+            scan_type (str): The type of scan (e.g., "IOS", "CBCT")
+            data (ndarray): 3D array of stored values, used without copying
+            scale (float): Multiplier from stored voxel values to physical values
+            offset (float): Offset from stored voxel values to physical values
+            value_range (tuple): Range of the physical values
+            spacing (tuple): Voxel size along each axis (mm)
+            origin (tuple): Position of voxel (0, 0, 0) (mm)
+
+        Returns:
+            DentalScan: The scan
+        """
+        scan = cls.__new__(cls)
+        scan.name = name
+        scan.scan_type = scan_type
+        scan.dimensions = tuple(int(dim) for dim in data.shape)
+        scan.scale = float(scale)
+        scan.offset = float(offset)
+        scan.value_range = (float(value_range[0]), float(value_range[1]))
+        scan.spacing = tuple(float(value) for value in spacing)
+        scan.origin = tuple(float(value) for value in origin)
+        scan.pyramid = {}
+        scan.data = data
+        return scan
+
+    def _fill_random(self, rng):
+        """
+        Fill self.data with uniformly distributed values over value_range.
+
+        The volume is filled a few planes at a time so the temporaries never
+        exceed SCAN_FILL_CHUNK_BYTES, whatever the size of the volume.
+        """
+        plane_bytes = max(1, self.data[0].size * 8)
+        planes_per_chunk = max(1, SCAN_FILL_CHUNK_BYTES // plane_bytes)
+        low, high = self._stored_range()
+        integer = np.issubdtype(self.data.dtype, np.integer)
+
+        for start in range(0, self.data.shape[0], planes_per_chunk):
+            chunk = self.data[start:start + planes_per_chunk]
+            if integer:
+                chunk[...] = rng.integers(low, high, size=chunk.shape, dtype=self.data.dtype, endpoint=True)
+            else:
+                chunk[...] = low + rng.random(chunk.shape) * (high - low)
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+
+    def _stored_range(self):
+        """Stored-value bounds matching value_range, clipped to the dtype"""
+        low, high = ((value - self.offset) / self.scale for value in self.value_range)
+        if np.issubdtype(self.data.dtype, np.integer):
+            info = np.iinfo(self.data.dtype)
+            low = int(np.clip(np.ceil(low), info.min, info.max))
+            high = int(np.clip(np.floor(high), info.min, info.max))
+        return low, high
+
+    @property
+    def nbytes(self):
+        """Memory footprint of the voxel data"""
+        return self.data.nbytes
+
+    def physical(self, dtype="float32", region=None):
+        """
+        Voxel values in physical units (e.g. Hounsfield units).
+
+        Args:
+            dtype: Float dtype of the returned array
+            region (optional): Index/slices selecting part of the volume
+
+        Returns:
+            ndarray: stored * scale + offset, as a new array
+        """
+        return self._to_physical(self.data if region is None else self.data[region], dtype)
+
+    def _to_physical(self, stored, dtype):
+        cast = np.dtype(dtype).type
+        values = np.asarray(stored).astype(dtype)
+        if self.scale != 1.0:
+            values *= cast(self.scale)
+        if self.offset != 0.0:
+            values += cast(self.offset)
+        return values
+
+    def normalized(self, dtype="float32", region=None):
+        """
+        Voxel values mapped from value_range to [0, 1].
+
+        Args:
+            dtype: Float dtype of the returned array
+            region (optional): Index/slices selecting part of the volume
+
+        Returns:
+            ndarray: Normalized values, as a new array
+        """
+        return self.normalize(self.data if region is None else self.data[region], dtype)
+
+    def normalize(self, stored, dtype="float32"):
+        """
+        Map stored voxel values (e.g. voxels gathered from the volume) to [0, 1].
+
+        Args:
+            stored (ndarray): Values in the scan's storage scale
+            dtype: Float dtype of the returned array
+
+        Returns:
+            ndarray: Normalized values, as a new array
+        """
+        cast = np.dtype(dtype).type
+        low, high = self.value_range
+        values = self._to_physical(stored, dtype)
+        values -= cast(low)
+        values *= cast(1.0 / (high - low))
+        return values
+
+    def level(self, factor):
+        """
+        The scan downsampled by ``factor``.
+
+        Levels stored in the pyramid are returned as they are; other factors
+        are computed on the fly.
+
+        Args:
+            factor (int): Downsampling factor, 1 for the scan itself
+
+        Returns:
+            DentalScan: The downsampled scan
+        """
+        if factor <= 1:
+            return self
+        levels = getattr(self, "pyramid", None) or {}
+        if factor in levels:
+            return levels[factor]
+        logger.debug(f"No {factor}x level stored for {self.name}, downsampling on the fly")
+        return DentalScan.from_stored(f"{self.name}_x{factor}", self.scan_type, block_mean(self.data, factor),
+                                      self.scale, self.offset, self.value_range, *downsampled_grid(self, factor))
 
     def __repr__(self):
         """String representation of the dental scan"""
-        return f"DentalScan(name='{self.name}', type='{self.scan_type}', dims={self.dimensions})"
\ No newline at end of file
+        return f"DentalScan(name='{self.name}', type='{self.scan_type}', dims={self.dimensions})"
@@ -0,0 +1,345 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dagster import (
+    get_dagster_logger,
+)
+from .constants import CBCT_FILE_EXTENSION, DICOM_DECODE_WORKERS, DICOM_HASH_CHUNK_BYTES
+from .lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+
+logger = get_dagster_logger()
+
+# Header tags needed to index a series, read without touching pixel data
+HEADER_TAGS = [
+    "SeriesInstanceUID",
+    "InstanceNumber",
+    "ImagePositionPatient",
+    "PixelSpacing",
+    "SliceThickness",
+    "Rows",
+    "Columns",
+    "RescaleSlope",
+    "RescaleIntercept",
+]
+
+
+def _pydicom():
+    """Import pydicom, which is only needed when DICOM series are read or written"""
+    try:
+        import pydicom
+    except ImportError as e:
+        raise ImportError(
+            "Reading or writing DICOM series requires pydicom (pip install 'dental_ml_poc[dicom]')"
+        ) from e
+    return pydicom
+
+
+def find_series_files(directory):
+    """DICOM files under a directory (any extension case), in a stable order"""
+    files = []
+    for root, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            if file_name.lower().endswith(CBCT_FILE_EXTENSION):
+                files.append(os.path.join(root, file_name))
+    return sorted(files)
+
+
+class DicomSeries:
+    """
+    A CBCT series indexed from its slice headers.
+
+    Only the headers are read when the series is indexed; pixel data is
+    decoded slice by slice when a range of slices is requested. Slices are
+    ordered by their position along the patient axis, so the volume's
+    first axis goes from inferior to superior.
+    """
+    def __init__(self, files, positions, rows, columns, pixel_spacing, slopes, intercepts):
+        """
+        Initialize a series from already indexed headers.
+
+        Use DicomSeries.index to build one from a directory.
+
+        Args:
+            files (list): Slice file paths, sorted by position
+            positions (ndarray): Position of each slice along the patient axis (mm)
+            rows (int): Pixel rows per slice
+            columns (int): Pixel columns per slice
+            pixel_spacing (tuple): In-plane (row, column) spacing (mm)
+            slopes (ndarray): Rescale slope of each slice
+            intercepts (ndarray): Rescale intercept of each slice
+        """
+        self.files = list(files)
+        self.positions = np.asarray(positions, dtype=np.float64)
+        self.rows = int(rows)
+        self.columns = int(columns)
+        self.pixel_spacing = tuple(float(value) for value in pixel_spacing)
+        self.slopes = np.asarray(slopes, dtype=np.float64)
+        self.intercepts = np.asarray(intercepts, dtype=np.float64)
+
+    @classmethod
+    def index(cls, directory, workers=DICOM_DECODE_WORKERS):
+        """
+        Index the DICOM series in a directory from the slice headers.
+
+        Headers are read concurrently with ``stop_before_pixels``, so no
+        pixel data is loaded.
+
+        Args:
+            directory (str): Directory holding the slice files
+            workers (int): Concurrent header reads
+
+        Returns:
+            DicomSeries: The series, or None if the directory holds no slices
+        """
+        files = find_series_files(directory)
+        if not files:
+            return None
+        pydicom = _pydicom()
+
+        def read_header(path):
+            return pydicom.dcmread(path, stop_before_pixels=True, specific_tags=HEADER_TAGS)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            headers = list(pool.map(read_header, files))
+
+        series_ids = {getattr(header, "SeriesInstanceUID", None) for header in headers}
+        if len(series_ids) > 1:
+            logger.warning(f"{directory} holds {len(series_ids)} series, loading them as one volume")
+
+        positions = np.array([_slice_position(header, index) for index, header in enumerate(headers)])
+        order = np.argsort(positions, kind="stable")
+        first = headers[order[0]]
+        series = cls(
+            [files[index] for index in order],
+            positions[order],
+            first.Rows,
+            first.Columns,
+            getattr(first, "PixelSpacing", (1.0, 1.0)),
+            [float(getattr(headers[index], "RescaleSlope", 1.0)) for index in order],
+            [float(getattr(headers[index], "RescaleIntercept", 0.0)) for index in order],
+        )
+        logger.debug(f"Indexed DICOM series in {directory}: {series}")
+        return series
+
+    @property
+    def shape(self):
+        """(slices, rows, columns) of the full volume"""
+        return (len(self.files), self.rows, self.columns)
+
+    @property
+    def slice_spacing(self):
+        """Median distance between consecutive slices (mm)"""
+        if len(self.positions) < 2:
+            return 1.0
+        return float(np.median(np.diff(self.positions)))
+
+    @property
+    def rescale(self):
+        """(slope, intercept) shared by the whole volume, from the first slice"""
+        return float(self.slopes[0]), float(self.intercepts[0])
+
+    def grid(self, slices=slice(None)):
+        """
+        Voxel grid of the volume decoded from a range of slices.
+
+        Args:
+            slices (slice): Range of slices
+
+        Returns:
+            tuple: (spacing, origin) in mm, the origin being the position of
+                the range's first slice along the patient axis
+        """
+        indices = range(len(self.files))[slices]
+        first = float(self.positions[indices[0]]) if len(indices) else 0.0
+        return (self.slice_spacing,) + self.pixel_spacing, (first, 0.0, 0.0)
+
+    def jaw_slices(self):
+        """
+        Slice range of each jaw.
+
+        The lower half of the series (inferior) is the lower jaw and the
+        upper half the upper jaw.
+
+        Returns:
+            dict: slice objects keyed by jaw name
+        """
+        middle = len(self.files) // 2
+        return {"lower_jaw": slice(0, middle), "upper_jaw": slice(middle, len(self.files))}
+
+    def read(self, slices=slice(None), out=None, workers=DICOM_DECODE_WORKERS):
+        """
+        Decode a range of slices into an int16 volume.
+
+        Slices are decoded concurrently, each straight into its plane of the
+        preallocated output. Slices whose rescale parameters differ from the
+        series-wide ones are converted to the common scale. Values outside
+        the range of the output dtype (e.g. unsigned pixels above 32767) are
+        clipped, with a warning.
+
+        Args:
+            slices (slice): Range of slices to decode
+            out (ndarray, optional): Preallocated int16 array to decode into,
+                e.g. a memmap when streaming to disk
+            workers (int): Concurrent slice decodes
+
+        Returns:
+            ndarray: Array of shape (n_slices, rows, columns)
+        """
+        pydicom = _pydicom()
+        indices = range(len(self.files))[slices]
+        if out is None:
+            out = np.empty((len(indices), self.rows, self.columns), dtype=np.int16)
+        slope, intercept = self.rescale
+
+        def decode(plane, index):
+            pixels = pydicom.dcmread(self.files[index]).pixel_array
+            if self.slopes[index] != slope or self.intercepts[index] != intercept:
+                values = pixels * self.slopes[index] + self.intercepts[index]
+                pixels = np.rint((values - intercept) / slope)
+            if pixels.dtype != out.dtype and pixels.size:
+                # uint16 pixels and rescaled values may not fit: clip instead of wrapping around
+                info = np.iinfo(out.dtype)
+                low, high = pixels.min(), pixels.max()
+                if low < info.min or high > info.max:
+                    logger.warning(f"{self.files[index]} holds values {low:g} to {high:g} outside the {out.dtype} "
+                                   f"range, clipping them")
+                    pixels = np.clip(pixels.astype(np.float64), info.min, info.max)
+            out[plane] = pixels
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            # Consume the iterator so decoding errors are raised here
+            list(pool.map(decode, range(len(indices)), indices))
+        return out
+
+    def fingerprint(self, slices=slice(None), workers=DICOM_DECODE_WORKERS):
+        """
+        Content hash of a range of slices, without decoding them.
+
+        The raw slice files are hashed concurrently, along with the
+        series-wide rescale parameters the decoded volume is expressed in,
+        so a range whose files did not change keeps its fingerprint.
+
+        Args:
+            slices (slice): Range of slices to hash
+            workers (int): Concurrent file reads
+
+        Returns:
+            str: Hex digest
+        """
+        indices = range(len(self.files))[slices]
+
+        def digest(index):
+            file_hash = hashlib.blake2b(digest_size=16)
+            with open(self.files[index], "rb") as slice_file:
+                for chunk in iter(lambda: slice_file.read(DICOM_HASH_CHUNK_BYTES), b""):
+                    file_hash.update(chunk)
+            return file_hash.digest()
+
+        fingerprint = hashlib.blake2b(digest_size=16)
+        fingerprint.update(repr((self.rows, self.columns, self.pixel_spacing, self.rescale)).encode())
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for file_digest in pool.map(digest, indices):
+                fingerprint.update(file_digest)
+        return fingerprint.hexdigest()
+
+    def __repr__(self):
+        """String representation of the series"""
+        return f"DicomSeries(slices={len(self.files)}, shape={self.shape}, spacing={self.slice_spacing:.3f}mm)"
+
+
+def _decimals(*values):
+    """Decimal string (DS) values, at most 16 characters per number"""
+    strings = [format(float(value), ".10g") for value in values]
+    return strings if len(strings) > 1 else strings[0]
+
+
+def _write_dataset(pydicom, path, dataset):
+    """Write a dataset as a DICOM file with its preamble and file meta information"""
+    if int(pydicom.__version__.split(".")[0]) >= 3:
+        pydicom.dcmwrite(path, dataset, enforce_file_format=True)
+    else:
+        # pydicom 2 takes the encoding from the dataset rather than the transfer syntax
+        dataset.is_little_endian = True
+        dataset.is_implicit_VR = False
+        pydicom.dcmwrite(path, dataset, write_like_original=False)
+
+
+def write_series(directory, volume, spacing=(1.0, 1.0, 1.0), slope=1.0, intercept=0.0,
+                 patient_id="", first_index=0, series_uid=None):
+    """
+    Write an int16 volume as a CT series, one DICOM file per slice.
+
+    The first axis of the volume goes from inferior to superior, as read
+    back by DicomSeries. Slices are named after their index, so a volume
+    can be written in several calls (``first_index``) sharing a
+    ``series_uid``; slice instance UIDs are derived from it. The
+    attributes shared by all slices are set once, and only the instance
+    attributes and pixel data change from one slice to the next.
+
+    Args:
+        directory (str): Directory the slice files are written to
+        volume (ndarray): (slices, rows, columns) stored pixel values
+        spacing (tuple): (slice, row, column) spacing (mm)
+        slope (float): Rescale slope from stored values to Hounsfield units
+        intercept (float): Rescale intercept
+        patient_id (str): PatientID of the series
+        first_index (int): Index of the first slice within the series
+        series_uid (str, optional): SeriesInstanceUID, generated by default
+
+    Returns:
+        str: The SeriesInstanceUID
+    """
+    pydicom = _pydicom()
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import CTImageStorage, ExplicitVRLittleEndian, generate_uid
+
+    volume = np.asarray(volume)
+    series_uid = series_uid or generate_uid(prefix=None)
+    os.makedirs(directory, exist_ok=True)
+
+    dataset = Dataset()
+    dataset.file_meta = FileMetaDataset()
+    dataset.file_meta.MediaStorageSOPClassUID = CTImageStorage
+    dataset.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    dataset.preamble = b"\0" * 128
+    dataset.SOPClassUID = CTImageStorage
+    dataset.Modality = "CT"
+    dataset.PatientID = patient_id
+    dataset.SliceThickness = _decimals(spacing[0])
+    dataset.StudyInstanceUID = series_uid
+    dataset.SeriesInstanceUID = series_uid
+    dataset.ImageOrientationPatient = _decimals(1, 0, 0, 0, 1, 0)
+    dataset.FrameOfReferenceUID = series_uid
+    dataset.SamplesPerPixel = 1
+    dataset.PhotometricInterpretation = "MONOCHROME2"
+    dataset.Rows = int(volume.shape[1])
+    dataset.Columns = int(volume.shape[2])
+    dataset.PixelSpacing = _decimals(spacing[1], spacing[2])
+    dataset.BitsAllocated = 16
+    dataset.BitsStored = 16
+    dataset.HighBit = 15
+    dataset.PixelRepresentation = 1  # Signed pixels
+    dataset.RescaleIntercept = _decimals(intercept)
+    dataset.RescaleSlope = _decimals(slope)
+
+    for plane, pixels in enumerate(volume):
+        index = first_index + plane
+        instance_uid = f"{series_uid}.{index + 1}"
+        dataset.file_meta.MediaStorageSOPInstanceUID = instance_uid
+        dataset.SOPInstanceUID = instance_uid
+        dataset.InstanceNumber = index + 1
+        dataset.ImagePositionPatient = _decimals(0, 0, index * float(spacing[0]))
+        dataset.PixelData = pixels.astype("<i2").tobytes()
+        _write_dataset(pydicom, os.path.join(directory, f"slice_{index:05d}{CBCT_FILE_EXTENSION}"), dataset)
+    logger.debug(f"Wrote {len(volume)} slices of series {series_uid} to {directory}")
+    return series_uid
+
+
+def _slice_position(header, index):
+    """Position of a slice along the patient axis, falling back to its instance number"""
+    position = getattr(header, "ImagePositionPatient", None)
+    if position is not None and len(position) == 3:
+        return float(position[2])
+    return float(getattr(header, "InstanceNumber", index))
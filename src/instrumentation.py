@@ -0,0 +1,169 @@
+import functools
+import inspect
+import json
+import os
+import resource
+import threading
+import time
+from dagster import (
+    MetadataValue,
+    Output,
+    get_dagster_logger,
+)
+from .safe_data import safe_float
+
+logger = get_dagster_logger()
+
+# Metrics of the steps running in this process, keyed by (run_id, step_key).
+# Inputs are loaded, the asset computed and its output stored in the same
+# process, so the IO manager and the asset wrapper meet here.
+_STEP_METRICS = {}
+_STEP_METRICS_LOCK = threading.Lock()
+
+
+def _peak_rss_mb():
+    """Peak resident set size of this process (ru_maxrss is in KB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _step_id(step_context):
+    return step_context.run_id, step_context.step.key
+
+
+def record_input_load(step_context, seconds, nbytes):
+    """Add the time and bytes spent loading one input of a step"""
+    with _STEP_METRICS_LOCK:
+        metrics = _STEP_METRICS.setdefault(_step_id(step_context), {})
+        metrics["input_seconds"] = metrics.get("input_seconds", 0.0) + seconds
+        metrics["input_mb"] = metrics.get("input_mb", 0.0) + nbytes / 1024 / 1024
+
+
+def pop_step_metrics(step_context):
+    """Remove and return the metrics collected for a step so far"""
+    with _STEP_METRICS_LOCK:
+        return _STEP_METRICS.pop(_step_id(step_context), {})
+
+
+def _update_step_metrics(step_context, values):
+    with _STEP_METRICS_LOCK:
+        _STEP_METRICS.setdefault(_step_id(step_context), {}).update(values)
+
+
+def array_summary(value, prefix="", depth=3):
+    """
+    Shapes and dtypes of the arrays in an asset output.
+
+    Args:
+        value: Asset output (DentalScan, SegmentationResult, dicts of them, ...)
+        prefix (str): Path of ``value`` in the output
+        depth (int): How deep to look into dicts and attributes
+
+    Returns:
+        dict: "shape dtype" strings keyed by path, e.g. "upper_jaw.data"
+    """
+    if depth < 0:
+        return {}
+    if isinstance(value, dict):
+        summary = {}
+        for key, item in value.items():
+            summary.update(array_summary(item, f"{prefix}{key}.", depth - 1))
+        return summary
+    data = getattr(value, "data", None)
+    if data is not None and hasattr(data, "shape") and hasattr(data, "dtype"):
+        return {f"{prefix}data": f"{tuple(int(dim) for dim in data.shape)} {data.dtype}"}
+    return {}
+
+
+def instrumented(fn):
+    """
+    Record performance metrics of an asset's compute function.
+
+    Apply it below ``@asset`` or ``@multi_asset``. Wall time, CPU time,
+    peak RSS and the arrays of the output are added as output metadata,
+    along with the input load time measured by the VolumeIOManager. The IO
+    manager later adds the serialization size and time, and exports the
+    whole record. Multi-assets yield their Outputs and each is passed on as
+    soon as it is produced, measured from the previous one: work shared by
+    the outputs before the first one (loading the model and the inputs)
+    counts towards the first output, and the time the IO manager spends
+    storing an output counts towards none.
+    """
+    def start():
+        return {"rss": _peak_rss_mb(), "cpu": time.process_time(), "wall": time.perf_counter()}
+
+    def measure(step_context, started):
+        """Metrics of the compute since ``started``, with the inputs loaded meanwhile"""
+        wall_seconds = time.perf_counter() - started["wall"]
+        cpu_seconds = time.process_time() - started["cpu"]
+        peak_rss = _peak_rss_mb()
+        inputs = pop_step_metrics(step_context)
+        return {
+            "wall_seconds": wall_seconds,
+            "cpu_seconds": cpu_seconds,
+            "peak_rss_mb": peak_rss,
+            "peak_rss_delta_mb": peak_rss - started["rss"],
+            "input_seconds": inputs.get("input_seconds", 0.0),
+            "input_mb": inputs.get("input_mb", 0.0),
+        }
+
+    def record(step_context, metrics, arrays):
+        """Keep the metrics of an output for the IO manager, and return them as output metadata"""
+        # Recorded before the output reaches the IO manager
+        _update_step_metrics(step_context, {**metrics, "arrays": arrays})
+        return {
+            "compute_seconds": MetadataValue.float(safe_float(metrics["wall_seconds"])),
+            "cpu_seconds": MetadataValue.float(safe_float(metrics["cpu_seconds"])),
+            "peak_rss_mb": MetadataValue.float(safe_float(metrics["peak_rss_mb"])),
+            "peak_rss_delta_mb": MetadataValue.float(safe_float(metrics["peak_rss_delta_mb"])),
+            "input_seconds": MetadataValue.float(safe_float(metrics["input_seconds"])),
+            "input_mb": MetadataValue.float(safe_float(metrics["input_mb"])),
+            "arrays": MetadataValue.json(arrays),
+        }
+
+    def context_of(args, kwargs):
+        return kwargs.get("context", args[0] if args else None)
+
+    if inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def generator_wrapper(*args, **kwargs):
+            step_context = context_of(args, kwargs).get_step_execution_context()
+            started = start()
+            try:
+                for output in fn(*args, **kwargs):
+                    if isinstance(output, Output):
+                        metadata = record(step_context, measure(step_context, started), array_summary(output.value))
+                        output = output.with_metadata({**output.metadata, **metadata})
+                    yield output
+                    started = start()
+            finally:
+                # Drop what no output took, e.g. inputs loaded before the step failed
+                pop_step_metrics(step_context)
+
+        return generator_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        context = context_of(args, kwargs)
+        step_context = context.get_step_execution_context()
+        started = start()
+        output = fn(*args, **kwargs)
+        arrays = array_summary(output.value if isinstance(output, Output) else output)
+        context.add_output_metadata(record(step_context, measure(step_context, started), arrays))
+        return output
+
+    return wrapper
+
+
+def export_step_metrics(path, record):
+    """
+    Append one step's metrics to a JSONL file for trend dashboards.
+
+    Args:
+        path (str): Metrics file, created if needed
+        record (dict): JSON-serializable metrics
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    line = json.dumps(record, sort_keys=True, default=str) + "\n"
+    # A single append of a whole line, so concurrent steps do not interleave
+    with open(path, "a") as metrics_file:
+        metrics_file.write(line)
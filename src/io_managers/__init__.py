@@ -0,0 +1 @@
+from .volume_io_manager import *
@@ -0,0 +1,427 @@
+import hashlib
+import io
+import json
+import os
+import pickle
+import shutil
+import time
+import uuid
+from dagster import (
+    ConfigurableIOManager,
+    InputContext,
+    OutputContext,
+    MetadataValue,
+    get_dagster_logger,
+)
+from ..constants import VOLUME_STORAGE_DIR, VOLUME_ARRAY_MIN_BYTES, ASSET_METRICS_FILE
+from ..safe_data import safe_float
+from ..asset_reference import AssetReference
+from ..slabs import SCRATCH_SUFFIX
+from ..instrumentation import record_input_load, pop_step_metrics, export_step_metrics
+from ..jaw_assets import UpToDate
+from ..lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+
+logger = get_dagster_logger()
+
+HEADER_FILE = "object.pkl"
+MANIFEST_FILE = "manifest.json"
+ARRAYS_DIR = "arrays"
+
+
+class _VolumePickler(pickle.Pickler):
+    """
+    Pickler that writes large numpy arrays to standalone .npy files.
+
+    Every array at or above ``min_array_bytes`` is replaced in the pickle
+    stream by a persistent id pointing at its .npy file, so the header only
+    holds the object structure (names, dimensions, small arrays).
+    """
+    def __init__(self, file, arrays_dir, min_array_bytes):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.arrays_dir = arrays_dir
+        self.min_array_bytes = min_array_bytes
+        self.written = {}
+        self.bytes_written = 0
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, np.ndarray) or obj.dtype.hasobject:
+            return None
+        if obj.nbytes < self.min_array_bytes:
+            return None
+
+        # The same array referenced twice is only stored once
+        array_id = id(obj)
+        if array_id not in self.written:
+            file_name = f"{len(self.written)}.npy"
+            # Arrays mapped from the store keep their digest, without being read
+            digest = _stored_digest(obj)
+            if digest is None:
+                digest = hashlib.blake2b(np.ascontiguousarray(obj).data, digest_size=16).hexdigest()
+            _store_array(obj, os.path.join(self.arrays_dir, file_name))
+            self.written[array_id] = (file_name, obj, digest)
+            self.bytes_written += obj.nbytes
+        return ("ndarray", self.written[array_id][0])
+
+
+def _npy_file_of(array):
+    """The .npy file an array maps as a whole, or None if it is not such a memmap"""
+    filename = getattr(array, "filename", None)
+    if not isinstance(array, np.memmap) or not filename or not os.path.exists(filename):
+        return None
+    if not array.flags.c_contiguous:
+        return None
+    try:
+        stored = np.load(filename, mmap_mode="r")
+    except (ValueError, OSError):
+        return None
+    if stored.shape != array.shape or stored.dtype != array.dtype or stored.offset != array.offset:
+        return None
+    return filename
+
+
+def _stored_digest(array):
+    """
+    Digest of an array mapping a whole stored .npy file read-only, from the
+    manifest written along with it; None for any other array.
+    """
+    source = _npy_file_of(array)
+    if source is None or array.mode != "r" or os.path.basename(os.path.dirname(source)) != ARRAYS_DIR:
+        return None
+    try:
+        with open(os.path.join(os.path.dirname(os.path.dirname(source)), MANIFEST_FILE)) as manifest_file:
+            return json.load(manifest_file).get(os.path.basename(source))
+    except (OSError, ValueError):
+        return None
+
+
+def _store_array(array, path):
+    """
+    Write an array to a .npy file.
+
+    Arrays that already map a whole .npy file (volumes streamed to scratch
+    files, or arrays loaded from the store) are hard-linked rather than
+    copied through memory. Scratch files are moved into the store.
+    """
+    source = _npy_file_of(array)
+    if source is None:
+        np.save(path, array, allow_pickle=False)
+        return
+    if array.mode != "r":
+        array.flush()
+    try:
+        os.link(source, path)
+    except OSError:
+        shutil.copyfile(source, path)
+    if source.endswith(SCRATCH_SUFFIX):
+        os.unlink(source)
+
+
+class _VolumeUnpickler(pickle.Unpickler):
+    """
+    Unpickler that maps the .npy files written by _VolumePickler back as
+    read-only np.memmap arrays, so only the pages actually touched are read.
+    """
+    def __init__(self, file, arrays_dir):
+        super().__init__(file)
+        self.arrays_dir = arrays_dir
+        self.arrays_loaded = 0
+
+    def persistent_load(self, pid):
+        kind, file_name = pid
+        if kind != "ndarray":
+            raise pickle.UnpicklingError(f"Unsupported persistent id: {pid}")
+        self.arrays_loaded += 1
+        return np.load(os.path.join(self.arrays_dir, file_name), mmap_mode="r")
+
+
+def write_volume_object(path, obj, min_array_bytes=VOLUME_ARRAY_MIN_BYTES):
+    """
+    Persist an object graph with its large arrays stored as raw .npy blobs.
+
+    The new version is written to a temporary directory and swapped in, so
+    readers that still hold memory maps of the previous version keep
+    working until they drop them.
+
+    Args:
+        path (str): Directory that will hold the header and the arrays
+        obj: Object to persist (DentalScan, SegmentationResult, dicts, ...)
+        min_array_bytes (int): Arrays smaller than this stay inline
+
+    Returns:
+        dict: Statistics about the written data
+    """
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+    os.makedirs(os.path.join(tmp_path, ARRAYS_DIR))
+
+    with open(os.path.join(tmp_path, HEADER_FILE), "wb") as header_file:
+        pickler = _VolumePickler(header_file, os.path.join(tmp_path, ARRAYS_DIR), min_array_bytes)
+        pickler.dump(obj)
+        header_bytes = header_file.tell()
+
+    manifest = {file_name: digest for file_name, _, digest in pickler.written.values()}
+    with open(os.path.join(tmp_path, MANIFEST_FILE), "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+
+    old_path = None
+    if os.path.exists(path):
+        old_path = f"{path}.old-{uuid.uuid4().hex}"
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    if old_path is not None:
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    return {
+        "arrays": len(pickler.written),
+        "array_bytes": pickler.bytes_written,
+        "header_bytes": header_bytes,
+    }
+
+
+def read_volume_object(path):
+    """
+    Load an object graph written by write_volume_object.
+
+    Large arrays come back as read-only np.memmap instances.
+
+    Args:
+        path (str): Directory holding the header and the arrays
+
+    Returns:
+        The persisted object
+    """
+    with open(os.path.join(path, HEADER_FILE), "rb") as header_file:
+        header = io.BytesIO(header_file.read())
+    return _VolumeUnpickler(header, os.path.join(path, ARRAYS_DIR)).load()
+
+
+def stored_bytes(path):
+    """Bytes on disk of an object written by write_volume_object"""
+    total = os.path.getsize(os.path.join(path, HEADER_FILE))
+    with os.scandir(os.path.join(path, ARRAYS_DIR)) as entries:
+        total += sum(entry.stat().st_size for entry in entries)
+    return total
+
+
+def _backing_arrays(obj, depth=4):
+    """
+    Collect the arrays held by an object, its attributes and their dicts/lists.
+
+    Returns:
+        tuple: (names of the memory-mapped .npy files, arrays stored inline)
+    """
+    if isinstance(obj, np.memmap):
+        return ({os.path.basename(obj.filename)} if obj.filename else set()), []
+    if isinstance(obj, np.ndarray):
+        return set(), [obj]
+    if depth == 0 or isinstance(obj, AssetReference):
+        return set(), []
+    if isinstance(obj, dict):
+        values = obj.values()
+    elif isinstance(obj, (list, tuple)):
+        values = obj
+    elif hasattr(obj, "__dict__"):
+        values = vars(obj).values()
+    else:
+        return set(), []
+    files, inline = set(), []
+    for value in values:
+        value_files, value_inline = _backing_arrays(value, depth - 1)
+        files |= value_files
+        inline.extend(value_inline)
+    return files, inline
+
+
+def content_hash_of(obj, path):
+    """
+    Hash of the arrays backing an object loaded from ``path``.
+
+    Stored arrays contribute the digests recorded in the manifest at write
+    time, so none of their data has to be read. Arrays small enough to stay
+    inline in the header are hashed directly.
+
+    Args:
+        obj: Object returned by read_volume_object (or one of its parts)
+        path (str): Directory the object was loaded from
+
+    Returns:
+        str: Hex digest, or None if the object holds no arrays
+    """
+    files, inline = _backing_arrays(obj)
+    if not files and not inline:
+        return None
+    combined = hashlib.blake2b(digest_size=16)
+    if files:
+        with open(os.path.join(path, MANIFEST_FILE)) as manifest_file:
+            manifest = json.load(manifest_file)
+        for file_name in sorted(files):
+            combined.update(manifest[file_name].encode())
+    # Inline arrays are walked in attribute order, which the pickle preserves
+    for array in inline:
+        combined.update(repr((array.shape, str(array.dtype))).encode())
+        combined.update(np.ascontiguousarray(array).data)
+    return combined.hexdigest()
+
+
+def _attach_references(value, asset_key, partition_key, path, selector=()):
+    """Tag every stored object in an asset output with its AssetReference."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _attach_references(item, asset_key, partition_key, path, selector + (key,))
+    elif hasattr(value, "data"):
+        value.asset_ref = AssetReference(
+            asset_key,
+            partition_key,
+            path,
+            selector=selector,
+            content_hash=content_hash_of(value, path),
+        )
+
+
+class VolumeIOManager(ConfigurableIOManager):
+    """
+    IO manager for DentalScan / SegmentationResult outputs.
+
+    Large arrays are written as raw .npy files next to a small pickled
+    header, and handed to downstream assets as memory-mapped arrays
+    instead of being unpickled into fresh heap memory.
+
+    The time spent loading inputs and writing outputs is added to the
+    metrics of instrumented assets, and each step's metrics are appended
+    to ``metrics_file`` (empty to disable the export). Outputs reported
+    UpToDate keep the stored value.
+    """
+    base_dir: str = VOLUME_STORAGE_DIR
+    min_array_bytes: int = VOLUME_ARRAY_MIN_BYTES
+    metrics_file: str = ASSET_METRICS_FILE
+
+    def _get_path(self, asset_key, partition_key=None) -> str:
+        path = os.path.join(self.base_dir, *asset_key.path)
+        if partition_key is not None:
+            path = os.path.join(path, partition_key)
+        return path
+
+    def _partition_keys(self, context):
+        """Partitions handled by this output/input; [None] when unpartitioned"""
+        if not context.has_asset_partitions:
+            return [None]
+        return list(context.asset_partition_keys)
+
+    def handle_output(self, context: OutputContext, obj):
+        partition_keys = self._partition_keys(context)
+        if isinstance(obj, UpToDate):
+            self._keep_stored(context, partition_keys)
+            return
+        if len(partition_keys) > 1:
+            # Runs over several partitions return one object per partition
+            if not isinstance(obj, dict) or set(obj) != set(partition_keys):
+                raise ValueError(
+                    f"Expected a dict keyed by partitions {partition_keys} for "
+                    f"{context.asset_key.to_user_string()}, got {type(obj)}"
+                )
+            objects = obj
+        else:
+            objects = {partition_keys[0]: obj}
+
+        totals = {"arrays": 0, "array_bytes": 0, "header_bytes": 0}
+        start = time.perf_counter()
+        for partition_key, value in objects.items():
+            path = self._get_path(context.asset_key, partition_key)
+            stats = write_volume_object(path, value, self.min_array_bytes)
+            logger.debug(f"Stored {context.asset_key.to_user_string()} at {path}: {stats}")
+            for key in totals:
+                totals[key] += stats[key]
+        elapsed = time.perf_counter() - start
+
+        path = self._get_path(context.asset_key, partition_keys[0] if len(partition_keys) == 1 else None)
+        context.add_output_metadata({
+            "path": MetadataValue.path(path),
+            "stored_arrays": MetadataValue.int(totals["arrays"]),
+            "stored_mb": MetadataValue.float(safe_float(totals["array_bytes"] / 1024 / 1024)),
+            "header_kb": MetadataValue.float(safe_float(totals["header_bytes"] / 1024)),
+            "write_seconds": MetadataValue.float(safe_float(elapsed)),
+        })
+        self._export_metrics(context, partition_keys, totals, elapsed)
+
+    def _keep_stored(self, context, partition_keys):
+        """Keep the stored value of an output reported up to date"""
+        path = self._get_path(context.asset_key, partition_keys[0] if len(partition_keys) == 1 else None)
+        if len(partition_keys) != 1 or not os.path.exists(os.path.join(path, HEADER_FILE)):
+            raise ValueError(
+                f"{context.asset_key.to_user_string()} was reported up to date but has no stored value at "
+                f"{path}; rematerialize it with skip_unchanged disabled"
+            )
+        logger.debug(f"Keeping {context.asset_key.to_user_string()} stored at {path}")
+        context.add_output_metadata({
+            "path": MetadataValue.path(path),
+            "stored_mb": MetadataValue.float(safe_float(stored_bytes(path) / 1024 / 1024)),
+        })
+        self._export_metrics(context, partition_keys, {"arrays": 0, "array_bytes": 0, "header_bytes": 0}, 0.0)
+
+    def _export_metrics(self, context, partition_keys, totals, write_seconds):
+        """Append the step's compute, input and output metrics to the metrics file"""
+        metrics = pop_step_metrics(context.step_context)
+        if not self.metrics_file:
+            return
+        record = {
+            "timestamp": time.time(),
+            "run_id": context.run_id,
+            "step_key": context.step_key,
+            "asset": context.asset_key.to_user_string(),
+            "partitions": [key for key in partition_keys if key is not None],
+            **metrics,
+            "stored_arrays": totals["arrays"],
+            "stored_bytes": totals["array_bytes"] + totals["header_bytes"],
+            "write_seconds": write_seconds,
+        }
+        try:
+            export_step_metrics(self.metrics_file, record)
+        except OSError as e:
+            logger.warning(f"Could not export metrics to {self.metrics_file}: {str(e)}")
+
+    def load_input(self, context: InputContext):
+        return self._load(context.asset_key, self._partition_keys(context), context.step_context)
+
+    def load_upstream(self, context, asset_key):
+        """
+        Load an upstream asset from within the asset that depends on it.
+
+        Subset runs of a multi-asset still load every input, e.g. both
+        jaws when one is selected. Multi-assets declare such upstream
+        assets as Nothing inputs instead, and only load the ones their
+        selected outputs use (see jaw_assets.load_selected_jaws).
+
+        Args:
+            context (AssetExecutionContext): Context of the asset being computed
+            asset_key (AssetKey): Upstream asset, partitioned like the asset
+
+        Returns:
+            The stored object, or a dict of them keyed by partition for
+            runs over several partitions
+        """
+        partitioned = context.assets_def.partitions_def is not None
+        partition_keys = list(context.partition_keys) if partitioned else [None]
+        return self._load(asset_key, partition_keys, context.get_step_execution_context())
+
+    def _load(self, asset_key, partition_keys, step_context):
+        objects = {}
+        nbytes = 0
+        start = time.perf_counter()
+        for partition_key in partition_keys:
+            path = self._get_path(asset_key, partition_key)
+            logger.debug(f"Mapping {asset_key.to_user_string()} from {path}")
+            obj = read_volume_object(path)
+            nbytes += stored_bytes(path)
+
+            # Let downstream objects refer back to this input instead of copying it
+            _attach_references(obj, asset_key, partition_key, path)
+            objects[partition_key] = obj
+        record_input_load(step_context, time.perf_counter() - start, nbytes)
+
+        # Inputs spanning several partitions are passed as a dict keyed by partition
+        if len(partition_keys) > 1:
+            return objects
+        return objects[partition_keys[0]]
@@ -0,0 +1,179 @@
+import hashlib
+import json
+from dagster import (
+    AssetIn,
+    AssetKey,
+    AssetOut,
+    AssetRecordsFilter,
+    Config,
+    DataVersion,
+    Nothing,
+    Output,
+    get_dagster_logger,
+)
+from .constants import CBCT_JAWS, SKIP_UNCHANGED_OUTPUTS, VERSION_HASH_CHUNK_BYTES
+from .slabs import iter_slabs
+from .lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+
+logger = get_dagster_logger()
+
+# Output metadata flagging a jaw reported up to date instead of recomputed
+UP_TO_DATE_METADATA = "up_to_date"
+# Tag Dagster stores the data version of a materialization under
+DATA_VERSION_TAG = "dagster/data_version"
+# Name of the output of single-output assets
+DEFAULT_OUTPUT_NAME = "result"
+
+
+class DataVersionConfig(Config):
+    """Run configuration for per-jaw assets that skip the jaws whose inputs did not change"""
+    skip_unchanged: bool = SKIP_UNCHANGED_OUTPUTS
+
+
+class UpToDate:
+    """
+    Output value of a jaw whose stored value is still current.
+
+    The VolumeIOManager keeps the stored value instead of writing one.
+    """
+    def __init__(self, data_version):
+        self.data_version = data_version
+
+    def __repr__(self):
+        return f"UpToDate(data_version={self.data_version.value})"
+
+
+def jaw_keys(asset_name):
+    """Asset key of each jaw output of a per-jaw asset, e.g. cbct_scan_data/upper_jaw"""
+    return {jaw: AssetKey([asset_name, jaw]) for jaw in CBCT_JAWS}
+
+
+def jaw_outputs(asset_name, **kwargs):
+    """
+    One optional AssetOut per jaw, named after the jaw.
+
+    The outputs are optional so that subset runs only yield the selected
+    jaws. ``kwargs`` (code_version, metadata, ...) are passed to every AssetOut.
+    """
+    return {jaw: AssetOut(key=key, is_required=False, **kwargs) for jaw, key in jaw_keys(asset_name).items()}
+
+
+def jaw_inputs(name, keys):
+    """
+    One Nothing input per jaw of a per-jaw upstream asset, e.g. upper_scan.
+
+    The inputs only order the steps: subset runs would otherwise load the
+    upstream asset of every jaw, selected or not. The values are loaded
+    with load_selected_jaws.
+
+    Args:
+        name (str): Suffix of the input names
+        keys (dict): Asset key of the upstream asset for each jaw
+
+    Returns:
+        dict: AssetIn keyed by input name
+    """
+    return {f"{jaw.split('_')[0]}_{name}": AssetIn(key=key, dagster_type=Nothing) for jaw, key in keys.items()}
+
+
+def load_selected_jaws(context, io_manager, keys):
+    """
+    Load a per-jaw upstream asset (see jaw_inputs) for the selected jaws.
+
+    Args:
+        context: Execution context of the per-jaw asset
+        io_manager (VolumeIOManager): IO manager storing the upstream asset
+        keys (dict): Asset key of the upstream asset for each jaw
+
+    Returns:
+        dict: Upstream values keyed by jaw, for the selected jaws only
+    """
+    return {jaw: io_manager.load_upstream(context, keys[jaw]) for jaw in selected_jaws(context)}
+
+
+def selected_jaws(context):
+    """The jaws selected in the current run, in CBCT_JAWS order"""
+    return [jaw for jaw in CBCT_JAWS if jaw in context.selected_output_names]
+
+
+def content_version(*parts):
+    """DataVersion hashing JSON-serializable parts"""
+    digest = hashlib.blake2b(json.dumps(parts, sort_keys=True, default=str).encode(), digest_size=16)
+    return DataVersion(digest.hexdigest())
+
+
+def array_version(array):
+    """DataVersion of an array's content (hashed a slab at a time), shape and dtype"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((tuple(array.shape), str(array.dtype))).encode())
+    plane_bytes = max(1, array[:1].nbytes)
+    for core, _, _ in iter_slabs(len(array), max(1, VERSION_HASH_CHUNK_BYTES // plane_bytes)):
+        digest.update(np.ascontiguousarray(array[core]).data)
+    return DataVersion(digest.hexdigest())
+
+
+def latest_data_version(instance, key, partition_key=None):
+    """The data version of the latest materialization of an asset partition, or None"""
+    records_filter = AssetRecordsFilter(
+        asset_key=key, asset_partitions=None if partition_key is None else [partition_key]
+    )
+    records = instance.fetch_materializations(records_filter, limit=1).records
+    record = records[0] if records else None
+    if record is None or record.asset_materialization is None:
+        return None
+    value = (record.asset_materialization.tags or {}).get(DATA_VERSION_TAG)
+    return None if value is None else DataVersion(value)
+
+
+def derived_version(context, key, **parameters):
+    """
+    DataVersion of an output computed from its upstream assets.
+
+    It hashes the output's code version, the current data version of each
+    upstream asset and the parameters affecting the result (model version,
+    cropping, ...), so it only changes when one of them does.
+
+    Returns:
+        DataVersion: None for runs over several partitions, or if an
+            upstream asset has no data version yet
+    """
+    partition_keys = list(context.partition_keys)
+    if len(partition_keys) != 1:
+        return None
+    upstream = {}
+    for parent in sorted(context.assets_def.asset_deps[key], key=lambda parent: parent.to_user_string()):
+        version = latest_data_version(context.instance, parent, partition_keys[0])
+        if version is None:
+            return None
+        upstream[parent.to_user_string()] = version.value
+    code_version = context.assets_def.code_versions_by_key.get(key)
+    return content_version(key.to_user_string(), code_version, upstream, parameters)
+
+
+def is_up_to_date(context, config, key, version):
+    """
+    Whether the latest materialization of an output already has ``version``.
+
+    Only single-partition runs with ``config.skip_unchanged`` skip outputs.
+    """
+    if not config.skip_unchanged or version is None:
+        return False
+    partition_keys = list(context.partition_keys)
+    if len(partition_keys) != 1:
+        return False
+    up_to_date = latest_data_version(context.instance, key, partition_keys[0]) == version
+    if up_to_date:
+        logger.info(f"{key.to_user_string()} is up to date for {partition_keys[0]} ({version.value})")
+    return up_to_date
+
+
+def up_to_date_output(version, output_name=DEFAULT_OUTPUT_NAME, metadata=None):
+    """Output reporting an asset (or one jaw of a multi-asset) as up to date with its stored value"""
+    return Output(
+        UpToDate(version),
+        output_name=output_name,
+        data_version=version,
+        metadata={UP_TO_DATE_METADATA: True, **(metadata or {})},
+    )
@@ -2,4 +2,5 @@ from .general_jobs import *
 from .ios_jobs import *
 from .cbct_jobs import *
 from .alignment_jobs import *
-from .crown_design_jobs import *
\ No newline at end of file
+from .crown_design_jobs import *
+from .fast_path_jobs import *
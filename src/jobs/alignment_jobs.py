@@ -1,3 +1,4 @@
 from dagster import define_asset_job
+from ..run_costs import job_cost_tags
 
-alignment_job = define_asset_job(name="alignment_job", selection="aligned_model")
\ No newline at end of file
+alignment_job = define_asset_job(name="alignment_job", selection="aligned_model", tags=job_cost_tags(["aligned_model"]))
@@ -1,6 +1,10 @@
-from dagster import define_asset_job
+from dagster import AssetSelection, define_asset_job
+from ..jaw_assets import jaw_keys
+from ..run_costs import job_cost_tags
 
-cbct_scan_job = define_asset_job(name="cbct_scan_job", selection="cbct_scan_data")
-cbct_teeth_seg_job = define_asset_job(name="cbct_teeth_seg_job", selection="cbct_teeth_segmentation")
-cbct_gum_seg_job = define_asset_job(name="cbct_gum_seg_job", selection="cbct_gum_detection")
-cbct_nerve_seg_job = define_asset_job(name="cbct_nerve_seg_job", selection="cbct_nerve_detection")
\ No newline at end of file
+# The CBCT steps are per-jaw multi-assets; the jobs select both jaws, and
+# sensors narrow runs down to the jaws that were rematerialized
+cbct_scan_job = define_asset_job(name="cbct_scan_job", selection=AssetSelection.keys(*jaw_keys("cbct_scan_data").values()), tags=job_cost_tags(["cbct_scan_data"]))
+cbct_teeth_seg_job = define_asset_job(name="cbct_teeth_seg_job", selection=AssetSelection.keys(*jaw_keys("cbct_teeth_preview").values(), *jaw_keys("cbct_teeth_segmentation").values()), tags=job_cost_tags(["cbct_teeth_preview", "cbct_teeth_segmentation"]))
+cbct_gum_seg_job = define_asset_job(name="cbct_gum_seg_job", selection=AssetSelection.keys(*jaw_keys("cbct_gum_detection").values()), tags=job_cost_tags(["cbct_gum_detection"]))
+cbct_nerve_seg_job = define_asset_job(name="cbct_nerve_seg_job", selection="cbct_nerve_detection", tags=job_cost_tags(["cbct_nerve_detection"]))
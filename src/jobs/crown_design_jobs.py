@@ -1,3 +1,4 @@
 from dagster import define_asset_job
+from ..run_costs import job_cost_tags
 
-crown_design_job = define_asset_job(name="crown_design_job", selection="crown_design")
\ No newline at end of file
+crown_design_job = define_asset_job(name="crown_design_job", selection="crown_design", tags=job_cost_tags(["crown_design"]))
@@ -0,0 +1,15 @@
+from dagster import define_asset_job, multiprocess_executor
+from ..constants import EXECUTION_MODE_TAG, FAST_PATH_MODE, FAST_PATH_MAX_CONCURRENT
+from ..run_costs import ASSET_COSTS, job_cost_tags
+
+# Materializes the whole graph for one case in a single run. Independent
+# steps (IOS and CBCT branches) run in parallel processes, and intermediate
+# volumes are handed over through the memory-mapped VolumeIOManager, so a
+# step reads its inputs straight from the page cache written by the previous one.
+patient_fast_path_job = define_asset_job(
+    name="patient_fast_path_job",
+    selection="*",
+    executor_def=multiprocess_executor.configured({"max_concurrent": FAST_PATH_MAX_CONCURRENT}),
+    tags={EXECUTION_MODE_TAG: FAST_PATH_MODE, **job_cost_tags(ASSET_COSTS, FAST_PATH_MAX_CONCURRENT)},
+    description="Process a whole patient case in one run",
+)
@@ -1,5 +1,10 @@
-from dagster import define_asset_job
+from dagster import AssetSelection, define_asset_job
+from ..constants import FAST_PATH_MAX_CONCURRENT
+from ..jaw_assets import jaw_keys
+from ..run_costs import ASSET_COSTS, job_cost_tags
 
-materialize_all_job = define_asset_job("materialize_all", selection="*")
+materialize_all_job = define_asset_job("materialize_all", selection="*",
+                                         tags=job_cost_tags(ASSET_COSTS, FAST_PATH_MAX_CONCURRENT))
 # cron_design_job = define_asset_job(name="crown_design_job", selection="*crown_design")
-starting_job = define_asset_job("starting_job", selection=["ios_scan_data","cbct_scan_data"])
\ No newline at end of file
+starting_job = define_asset_job("starting_job", selection=AssetSelection.keys("ios_scan_data", *jaw_keys("cbct_scan_data").values()),
+                                  tags=job_cost_tags(["ios_scan_data", "cbct_scan_data"]))
@@ -1,4 +1,5 @@
 from dagster import define_asset_job
+from ..run_costs import job_cost_tags
 
-ios_scan_job = define_asset_job(name="ios_scan_job", selection="ios_scan_data")
-ios_seg_job = define_asset_job(name="ios_seg_job", selection="ios_segmentation")
\ No newline at end of file
+ios_scan_job = define_asset_job(name="ios_scan_job", selection="ios_scan_data", tags=job_cost_tags(["ios_scan_data"]))
+ios_seg_job = define_asset_job(name="ios_seg_job", selection="ios_segmentation", tags=job_cost_tags(["ios_segmentation"]))
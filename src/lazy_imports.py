@@ -0,0 +1,38 @@
+import importlib
+import sys
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is only imported on first attribute access.
+
+    The code location imports every asset module to build its Definitions
+    (in the webserver, the daemon and every run process), but NumPy and
+    SciPy are only needed once an asset executes. Attributes are cached
+    on the stand-in after the first access.
+    """
+    def __init__(self, name):
+        self._lazy_name = name
+
+    def __getattr__(self, attribute):
+        value = getattr(importlib.import_module(self._lazy_name), attribute)
+        setattr(self, attribute, value)
+        return value
+
+    def __repr__(self):
+        loaded = self._lazy_name in sys.modules
+        return f"LazyModule({self._lazy_name}, loaded={loaded})"
+
+
+def lazy_import(name):
+    """
+    A module, imported on first use.
+
+    Args:
+        name (str): Module name, e.g. "numpy" or "scipy.ndimage"
+
+    Returns:
+        The module if it is already imported, a LazyModule otherwise
+    """
+    module = sys.modules.get(name)
+    return LazyModule(name) if module is None else module
@@ -0,0 +1,606 @@
+import functools
+import os
+import time
+from typing import List
+from dagster import (
+    Config,
+    MetadataValue,
+    get_dagster_logger,
+)
+from .constants import (
+    MESH_EXPORT_DIR,
+    MESH_EXPORT_FORMATS,
+    MESH_TARGET_TRIANGLES,
+    MESH_SLAB_VOXELS,
+    MESH_WRITE_CHUNK_ROWS,
+    MESH_OBJ_DECIMALS,
+    OUTPUT_FILE_EXTENSION,
+)
+from .safe_data import safe_float
+from .voxel_grid import voxel_grid
+from .registration import apply_transform
+from .lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+
+logger = get_dagster_logger()
+
+# Cell size (in voxels) that keeps every extracted vertex: corners are on a
+# half-voxel grid, so clustering on it only merges identical vertices
+EXACT_CELL = 0.5
+
+# Two characters as one native uint16, for formatting numbers two digits at a
+# time: "00" to "99", then " 0" to "99" with a padded leading zero, then "  "
+_PAIR_TEXT = [f"{pair:02d}" for pair in range(100)] + [f"{pair:2d}" for pair in range(100)] + ["  "]
+
+
+@functools.lru_cache(maxsize=None)
+def _pair_codes():
+    return np.frombuffer("".join(_PAIR_TEXT).encode("ascii"), dtype=np.uint16)
+
+
+class MeshExportConfig(Config):
+    """Run configuration for the surface meshes written by the output assets"""
+    output_dir: str = MESH_EXPORT_DIR
+    target_triangles: int = MESH_TARGET_TRIANGLES  # Total over all the surfaces of a file
+    formats: List[str] = list(MESH_EXPORT_FORMATS)  # "obj" and/or "ply"
+
+
+def _marching_cubes():
+    """scikit-image's marching cubes, or None when it is not installed"""
+    try:
+        from skimage.measure import marching_cubes
+    except ImportError:
+        return None
+    return marching_cubes
+
+
+@functools.lru_cache(maxsize=None)
+def _quad_offsets(axis):
+    """Corners, in half voxels, of the face between a voxel and its next neighbour along ``axis``"""
+    u, v = (axis + 1) % 3, (axis + 2) % 3
+    offsets = np.zeros((4, 3), dtype=np.int64)
+    offsets[:, axis] = 1
+    offsets[:, u] = [-1, 1, 1, -1]
+    offsets[:, v] = [-1, -1, 1, 1]
+    return offsets
+
+
+def _padded_planes(mask, start, stop):
+    """
+    Planes [start, stop) of the mask padded with one empty voxel on every side.
+
+    Plane p of the padded volume is plane p - 1 of the mask, so surfaces
+    touching the border of the volume are closed.
+    """
+    block = np.zeros((stop - start, mask.shape[1] + 2, mask.shape[2] + 2), dtype=bool)
+    low, high = max(start - 1, 0), min(stop - 1, mask.shape[0])
+    if high > low:
+        block[low + 1 - start:high + 1 - start, 1:-1, 1:-1] = mask[low:high]
+    return block
+
+
+def _iter_layers(mask, slab_voxels):
+    """
+    Padded blocks covering the cube layers of the padded volume slab by slab.
+
+    Yields:
+        tuple: (start, block) where ``block`` holds padded planes
+            [start, stop + 1) for the layers [start, stop)
+    """
+    plane_voxels = (mask.shape[1] + 2) * (mask.shape[2] + 2)
+    layers = mask.shape[0] + 1
+    step = max(1, slab_voxels // plane_voxels)
+    for start in range(0, layers, step):
+        stop = min(start + step, layers)
+        yield start, _padded_planes(mask, start, stop + 1)
+
+
+def count_boundary_faces(mask, slab_voxels=MESH_SLAB_VOXELS):
+    """Number of voxel faces between the inside and the outside of a mask"""
+    total = 0
+    for _, block in _iter_layers(mask, slab_voxels):
+        layers = block[:-1]
+        total += np.count_nonzero(block[1:] != layers)
+        total += np.count_nonzero(layers[:, 1:] != layers[:, :-1])
+        total += np.count_nonzero(layers[:, :, 1:] != layers[:, :, :-1])
+    return int(total)
+
+
+def _voxel_polygons(block, start):
+    """
+    Boundary faces of the voxels in the layers of a padded block.
+
+    Every face between an inside and an outside voxel is a quad facing
+    outwards. Quads are produced one face direction at a time to bound
+    the temporaries.
+
+    Yields:
+        ndarray: (Q, 4, 3) int32 corners, in half voxels of the padded volume
+    """
+    for axis in range(3):
+        planes = block if axis == 0 else block[:-1]
+        low = [slice(None)] * 3
+        high = [slice(None)] * 3
+        low[axis] = slice(None, -1)
+        high[axis] = slice(1, None)
+        current, following = planes[tuple(low)], planes[tuple(high)]
+        for outwards, faces in ((True, current & ~following), (False, following & ~current)):
+            voxels = np.stack(np.nonzero(faces), axis=1).astype(np.int32)
+            if voxels.size == 0:
+                continue
+            voxels[:, 0] += start
+            corners = 2 * voxels[:, None, :] + _quad_offsets(axis).astype(np.int32)
+            yield corners if outwards else corners[:, ::-1]
+
+
+def _marching_polygons(block, start, marching_cubes):
+    """
+    Marching cubes surface of the layers of a padded block.
+
+    Yields:
+        ndarray: (T, 3, 3) int32 corners, in half voxels of the padded volume
+    """
+    if not block.any():
+        return
+    vertices, faces, _, _ = marching_cubes(block.astype(np.float32), level=0.5)
+    # A binary volume crossed at 0.5 puts every vertex on the half voxel grid
+    vertices = np.rint(vertices * 2).astype(np.int32)
+    vertices[:, 0] += 2 * start
+    yield vertices[faces]
+
+
+def _unique_rows(rows):
+    """Unique rows of a 2D integer array, compared as raw bytes"""
+    rows = np.ascontiguousarray(rows)
+    if rows.shape[0] == 0:
+        return rows
+    keys = rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))).ravel()
+    _, first = np.unique(keys, return_index=True)
+    return rows[np.sort(first)]
+
+
+def _canonical_faces(faces):
+    """
+    Drop degenerate and duplicate triangles.
+
+    Each triangle is rotated to start at its smallest index, which keeps
+    its orientation, so duplicates compare equal.
+    """
+    keep = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])
+    faces = faces[keep]
+    shift = np.argmin(faces, axis=1)
+    order = (shift[:, None] + np.arange(3)) % 3
+    faces = np.take_along_axis(faces, order, axis=1)
+    return _unique_rows(faces)
+
+
+class _VertexClusters:
+    """
+    Vertex clustering of a surface produced slab by slab.
+
+    Polygon corners are snapped to a grid of ``cell`` sized cells; each
+    cell becomes one vertex at the mean of the corners it received, and
+    polygons are kept as triangles between distinct cells.
+    """
+    def __init__(self, shape, cell):
+        self.cell = cell
+        # Corners of the padded volume span [0, 2 * (dim + 2)) half voxels. The
+        # cell of a corner is separable per axis, so each axis gets a lookup
+        # table from half voxel coordinate to its share of the flat cell id.
+        cells = [np.floor(np.arange(2 * (dim + 2)) / (2 * cell) + 0.5).astype(np.int64) for dim in shape]
+        grid = [int(axis_cells[-1]) + 1 for axis_cells in cells]
+        self.plane_cells = grid[1] * grid[2]
+        self.tables = [cells[0] * self.plane_cells, cells[1] * grid[2], cells[2]]
+        self.faces, self.ids, self.sums, self.counts = [], [], [], []
+
+    def add(self, polygons):
+        """Cluster (N, K, 3) polygons with K = 3 or 4 corners"""
+        corners = polygons.reshape(-1, 3)
+        flat = self.tables[0][corners[:, 0]]
+        flat += self.tables[1][corners[:, 1]]
+        flat += self.tables[2][corners[:, 2]]
+
+        # Polygons within the slab span few cell planes, so their cells are
+        # counted with a dense bincount when that is smaller than sorting them
+        base = int(flat.min()) // self.plane_cells * self.plane_cells
+        span = int(flat.max()) + 1 - base
+        if span <= 4 * flat.size:
+            local = flat - base
+            counts = np.bincount(local, minlength=span)
+            occupied = np.flatnonzero(counts)
+            sums = np.stack([
+                np.bincount(local, weights=corners[:, axis], minlength=span)[occupied] for axis in range(3)
+            ], axis=1)
+            ids, counts = occupied + base, counts[occupied]
+        else:
+            ids, inverse = np.unique(flat, return_inverse=True)
+            counts = np.bincount(inverse, minlength=ids.size)
+            sums = np.stack([
+                np.bincount(inverse, weights=corners[:, axis], minlength=ids.size) for axis in range(3)
+            ], axis=1)
+
+        flat = flat.reshape(polygons.shape[:2])
+        triangles = [flat[:, [0, 1, 2]]]
+        if polygons.shape[1] == 4:
+            triangles.append(flat[:, [0, 2, 3]])
+        self.faces.append(_canonical_faces(np.concatenate(triangles)))
+        self.ids.append(ids)
+        self.sums.append(sums)
+        self.counts.append(counts)
+
+    def mesh(self):
+        """
+        Merge the clusters of all slabs into the final mesh.
+
+        Returns:
+            tuple: ((V, 3) mean corners in half voxels of the padded volume,
+                (F, 3) int64 faces)
+        """
+        if not self.faces:
+            return np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64)
+        # Cells shared by several slabs are merged, as are the triangles spanning them
+        cell_ids, inverse = np.unique(np.concatenate(self.ids), return_inverse=True)
+        corner_sums = np.concatenate(self.sums)
+        cell_sums = np.stack([
+            np.bincount(inverse, weights=corner_sums[:, axis], minlength=cell_ids.size) for axis in range(3)
+        ], axis=1)
+        cell_counts = np.bincount(inverse, weights=np.concatenate(self.counts), minlength=cell_ids.size)
+        faces = _unique_rows(np.concatenate(self.faces))
+
+        used, face_vertices = np.unique(faces, return_inverse=True)
+        position = np.searchsorted(cell_ids, used)
+        vertices = cell_sums[position] / cell_counts[position, None]
+        return vertices, face_vertices.reshape(-1, 3)
+
+
+def extract_surface(mask, target_triangles=MESH_TARGET_TRIANGLES, spacing=(1.0, 1.0, 1.0),
+                    slab_voxels=MESH_SLAB_VOXELS):
+    """
+    Extract and decimate the surface of a 3D mask.
+
+    The surface is extracted slab by slab, with marching cubes when
+    scikit-image is installed and from the voxel faces otherwise. It is
+    decimated by vertex clustering on the fly: corners are snapped to a
+    grid of cells sized so the result has about ``target_triangles``
+    triangles, and each cell becomes one vertex at the mean of its
+    corners. Only the decimated mesh of each slab is kept, so the full
+    resolution surface is never held in memory.
+
+    When cells span several voxels, the detail within a cell is lost
+    anyway, so the mask is first downsampled by majority vote to keep two
+    voxels per cell, and the surface is extracted from the smaller mask.
+
+    Args:
+        mask: 3D boolean array or CompactMask
+        target_triangles (int): Approximate number of triangles to keep
+        spacing (tuple): Voxel size along each axis (e.g. in mm)
+        slab_voxels (int): Voxels processed at once
+
+    Returns:
+        tuple: ((V, 3) float32 vertices in the mask's index space scaled by
+            ``spacing``, (F, 3) uint32 faces, cell size in voxels)
+    """
+    shape = tuple(int(dim) for dim in mask.shape)
+    full_triangles = 2 * count_boundary_faces(mask, slab_voxels)
+    # About (area / cell**2) cells are crossed by the surface, two triangles each
+    cell = float(np.sqrt(full_triangles / max(1, target_triangles)))
+    if cell <= 1.0:
+        cell = EXACT_CELL
+    factor = max(1, int(cell // 2))
+    if factor > 1:
+        mask = downsample_mask(mask, factor, slab_voxels)
+
+    marching_cubes = _marching_cubes()
+    clusters = _VertexClusters(mask.shape, cell / factor)
+    for start, block in _iter_layers(mask, slab_voxels):
+        if marching_cubes is not None:
+            polygons = _marching_polygons(block, start, marching_cubes)
+        else:
+            polygons = _voxel_polygons(block, start)
+        for group in polygons:
+            clusters.add(group)
+    vertices, faces = clusters.mesh()
+
+    # Mean corners are in half voxels of the padded (downsampled) volume:
+    # back to the index space of the original mask
+    vertices = (vertices / 2 - 1) * factor + (factor - 1) / 2
+    vertices *= np.asarray(spacing, dtype=np.float64)
+    logger.debug(
+        f"Extracted surface of {shape} mask: {full_triangles} triangles at full resolution, "
+        f"{len(faces)} after clustering with {cell:.2f} voxel cells"
+    )
+    return vertices.astype(np.float32), faces.astype(np.uint32), cell
+
+
+def downsample_mask(mask, factor, slab_voxels=MESH_SLAB_VOXELS):
+    """
+    Downsample a mask by majority vote over ``factor``-sized cubes.
+
+    Cubes overhanging the border count the missing voxels as outside.
+
+    Args:
+        mask: 3D boolean array or CompactMask
+        factor (int): Edge of the cubes, in voxels
+        slab_voxels (int): Voxels read at once
+
+    Returns:
+        ndarray: Boolean array of shape ceil(mask.shape / factor)
+    """
+    shape = tuple(int(dim) for dim in mask.shape)
+    reduced = tuple(-(-dim // factor) for dim in shape)
+    result = np.empty(reduced, dtype=bool)
+    plane_voxels = shape[1] * shape[2]
+    planes = max(1, slab_voxels // (plane_voxels * factor)) * factor
+    threshold = factor ** 3 / 2
+    for start in range(0, shape[0], planes):
+        stop = min(start + planes, shape[0])
+        block = np.zeros((-(-(stop - start) // factor) * factor, reduced[1] * factor, reduced[2] * factor), dtype=bool)
+        block[:stop - start, :shape[1], :shape[2]] = mask[start:stop]
+        counts = block.reshape(-1, factor, reduced[1], factor, reduced[2], factor).sum(axis=(1, 3, 5))
+        result[start // factor:start // factor + counts.shape[0]] = counts > threshold
+    return result
+
+
+def _format_integers(values, width, pad=ord(" ")):
+    """
+    ASCII digits of non-negative integers, right-aligned in ``width`` columns.
+
+    Digits are produced two at a time: each division by 100 gives a pair
+    that is looked up as one uint16 holding both characters.
+
+    Args:
+        values (ndarray): Integer array of any shape
+        width (int): Columns per value
+        pad (int): Character replacing leading zeros, ord(" ") or ord("0")
+
+    Returns:
+        ndarray: uint8 array of shape values.shape + (width,)
+    """
+    pairs = (width + 1) // 2
+    codes = np.empty(values.shape + (pairs,), dtype=np.uint16)
+    remaining = values.astype(np.uint32 if values.size and values.max() < 2 ** 32 else np.uint64)
+    padded = pad != ord("0")
+    for index in range(pairs - 1, -1, -1):
+        before = remaining
+        remaining, pair = np.divmod(before, 100)
+        if padded:
+            # The leading pair has its tens digit padded, pairs before it are blank
+            pair = pair.astype(np.intp)
+            pair[remaining == 0] += 100
+            if index < pairs - 1:
+                pair[before == 0] = 200
+        codes[..., index] = _pair_codes()[pair]
+    text = codes.view(np.uint8)
+    return text[..., 2 * pairs - width:]
+
+
+def _format_fixed(values, decimals):
+    """
+    ASCII fixed-point representation of floats.
+
+    Each value takes a sign column, the integer digits (right-aligned), the
+    point and ``decimals`` digits, with the minus sign right before the
+    first digit. All the columns are filled with array operations.
+
+    Returns:
+        ndarray: uint8 array of shape values.shape + (width,)
+    """
+    scale = 10 ** decimals
+    scaled = np.rint(np.abs(values) * scale).astype(np.int64)
+    whole, fraction = np.divmod(scaled, scale)
+    width = len(str(int(whole.max()))) if whole.size else 1
+
+    text = np.empty(values.shape + (width + decimals + 2,), dtype=np.uint8)
+    text[..., 0] = ord(" ")
+    text[..., 1:width + 1] = _format_integers(whole, width)
+    text[..., width + 1] = ord(".")
+    if decimals:
+        text[..., width + 2:] = _format_integers(fraction, decimals, pad=ord("0"))
+
+    negative = np.nonzero((values < 0) & (scaled > 0))
+    if negative[0].size:
+        digits = np.searchsorted(10 ** np.arange(1, width, dtype=np.int64), whole[negative], side="right") + 1
+        text[negative + (width - digits,)] = ord("-")
+    return text
+
+
+def _format_rows(keyword, fields):
+    """
+    Lines of the form ``<keyword> <field> <field> ...``.
+
+    Args:
+        keyword (bytes): Line keyword, e.g. b"v"
+        fields (ndarray): (N, K, W) uint8 formatted fields
+
+    Returns:
+        bytes: N newline-terminated lines
+    """
+    count, columns, width = fields.shape
+    rows = np.empty((count, len(keyword) + columns * (width + 1) + 1), dtype=np.uint8)
+    rows[:, :len(keyword)] = np.frombuffer(keyword, dtype=np.uint8)
+    body = rows[:, len(keyword):-1].reshape(count, columns, width + 1)
+    body[:, :, 0] = ord(" ")
+    body[:, :, 1:] = fields
+    rows[:, -1] = ord("\n")
+    return rows.tobytes()
+
+
+def write_obj(path, vertices, faces, groups=None, decimals=MESH_OBJ_DECIMALS, chunk_rows=MESH_WRITE_CHUNK_ROWS):
+    """
+    Write a triangle mesh as a Wavefront OBJ file.
+
+    Lines are formatted with array operations ``chunk_rows`` at a time and
+    streamed to disk, so no Python string is built per vertex or face.
+
+    Args:
+        path (str): Output file
+        vertices (ndarray): (V, 3) vertex positions
+        faces (ndarray): (F, 3) 0-based vertex indices
+        groups (list, optional): (name, face count) of consecutive face
+            ranges, written as OBJ groups
+        decimals (int): Decimals of the vertex coordinates
+        chunk_rows (int): Vertices/faces formatted per write
+    """
+    faces = np.asarray(faces)
+    groups = groups or [(None, len(faces))]
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as obj_file:
+        obj_file.write(f"# {len(vertices)} vertices, {len(faces)} triangles\n".encode())
+        for start in range(0, len(vertices), chunk_rows):
+            chunk = np.asarray(vertices[start:start + chunk_rows], dtype=np.float64)
+            obj_file.write(_format_rows(b"v", _format_fixed(chunk, decimals)))
+
+        width = len(str(len(vertices)))
+        first = 0
+        for name, count in groups:
+            if name:
+                obj_file.write(f"g {name}\n".encode())
+            for start in range(first, first + count, chunk_rows):
+                chunk = faces[start:min(start + chunk_rows, first + count)].astype(np.int64) + 1
+                obj_file.write(_format_rows(b"f", _format_integers(chunk, width)))
+            first += count
+    os.replace(tmp_path, path)
+
+
+def write_ply(path, vertices, faces, chunk_rows=MESH_WRITE_CHUNK_ROWS):
+    """
+    Write a triangle mesh as a binary little-endian PLY file.
+
+    Vertices are written as float32 and faces as fixed-size records
+    straight from numpy buffers, ``chunk_rows`` at a time.
+
+    Args:
+        path (str): Output file
+        vertices (ndarray): (V, 3) vertex positions
+        faces (ndarray): (F, 3) 0-based vertex indices
+        chunk_rows (int): Vertices/faces written per write
+    """
+    header = (
+        "ply\n"
+        "format binary_little_endian 1.0\n"
+        f"element vertex {len(vertices)}\n"
+        "property float x\n"
+        "property float y\n"
+        "property float z\n"
+        f"element face {len(faces)}\n"
+        "property list uchar int vertex_indices\n"
+        "end_header\n"
+    )
+    face_record = np.dtype([("count", "u1"), ("indices", "<i4", (3,))])
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as ply_file:
+        ply_file.write(header.encode("ascii"))
+        for start in range(0, len(vertices), chunk_rows):
+            np.ascontiguousarray(vertices[start:start + chunk_rows], dtype="<f4").tofile(ply_file)
+
+        records = np.empty(min(chunk_rows, len(faces)), dtype=face_record)
+        records["count"] = 3
+        for start in range(0, len(faces), chunk_rows):
+            chunk = faces[start:start + chunk_rows]
+            block = records[:len(chunk)]
+            block["indices"] = chunk
+            block.tofile(ply_file)
+    os.replace(tmp_path, path)
+
+
+_WRITERS = {
+    "obj": write_obj,
+    "ply": write_ply,
+}
+
+
+def export_surfaces(segmentations, path_stem, target_triangles=MESH_TARGET_TRIANGLES,
+                    formats=MESH_EXPORT_FORMATS, transforms=None):
+    """
+    Write the surfaces of segmentation masks as one mesh file per format.
+
+    Vertices are written in mm: each surface is placed with the voxel grid
+    of its segmentation (see voxel_grid), then moved by the transform of
+    its structure, if any.
+
+    Args:
+        segmentations (dict): SegmentationResult objects (or dicts of them,
+            e.g. per jaw) keyed by structure name
+        path_stem (str): Output path without extension
+        target_triangles (int): Approximate triangle count of the whole mesh,
+            shared evenly between the surfaces
+        formats (list): Formats to write ("obj", "ply")
+        transforms (dict, optional): 4x4 rigid transforms keyed by structure
+            name, e.g. the registration of the IOS surface onto the CBCT
+
+    Returns:
+        dict: Files written keyed by format, and mesh statistics
+    """
+    unknown = set(formats) - set(_WRITERS)
+    if unknown:
+        raise ValueError(f"Unsupported mesh formats {sorted(unknown)}, expected some of {sorted(_WRITERS)}")
+
+    transforms = transforms or {}
+    masks = []
+    for structure, segmentation in segmentations.items():
+        parts = segmentation.items() if isinstance(segmentation, dict) else [(None, segmentation)]
+        for part, result in parts:
+            name = structure if part is None else f"{structure}_{part}"
+            masks.append((name, result.data, voxel_grid(result), transforms.get(structure)))
+
+    start = time.perf_counter()
+    vertices, faces, groups = [], [], []
+    offset = 0
+    for name, mask, (spacing, origin), transform in masks:
+        surface_vertices, surface_faces, _ = extract_surface(mask, max(1, target_triangles // len(masks)),
+                                                             spacing=spacing)
+        surface_vertices = surface_vertices.astype(np.float64) + np.asarray(origin)
+        if transform is not None:
+            surface_vertices = apply_transform(surface_vertices, np.asarray(transform, dtype=np.float64))
+        vertices.append(surface_vertices.astype(np.float32))
+        faces.append(surface_faces.astype(np.int64) + offset)
+        groups.append((name, len(surface_faces)))
+        offset += len(surface_vertices)
+    vertices = np.concatenate(vertices) if vertices else np.zeros((0, 3), dtype=np.float32)
+    faces = np.concatenate(faces) if faces else np.zeros((0, 3), dtype=np.int64)
+    extract_seconds = time.perf_counter() - start
+
+    os.makedirs(os.path.dirname(path_stem) or ".", exist_ok=True)
+    start = time.perf_counter()
+    files = {}
+    for file_format in formats:
+        path = f"{path_stem}.{file_format}"
+        if file_format == "obj":
+            write_obj(path, vertices, faces, groups)
+        else:
+            _WRITERS[file_format](path, vertices, faces)
+        files[file_format] = path
+    write_seconds = time.perf_counter() - start
+
+    logger.info(f"Exported {len(faces)} triangles from {len(masks)} surfaces to {path_stem}")
+    return {
+        "files": files,
+        "surfaces": len(masks),
+        "vertices": int(len(vertices)),
+        "triangles": int(len(faces)),
+        "extract_seconds": extract_seconds,
+        "write_seconds": write_seconds,
+    }
+
+
+def mesh_export_metadata(export):
+    """
+    Output metadata describing an export_surfaces result.
+
+    ``output_file`` points at the file in the OUTPUT_FILE_EXTENSION format,
+    or the first one written.
+    """
+    files = export["files"]
+    metadata = {f"{file_format}_file": MetadataValue.path(path) for file_format, path in files.items()}
+    if files:
+        primary = files.get(OUTPUT_FILE_EXTENSION.lstrip("."), next(iter(files.values())))
+        metadata["output_file"] = MetadataValue.path(primary)
+    metadata.update({
+        "mesh_surfaces": MetadataValue.int(export["surfaces"]),
+        "mesh_vertices": MetadataValue.int(export["vertices"]),
+        "mesh_triangles": MetadataValue.int(export["triangles"]),
+        "mesh_extract_seconds": MetadataValue.float(safe_float(export["extract_seconds"])),
+        "mesh_write_seconds": MetadataValue.float(safe_float(export["write_seconds"])),
+    })
+    return metadata
@@ -0,0 +1,77 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from dagster import (
+    Config,
+    get_dagster_logger,
+)
+from .constants import JAW_EXECUTOR, JAW_MAX_WORKERS
+
+logger = get_dagster_logger()
+
+EXECUTORS = ("thread", "process", "serial")
+
+
+class JawParallelismConfig(Config):
+    """Run configuration for assets that process the upper and lower jaw concurrently"""
+    jaw_executor: str = JAW_EXECUTOR  # "thread", "process" or "serial"
+    jaw_max_workers: int = JAW_MAX_WORKERS
+
+
+def _timed(fn, args):
+    """Call fn(*args) and return its result with the elapsed wall time"""
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def run_parallel(fn, tasks, executor, max_workers):
+    """
+    Run independent tasks concurrently.
+
+    Threads suit NumPy-heavy work, which releases the GIL; processes avoid
+    the GIL entirely but pickle the arguments and results, so ``fn`` must be
+    a module-level function.
+
+    Args:
+        fn (callable): Function called as fn(*args) for each task
+        tasks (dict): Arguments tuple for each task, keyed by task name
+        executor (str): "thread", "process" or "serial"
+        max_workers (int): Pool size
+
+    Returns:
+        tuple: (results, seconds), both dicts keyed by task name
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"Unknown executor {executor!r}, expected one of {EXECUTORS}")
+
+    if executor == "serial" or len(tasks) < 2:
+        outcomes = {name: _timed(fn, args) for name, args in tasks.items()}
+    else:
+        pool_class = ThreadPoolExecutor if executor == "thread" else ProcessPoolExecutor
+        workers = max(1, min(max_workers, len(tasks)))
+        with pool_class(max_workers=workers) as pool:
+            futures = {name: pool.submit(_timed, fn, args) for name, args in tasks.items()}
+            outcomes = {name: future.result() for name, future in futures.items()}
+
+    results = {name: result for name, (result, _) in outcomes.items()}
+    seconds = {name: elapsed for name, (_, elapsed) in outcomes.items()}
+    return results, seconds
+
+
+def run_per_jaw(fn, tasks, config):
+    """
+    Run one task per jaw, concurrently.
+
+    Args:
+        fn (callable): Function called as fn(*args) for each jaw
+        tasks (dict): Arguments tuple for each jaw, keyed by jaw name
+        config (JawParallelismConfig): Executor type and pool size
+
+    Returns:
+        tuple: (results, seconds), both dicts keyed by jaw name
+    """
+    if config.jaw_executor not in EXECUTORS:
+        raise ValueError(f"Unknown jaw executor {config.jaw_executor!r}, expected one of {EXECUTORS}")
+    results, seconds = run_parallel(fn, tasks, config.jaw_executor, config.jaw_max_workers)
+    logger.debug(f"Processed jaws with {config.jaw_executor} executor: {seconds}")
+    return results, seconds
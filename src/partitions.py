@@ -0,0 +1,5 @@
+from dagster import DynamicPartitionsDefinition
+
+# One partition per patient case; partitions are added by the
+# new_patient_sensor (or from the UI) as cases arrive
+patients_partitions = DynamicPartitionsDefinition(name="patients")
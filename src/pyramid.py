@@ -0,0 +1,95 @@
+from dagster import (
+    Config,
+    get_dagster_logger,
+)
+from .constants import (
+    SCAN_FILL_CHUNK_BYTES,
+    COARSE_TO_FINE_ENABLED,
+    COARSE_TO_FINE_FACTOR,
+    COARSE_TO_FINE_MARGIN,
+)
+from .voxel_grid import downsampled_grid
+from .lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+
+logger = get_dagster_logger()
+
+
+class CoarseToFineConfig(Config):
+    """Run configuration for coarse-to-fine segmentation on the scan pyramid"""
+    coarse_to_fine: bool = COARSE_TO_FINE_ENABLED
+    coarse_factor: int = COARSE_TO_FINE_FACTOR  # Pyramid level of the coarse pass
+    refine_margin: int = COARSE_TO_FINE_MARGIN  # Coarse voxels refined on each side of the boundary
+
+
+def block_mean(data, factor, chunk_bytes=SCAN_FILL_CHUNK_BYTES):
+    """
+    Downsample a volume by averaging ``factor``-sized cubes.
+
+    The volume is read a few planes at a time, so memory-mapped volumes
+    are never loaded whole. Cubes overhanging the border average the
+    voxels they do cover. Integer volumes are rounded back to their dtype.
+
+    Args:
+        data (ndarray): 3D volume
+        factor (int): Edge of the averaged cubes, in voxels
+        chunk_bytes (int): Bound on the float temporaries
+
+    Returns:
+        ndarray: Volume of shape ceil(data.shape / factor), with data's dtype
+    """
+    shape = tuple(int(dim) for dim in data.shape)
+    reduced = tuple(-(-dim // factor) for dim in shape)
+    result = np.empty(reduced, dtype=data.dtype)
+    # Voxels covered by each cube along each axis, for the border cubes
+    covered = [np.minimum(factor, dim - np.arange(size) * factor) for dim, size in zip(shape, reduced)]
+    plane_bytes = reduced[1] * reduced[2] * factor * factor * 4
+    planes = max(1, chunk_bytes // (plane_bytes * factor)) * factor
+
+    for start in range(0, shape[0], planes):
+        stop = min(start + planes, shape[0])
+        count = -(-(stop - start) // factor)
+        block = np.zeros((count * factor, reduced[1] * factor, reduced[2] * factor), dtype=np.float32)
+        block[:stop - start, :shape[1], :shape[2]] = data[start:stop]
+        sums = block.reshape(count, factor, reduced[1], factor, reduced[2], factor).sum(axis=(1, 3, 5))
+        first = start // factor
+        sums /= (
+            covered[0][first:first + count, None, None]
+            * covered[1][None, :, None]
+            * covered[2][None, None, :]
+        ).astype(np.float32)
+        if np.issubdtype(result.dtype, np.integer):
+            np.rint(sums, out=sums)
+        result[first:first + count] = sums
+    return result
+
+
+def build_pyramid(scan, factors):
+    """
+    Downsampled versions of a scan.
+
+    Each level is computed from the finest level it is a multiple of, so
+    a 4x level costs only a pass over the 2x one.
+
+    Args:
+        scan: DentalScan at full resolution
+        factors (list): Downsampling factors, e.g. [2, 4]
+
+    Returns:
+        dict: DentalScan per factor, sharing the scan's value mapping and
+            placed in the same physical frame
+    """
+    levels = {}
+    for factor in sorted(set(int(factor) for factor in factors)):
+        if factor <= 1:
+            continue
+        source_factor = max([level for level in levels if factor % level == 0], default=1)
+        source = scan.data if source_factor == 1 else levels[source_factor].data
+        data = block_mean(source, factor // source_factor)
+        levels[factor] = type(scan).from_stored(
+            f"{scan.name}_x{factor}", scan.scan_type, data, scan.scale, scan.offset, scan.value_range,
+            *downsampled_grid(scan, factor),
+        )
+    logger.debug(f"Built pyramid of {scan.name}: {sorted(levels)}")
+    return levels
@@ -0,0 +1,166 @@
+import functools
+import time
+from typing import List
+from dagster import (
+    Config,
+    get_dagster_logger,
+)
+from .constants import (
+    MASK_FILL_CHUNK_BYTES,
+    ICP_SURFACE_POINTS,
+    ICP_SCALES,
+    ICP_MAX_ITERATIONS,
+    ICP_TOLERANCE,
+    ICP_REJECT_FACTOR,
+)
+from .compact_mask import CompactMask
+from .slabs import iter_slabs
+from .lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+ndimage = lazy_import("scipy.ndimage")
+spatial = lazy_import("scipy.spatial")
+
+logger = get_dagster_logger()
+
+
+@functools.lru_cache(maxsize=None)
+def _face_structure():
+    """Face-connected neighbourhood: a positive voxel with a negative face neighbour is on the surface"""
+    return ndimage.generate_binary_structure(3, 1)
+
+
+class RegistrationConfig(Config):
+    """Run configuration for the IOS to CBCT surface registration"""
+    surface_points: int = ICP_SURFACE_POINTS  # Points sampled from each surface
+    icp_scales: List[int] = list(ICP_SCALES)  # Source points used by each ICP level, coarse to fine
+    icp_max_iterations: int = ICP_MAX_ITERATIONS  # Iterations per level
+    icp_tolerance: float = ICP_TOLERANCE  # Relative residual change considered converged
+    icp_reject_factor: float = ICP_REJECT_FACTOR  # Pairs further than this times the median distance are ignored
+
+
+def surface_points(mask, max_points, seed=0):
+    """
+    Sample the surface voxels of a mask.
+
+    Surface voxels are positive voxels with a negative face neighbour (or
+    on the border of the volume). The mask is decoded a few planes at a
+    time, each slab with one plane of context on each side.
+
+    Args:
+        mask: CompactMask or boolean ndarray
+        max_points (int): Maximum number of points returned
+        seed (int): Seed of the random subsampling
+
+    Returns:
+        ndarray: (N, 3) float64 voxel coordinates, N <= max_points
+    """
+    shape = tuple(int(dim) for dim in mask.shape)
+    rng = np.random.default_rng(seed)
+    if isinstance(mask, CompactMask) and mask.count() == 0:
+        return np.empty((0, 3), dtype=np.float64)
+    plane_bytes = max(1, int(np.prod(shape[1:], dtype=np.int64)))
+    slab_size = max(1, MASK_FILL_CHUNK_BYTES // plane_bytes)
+
+    chunks = []
+    for core, padded, inner in iter_slabs(shape[0], slab_size, halo=1):
+        block = np.asarray(mask[padded], dtype=bool)
+        interior = ndimage.binary_erosion(block, _face_structure(), border_value=0)
+        points = np.argwhere(block[inner] & ~interior[inner])
+        # Keep at most max_points per slab, so memory stays bounded
+        if len(points) > max_points:
+            points = points[rng.choice(len(points), max_points, replace=False)]
+        points[:, 0] += core.start
+        chunks.append(points)
+    points = np.concatenate(chunks) if chunks else np.empty((0, 3), dtype=np.int64)
+    if len(points) > max_points:
+        points = points[rng.choice(len(points), max_points, replace=False)]
+    return points.astype(np.float64)
+
+
+def apply_transform(points, transform):
+    """Apply a 4x4 homogeneous transform to (N, 3) points"""
+    return points @ transform[:3, :3].T + transform[:3, 3]
+
+
+def rigid_fit(source, target):
+    """
+    Least-squares rotation and translation mapping ``source`` onto ``target``.
+
+    Kabsch algorithm on paired (N, 3) points, with reflections excluded.
+
+    Returns:
+        ndarray: 4x4 homogeneous transform
+    """
+    source_center = source.mean(axis=0)
+    target_center = target.mean(axis=0)
+    covariance = (source - source_center).T @ (target - target_center)
+    u, _, vt = np.linalg.svd(covariance)
+    correction = np.diag([1.0, 1.0, np.sign(np.linalg.det(vt.T @ u.T)) or 1.0])
+    rotation = vt.T @ correction @ u.T
+    transform = np.eye(4)
+    transform[:3, :3] = rotation
+    transform[:3, 3] = target_center - rotation @ source_center
+    return transform
+
+
+def icp(source, target, scales=ICP_SCALES, max_iterations=ICP_MAX_ITERATIONS, tolerance=ICP_TOLERANCE,
+        reject_factor=ICP_REJECT_FACTOR, seed=0):
+    """
+    Rigidly register a point cloud onto another with multi-scale ICP.
+
+    The target is indexed once in a KD-tree. Each level runs point-to-point
+    ICP on a growing random subset of the source (``scales`` points), and
+    starts from the previous level's transform, initially the translation
+    between the centroids. Pairs further than ``reject_factor`` times the
+    median distance are left out of the fit. A level stops as soon as the
+    residual improves by less than ``tolerance`` (relative).
+
+    Args:
+        source (ndarray): (N, 3) points to move
+        target (ndarray): (M, 3) points to register onto
+        scales (list): Source points per level, coarse to fine
+        max_iterations (int): Iterations per level
+        tolerance (float): Relative residual change considered converged
+        reject_factor (float): Outlier rejection threshold, in median distances
+        seed (int): Seed of the source subsampling
+
+    Returns:
+        dict: 4x4 ``transform`` mapping source onto target, RMS
+            ``residual`` of the inlier pairs at the finest level,
+            ``iterations``, ``converged`` and ``seconds``
+    """
+    start = time.perf_counter()
+    transform = np.eye(4)
+    if len(source) == 0 or len(target) == 0:
+        return {"transform": transform, "residual": 0.0, "iterations": 0, "converged": False,
+                "seconds": time.perf_counter() - start}
+
+    tree = spatial.cKDTree(target)
+    order = np.random.default_rng(seed).permutation(len(source))
+    transform[:3, 3] = target.mean(axis=0) - source.mean(axis=0)
+    iterations = 0
+    converged = False
+    residual = 0.0
+
+    for points in sorted(int(points) for points in scales):
+        subset = source[order[:max(3, points)]]
+        previous = np.inf
+        converged = False
+        for _ in range(max_iterations):
+            moved = apply_transform(subset, transform)
+            distances, indices = tree.query(moved, workers=-1)
+            inliers = distances <= max(reject_factor * np.median(distances), 1e-9)
+            residual = float(np.sqrt(np.mean(distances[inliers] ** 2)))
+            iterations += 1
+            if np.isfinite(previous) and previous - residual <= tolerance * previous:
+                converged = True
+                break
+            previous = residual
+            transform = rigid_fit(moved[inliers], target[indices[inliers]]) @ transform
+
+    seconds = time.perf_counter() - start
+    logger.debug(f"ICP of {len(source)} onto {len(target)} points: residual {residual:.3f} "
+                 f"after {iterations} iterations in {seconds:.3f}s")
+    return {"transform": transform, "residual": residual, "iterations": iterations, "converged": converged,
+            "seconds": seconds}
@@ -0,0 +1,3 @@
+from .result_cache import *
+from .simulated_costs import *
+from .model_registry import *
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+import uuid
+from typing import List
+from dagster import (
+    ConfigurableResource,
+    InitResourceContext,
+    get_dagster_logger,
+)
+from ..constants import MODEL_WEIGHTS_DIR, MODEL_SPECS
+from ..segmentation import segment_batch, segment_streaming, segment_coarse_to_fine, coarse_disagreement
+from ..lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+
+logger = get_dagster_logger()
+
+# Models loaded by this process, shared by every asset and step it runs
+_LOADED_MODELS = {}
+_LOADED_MODELS_LOCK = threading.Lock()
+
+_PAGE_BYTES = 4096
+
+
+class SegmentationModel:
+    """
+    A segmentation model with memory-mapped weights.
+
+    The simulated model still thresholds the normalized intensities; the
+    weights stand in for a real network's parameters and are paged in on
+    warm-up. Pickling a model (e.g. to send it to a jaw worker process)
+    only sends its name, and the worker maps the weights itself.
+    """
+    def __init__(self, name, version, weights, positive_fraction, weights_dir):
+        """
+        Initialize a model from already mapped weights.
+
+        Use ModelRegistry.load (or load_model) to get one.
+
+        Args:
+            name (str): Model name, a key of MODEL_SPECS
+            version (str): Weights version
+            weights (ndarray): Memory-mapped weights
+            positive_fraction (float): Expected fraction of segmented voxels
+            weights_dir (str): Directory the weights were loaded from
+        """
+        self.name = name
+        self.version = version
+        self.weights = weights
+        self.positive_fraction = positive_fraction
+        self.weights_dir = weights_dir
+
+    def warm_up(self):
+        """Touch every page of the weights so the first inference does not fault them in"""
+        flat = self.weights.reshape(-1)
+        step = max(1, _PAGE_BYTES // flat.dtype.itemsize)
+        return float(flat[::step].sum())
+
+    def segment(self, scans):
+        """Segment several scans with a single vectorized call"""
+        return segment_batch(scans, self.positive_fraction)
+
+    def segment_streaming(self, scan, slab_size, halo=0, path=None):
+        """Segment one scan slab by slab"""
+        return segment_streaming(scan, self.positive_fraction, slab_size, halo, path)
+
+    def segment_coarse_to_fine(self, scan, factor, margin=1, slab_size=None, path=None):
+        """Segment one scan on its pyramid, refining only around the coarse boundary"""
+        if slab_size is None:
+            return segment_coarse_to_fine(scan, self.positive_fraction, factor, margin, path=path)
+        return segment_coarse_to_fine(scan, self.positive_fraction, factor, margin, slab_size, path)
+
+    def coarse_disagreement(self, scan, factor, coarse):
+        """Fraction of a sample of full resolution voxels a mask of the scan's ``factor`` level gets wrong"""
+        return coarse_disagreement(scan, self.positive_fraction, factor, coarse)
+
+    def __reduce__(self):
+        return load_model, (self.weights_dir, self.name)
+
+    def __repr__(self):
+        """String representation of the model"""
+        return f"SegmentationModel(name='{self.name}', version='{self.version}', weights={self.weights.nbytes} bytes)"
+
+
+def _weights_path(weights_dir, name, version):
+    return os.path.join(weights_dir, name, f"{version}.npy")
+
+
+def _create_placeholder_weights(path, weights_mb):
+    """Write deterministic placeholder weights until the trained ones are deployed"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp-{uuid.uuid4().hex}.npy"
+    count = weights_mb * 1024 * 1024 // 4
+    weights = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(count,))
+    rng = np.random.default_rng(0)
+    chunk = 1024 * 1024
+    for start in range(0, count, chunk):
+        stop = min(start + chunk, count)
+        weights[start:stop] = rng.standard_normal(stop - start, dtype=np.float32)
+    weights.flush()
+    del weights
+    os.replace(tmp_path, path)
+
+
+def load_model(weights_dir, name):
+    """Get a model, loading it on first use in this process"""
+    return _load_model(weights_dir, name)[0]
+
+
+def _load_model(weights_dir, name):
+    """Get a model with the seconds spent loading it and whether it was already loaded"""
+    if name not in MODEL_SPECS:
+        raise ValueError(f"Unknown model {name!r}, expected one of {sorted(MODEL_SPECS)}")
+    spec = MODEL_SPECS[name]
+    key = (weights_dir, name, spec["version"])
+    with _LOADED_MODELS_LOCK:
+        model = _LOADED_MODELS.get(key)
+        if model is not None:
+            return model, 0.0, True
+
+        start = time.perf_counter()
+        path = _weights_path(weights_dir, name, spec["version"])
+        if not os.path.exists(path):
+            logger.warning(f"No weights at {path}, creating placeholder weights for {name}")
+            _create_placeholder_weights(path, spec["weights_mb"])
+        weights = np.load(path, mmap_mode="r")
+        model = SegmentationModel(name, spec["version"], weights, spec["positive_fraction"], weights_dir)
+        _LOADED_MODELS[key] = model
+        seconds = time.perf_counter() - start
+        logger.debug(f"Loaded {model} in {seconds:.3f}s")
+        return model, seconds, False
+
+
+class ModelRegistry(ConfigurableResource):
+    """
+    Registry of the segmentation models.
+
+    Weights are memory-mapped and cached for the lifetime of the worker
+    process, so every asset and step running in it shares one copy (and
+    processes share the page cache). Models listed in ``preload`` are
+    loaded and warmed up when the resource is initialized.
+    """
+    weights_dir: str = MODEL_WEIGHTS_DIR
+    preload: List[str] = []
+
+    def setup_for_execution(self, context: InitResourceContext) -> None:
+        for name in self.preload:
+            model, _, _ = _load_model(self.weights_dir, name)
+            model.warm_up()
+
+    def load(self, name):
+        """
+        Get a model, loading it on first use in this process.
+
+        Args:
+            name (str): Model name, a key of MODEL_SPECS
+
+        Returns:
+            tuple: (SegmentationModel, metadata dict with the model version,
+                load time and whether it was already loaded)
+        """
+        model, seconds, cache_hit = _load_model(self.weights_dir, name)
+        return model, {
+            "model_version": f"{name}:{model.version}",
+            "model_load_seconds": seconds,
+            "model_cache_hit": cache_hit,
+        }
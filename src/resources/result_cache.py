@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import shutil
+from dagster import (
+    ConfigurableResource,
+    get_dagster_logger,
+)
+from ..constants import RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES, VOLUME_ARRAY_MIN_BYTES
+from ..io_managers.volume_io_manager import write_volume_object, read_volume_object
+from ..lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+
+logger = get_dagster_logger()
+
+
+def scan_fingerprint(scan):
+    """
+    Content hash of a scan's voxels and the metadata needed to interpret them.
+
+    Scans loaded through the VolumeIOManager reuse the digest recorded at
+    write time, so no voxel data is read. Other scans are hashed directly.
+
+    Args:
+        scan: DentalScan (or any object with a ``data`` array)
+
+    Returns:
+        str: Hex digest
+    """
+    fingerprint = hashlib.blake2b(digest_size=16)
+    ref = getattr(scan, "asset_ref", None)
+    if ref is not None and ref.content_hash is not None:
+        fingerprint.update(ref.content_hash.encode())
+    else:
+        fingerprint.update(np.ascontiguousarray(scan.data).data)
+    fingerprint.update(repr((
+        tuple(scan.data.shape),
+        str(scan.data.dtype),
+        getattr(scan, "scale", 1.0),
+        getattr(scan, "offset", 0.0),
+        getattr(scan, "value_range", None),
+    )).encode())
+    return fingerprint.hexdigest()
+
+
+class SegmentationCache(ConfigurableResource):
+    """
+    Content-addressed on-disk cache of segmentation results.
+
+    Entries are keyed by the hash of the input scan, the asset's code
+    version and the parameters that affect the result, so re-submitted
+    cases are answered without running the model again. Entries are stored
+    in the VolumeIOManager format and come back memory-mapped. The store is
+    bounded by ``max_bytes``; the least recently used entries are evicted
+    first.
+    """
+    base_dir: str = RESULT_CACHE_DIR
+    max_bytes: int = RESULT_CACHE_MAX_BYTES
+    enabled: bool = True
+
+    def key_for(self, context, scan, asset_key=None, **params):
+        """
+        Cache key of the result of the current asset for one scan.
+
+        Args:
+            context: The asset execution context, for the asset key and code version
+            scan: The input DentalScan
+            asset_key (AssetKey, optional): The output the result is for,
+                required for multi-assets
+            **params: Parameters affecting the result
+
+        Returns:
+            str: Hex digest
+        """
+        asset_key = context.asset_key if asset_key is None else asset_key
+        code_version = context.assets_def.code_versions_by_key.get(asset_key)
+        key = hashlib.blake2b(digest_size=16)
+        key.update(json.dumps({
+            "asset": asset_key.to_user_string(),
+            "code_version": code_version,
+            "params": params,
+            "input": scan_fingerprint(scan),
+        }, sort_keys=True, default=str).encode())
+        return key.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.base_dir, key)
+
+    def get(self, key):
+        """
+        Look up a cached value.
+
+        Returns:
+            The cached value, or None on a miss
+        """
+        if not self.enabled:
+            return None
+        path = self._entry_path(key)
+        try:
+            value = read_volume_object(path)
+        except (FileNotFoundError, EOFError):
+            return None
+        # Mark the entry as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        logger.debug(f"Result cache hit {key}")
+        return value
+
+    def put(self, key, value):
+        """Store a value and evict old entries beyond max_bytes"""
+        if not self.enabled:
+            return
+        write_volume_object(self._entry_path(key), value, VOLUME_ARRAY_MIN_BYTES)
+        self._evict(keep=key)
+
+    def _evict(self, keep=None):
+        """Remove least recently used entries until the store fits in max_bytes"""
+        entries = []
+        with os.scandir(self.base_dir) as scan:
+            for entry in scan:
+                if entry.is_dir() and "." not in entry.name:
+                    entries.append((entry.stat().st_mtime, entry.name, _tree_bytes(entry.path)))
+
+        total = sum(size for _, _, size in entries)
+        for _, name, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(self._entry_path(name), ignore_errors=True)
+            total -= size
+            logger.debug(f"Evicted result cache entry {name} ({size} bytes)")
+
+
+def _tree_bytes(path):
+    """Total size of the files under a directory"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file_name))
+            except FileNotFoundError:
+                pass
+    return total
@@ -0,0 +1,26 @@
+import time
+from dagster import (
+    ConfigurableResource,
+)
+from ..constants import SIMULATED_COST_SCALE
+
+
+class SimulatedCosts(ConfigurableResource):
+    """
+    Scale applied to the simulated processing times of the assets.
+
+    ``scale=0`` removes the simulated costs entirely, which leaves only the
+    pipeline's own overhead (data generation, serialization, orchestration)
+    for benchmarks to measure.
+    """
+    scale: float = SIMULATED_COST_SCALE
+
+    def wait(self, seconds):
+        """Simulate ``seconds`` of processing, scaled"""
+        simulate_cost(seconds, self.scale)
+
+
+def simulate_cost(seconds, scale=SIMULATED_COST_SCALE):
+    """Sleep for ``seconds * scale``; usable from worker processes, which get the scale as a float"""
+    if seconds * scale > 0:
+        time.sleep(seconds * scale)
@@ -0,0 +1,119 @@
+from dagster import (
+    Config,
+    get_dagster_logger,
+)
+from .constants import MASK_FILL_CHUNK_BYTES, ROI_CROPPING_ENABLED, ROI_PADDING_VOXELS
+from .compact_mask import CompactMask
+from .dental_scan import DentalScan
+from .voxel_grid import cropped_grid
+from .slabs import iter_slabs
+from .lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+
+logger = get_dagster_logger()
+
+
+class RoiConfig(Config):
+    """Run configuration for assets that crop their input to an upstream mask"""
+    roi_cropping: bool = ROI_CROPPING_ENABLED
+    roi_padding: int = ROI_PADDING_VOXELS  # Voxels added around the upstream mask's bounding box
+
+
+def _slab_size(shape):
+    """Planes along the first axis decoded at once, bounded by MASK_FILL_CHUNK_BYTES"""
+    plane_bytes = max(1, int(np.prod(shape[1:], dtype=np.int64)))
+    return max(1, MASK_FILL_CHUNK_BYTES // plane_bytes)
+
+
+def bounding_box(mask, padding=0):
+    """
+    Padded bounding box of the positive voxels of a mask.
+
+    Compact masks are decoded a few planes at a time.
+
+    Args:
+        mask: CompactMask or boolean ndarray
+        padding (int): Voxels added on every side, clipped to the volume
+
+    Returns:
+        tuple: One slice per axis, or None if the mask is empty
+    """
+    shape = tuple(int(dim) for dim in mask.shape)
+    if isinstance(mask, CompactMask) and mask.count() == 0:
+        return None
+    hits = [np.zeros(dim, dtype=bool) for dim in shape]
+    for core, _, _ in iter_slabs(shape[0], _slab_size(shape)):
+        block = np.asarray(mask[core], dtype=bool)
+        for axis in range(len(shape)):
+            other = tuple(index for index in range(len(shape)) if index != axis)
+            found = block.any(axis=other)
+            if axis == 0:
+                hits[0][core] = found
+            else:
+                hits[axis] |= found
+    if not hits[0].any():
+        return None
+    box = []
+    for axis_hits, dim in zip(hits, shape):
+        positive = np.flatnonzero(axis_hits)
+        box.append(slice(max(0, int(positive[0]) - padding), min(dim, int(positive[-1]) + 1 + padding)))
+    return tuple(box)
+
+
+def crop_ratio(shape, box):
+    """Fraction of the voxels of a volume of ``shape`` inside ``box``"""
+    total = int(np.prod(shape, dtype=np.int64))
+    if box is None or not total:
+        return 1.0
+    return int(np.prod([region.stop - region.start for region in box], dtype=np.int64)) / total
+
+
+def box_to_list(box):
+    """JSON-friendly [[start, stop], ...] form of a box"""
+    return None if box is None else [[region.start, region.stop] for region in box]
+
+
+def crop_scan(scan, box):
+    """
+    The part of a scan inside ``box``.
+
+    The cropped scan is a view of the scan's (possibly memory-mapped)
+    volume, with the same value mapping and physical position.
+    """
+    if box is None:
+        return scan
+    return DentalScan.from_stored(f"{scan.name}_roi", scan.scan_type, scan.data[box],
+                                  scan.scale, scan.offset, scan.value_range, *cropped_grid(scan, box))
+
+
+def paste_mask(shape, box, cropped, path=None):
+    """
+    Place a mask computed on a cropped volume back into the full volume.
+
+    Voxels outside ``box`` are negative. The full mask is assembled and
+    bit-packed slab by slab.
+
+    Args:
+        shape (tuple): Shape of the full volume
+        box (tuple): Slices the cropped mask was computed on, None for the full volume
+        cropped: CompactMask or boolean ndarray with the box's shape
+        path (str, optional): .npy file the packed mask is written to
+
+    Returns:
+        CompactMask: The mask in full-volume coordinates
+    """
+    shape = tuple(int(dim) for dim in shape)
+    if box is None:
+        box = tuple(slice(0, dim) for dim in shape)
+
+    def slabs():
+        for core, _, _ in iter_slabs(shape[0], _slab_size(shape)):
+            block = np.zeros((core.stop - core.start,) + shape[1:], dtype=bool)
+            start, stop = max(core.start, box[0].start), min(core.stop, box[0].stop)
+            if start < stop:
+                block[(slice(start - core.start, stop - core.start),) + box[1:]] = \
+                    cropped[start - box[0].start:stop - box[0].start]
+            yield block
+
+    return CompactMask.from_slabs(shape, slabs(), path=path)
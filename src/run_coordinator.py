@@ -0,0 +1,256 @@
+import time
+from collections import Counter
+from dagster import (
+    DagsterRunStatus,
+    Field,
+    IntSource,
+    QueuedRunCoordinator,
+    RunsFilter,
+    SubmitRunContext,
+    get_dagster_logger,
+)
+from .constants import (
+    RUN_COST_TAG,
+    RUN_MEMORY_BUDGET_MB,
+    RUN_CPU_BUDGET,
+    RUN_STARVATION_SECONDS,
+)
+from .partitions import patients_partitions
+from .run_costs import job_cost, parse_run_cost, run_cost_tags, scale_cost
+
+logger = get_dagster_logger()
+
+_BUDGET_FIELDS = ("memory_budget_mb", "cpu_budget", "starvation_seconds")
+
+# Run tags set by Dagster: the queue priority and the partition range of backfill runs
+PRIORITY_TAG = "dagster/priority"
+ASSET_PARTITION_RANGE_START_TAG = "dagster/asset_partition_range_start"
+ASSET_PARTITION_RANGE_END_TAG = "dagster/asset_partition_range_end"
+IN_PROGRESS_RUN_STATUSES = [DagsterRunStatus.STARTING, DagsterRunStatus.STARTED, DagsterRunStatus.CANCELING]
+
+class _TagLimitsCounter:
+    """
+    Runs holding each tag concurrency limit, counted like the daemon does.
+
+    A limit applies to a tag key whatever its value, to one value of a key,
+    or to each value of a key separately (``{"applyLimitPerUniqueValue": True}``).
+    """
+    def __init__(self, limits, in_progress):
+        self._key_limits = {}
+        self._value_limits = {}
+        self._unique_value_limits = {}
+        for limit in limits:
+            value = limit.get("value")
+            if isinstance(value, str):
+                self._value_limits[(limit["key"], value)] = limit["limit"]
+            elif value and value.get("applyLimitPerUniqueValue"):
+                self._unique_value_limits[limit["key"]] = limit["limit"]
+            else:
+                self._key_limits[limit["key"]] = limit["limit"]
+        self._counts = Counter()
+        for run in in_progress:
+            self.add(run)
+
+    def _limits(self, run):
+        """(counter, limit) of every limit applying to a run"""
+        for key, value in run.tags.items():
+            if key in self._key_limits:
+                yield ("key", key), self._key_limits[key]
+            if (key, value) in self._value_limits:
+                yield ("value", key, value), self._value_limits[(key, value)]
+            if key in self._unique_value_limits:
+                yield ("unique", key, value), self._unique_value_limits[key]
+
+    def is_blocked(self, run):
+        return any(self._counts[counter] >= limit for counter, limit in self._limits(run))
+
+    def add(self, run):
+        for counter, _ in self._limits(run):
+            self._counts[counter] += 1
+
+
+def _priority(run):
+    try:
+        return int(run.tags.get(PRIORITY_TAG, "0"))
+    except ValueError:
+        return 0
+
+
+def plan_admissions(queued, in_progress, memory_budget_mb, cpu_budget, max_runs=-1,
+                    static_limits=(), starvation_seconds=RUN_STARVATION_SECONDS, now=None):
+    """
+    Pick the queued runs to launch within a memory and CPU budget.
+
+    Queued runs are considered in the daemon's order (priority, then
+    first in first out). A run that does not fit in what is left of the
+    budget is skipped, and smaller runs behind it may still be admitted,
+    unless it has been queued for longer than ``starvation_seconds``: then
+    nothing behind it is admitted until it fits. A run larger than the
+    whole budget is admitted alone once nothing else is running. Runs
+    declaring no cost are left to the other limits.
+
+    Args:
+        queued (list): RunRecords of the queued runs, oldest first
+        in_progress (list): DagsterRuns currently in progress
+        memory_budget_mb (int): Memory shared by the runs in progress
+        cpu_budget (int): CPUs shared by the runs in progress
+        max_runs (int): Maximum runs in progress, -1 for no limit
+        static_limits (list): Tag concurrency limits configured on the coordinator
+        starvation_seconds (float): Queue time after which a run stops being skipped over
+        now (float, optional): Current timestamp
+
+    Returns:
+        list: The DagsterRuns to admit, in launch order
+    """
+    now = time.time() if now is None else now
+    used_memory = used_cpus = 0
+    for run in in_progress:
+        cost = parse_run_cost(run.tags)
+        if cost is not None:
+            used_memory += cost[0]
+            used_cpus += cost[1]
+    running = len(in_progress)
+    counter = _TagLimitsCounter(static_limits, in_progress)
+
+    admitted = []
+    records = sorted(queued, key=lambda record: -_priority(record.dagster_run))
+    for record in records:
+        if max_runs != -1 and running >= max_runs:
+            break
+        run = record.dagster_run
+        if counter.is_blocked(run):
+            continue
+        cost = parse_run_cost(run.tags)
+        if cost is not None:
+            memory_mb, cpus = cost
+            idle = running == 0
+            fits = used_memory + memory_mb <= memory_budget_mb and used_cpus + cpus <= cpu_budget
+            if not (fits or idle):
+                if starvation_seconds is not None and now - record.create_timestamp.timestamp() > starvation_seconds:
+                    # Hold the budget for this run rather than starve it
+                    break
+                continue
+            used_memory += memory_mb
+            used_cpus += cpus
+        counter.add(run)
+        admitted.append(run)
+        running += 1
+    return admitted
+
+
+class BudgetedRunCoordinator(QueuedRunCoordinator):
+    """
+    Queued run coordinator admitting runs against a memory and CPU budget.
+
+    Runs declare their estimated peak memory and CPUs in their tags (see
+    run_costs); runs submitted without them, e.g. by asset backfills, are
+    tagged on submission from their asset selection and partition range.
+    On every dequeue iteration the daemon asks for the queue config, and
+    this coordinator plans which queued runs fit in what the runs in
+    progress leave of the budget. The plan is handed to the daemon as a
+    tag concurrency limit per cost value, so the daemon launches exactly
+    the planned runs and skips the others.
+
+    Configured in dagster.yaml like QueuedRunCoordinator, with
+    ``memory_budget_mb``, ``cpu_budget`` and ``starvation_seconds`` on top.
+    """
+    def __init__(self, memory_budget_mb=None, cpu_budget=None, starvation_seconds=None, **kwargs):
+        super().__init__(**kwargs)
+        self.memory_budget_mb = RUN_MEMORY_BUDGET_MB if memory_budget_mb is None else memory_budget_mb
+        self.cpu_budget = RUN_CPU_BUDGET if cpu_budget is None else cpu_budget
+        self.starvation_seconds = RUN_STARVATION_SECONDS if starvation_seconds is None else starvation_seconds
+
+    @classmethod
+    def config_type(cls):
+        return {
+            **super().config_type(),
+            "memory_budget_mb": Field(IntSource, is_required=False,
+                                      description="Memory shared by the runs in progress, in MB"),
+            "cpu_budget": Field(IntSource, is_required=False,
+                                description="CPUs shared by the runs in progress"),
+            "starvation_seconds": Field(IntSource, is_required=False,
+                                        description="Queue time after which a run is no longer skipped over"),
+        }
+
+    @classmethod
+    def from_config_value(cls, inst_data, config_value):
+        budget = {key: config_value.get(key) for key in _BUDGET_FIELDS}
+        queue_config = {key: value for key, value in config_value.items() if key not in _BUDGET_FIELDS}
+        coordinator = super().from_config_value(inst_data, queue_config)
+        coordinator.memory_budget_mb = budget["memory_budget_mb"] or coordinator.memory_budget_mb
+        coordinator.cpu_budget = budget["cpu_budget"] or coordinator.cpu_budget
+        if budget["starvation_seconds"] is not None:
+            coordinator.starvation_seconds = budget["starvation_seconds"]
+        return coordinator
+
+    def submit_run(self, context: SubmitRunContext):
+        self._tag_run_cost(context.dagster_run)
+        return super().submit_run(context)
+
+    def _tag_run_cost(self, run):
+        """
+        Declare the cost of runs narrower than their job, covering several partitions, or submitted without one.
+
+        Runs inherit the cost their job declares for its whole selection. A
+        run selecting a strict subset of it, e.g. the jaws a sensor narrowed
+        it down to, costs what its own selection does. That is never more
+        than the job's cost, which stays the bound when the recomputed one
+        is larger (jobs declaring their cost under a concurrency limit).
+        """
+        declared = parse_run_cost(run.tags)
+        cost = declared
+        if run.asset_selection:
+            selected = job_cost([key.to_user_string() for key in run.asset_selection])
+            cost = selected if declared is None else tuple(map(min, selected, declared))
+        if cost is None:
+            return
+        memory_mb, cpus = scale_cost(*cost, self._partition_count(run))
+        if (memory_mb, cpus) != declared:
+            self._instance.add_run_tags(run.run_id, run_cost_tags(memory_mb, cpus))
+
+    def _partition_count(self, run):
+        """Number of partitions in a run's partition range, 1 for single-partition runs"""
+        start = run.tags.get(ASSET_PARTITION_RANGE_START_TAG)
+        end = run.tags.get(ASSET_PARTITION_RANGE_END_TAG)
+        if start is None or end is None or start == end:
+            return 1
+        keys = self._instance.get_dynamic_partitions(patients_partitions.name)
+        try:
+            return keys.index(end) - keys.index(start) + 1
+        except ValueError:
+            return 1
+
+    def get_run_queue_config(self):
+        queue_config = super().get_run_queue_config()
+        try:
+            limits = self._budget_limits(queue_config)
+        except Exception:
+            logger.exception("Failed to plan run admissions, falling back to the static limits")
+            return queue_config
+        return queue_config._replace(tag_concurrency_limits=list(queue_config.tag_concurrency_limits) + limits)
+
+    def _budget_limits(self, queue_config):
+        """Tag concurrency limits letting through exactly the runs that fit in the budget"""
+        instance = self._instance
+        queued = instance.get_run_records(RunsFilter(statuses=[DagsterRunStatus.QUEUED]), ascending=True)
+        if not queued:
+            return []
+        in_progress = [record.dagster_run for record in
+                       instance.get_run_records(RunsFilter(statuses=IN_PROGRESS_RUN_STATUSES))]
+        admitted = plan_admissions(
+            queued,
+            in_progress,
+            self.memory_budget_mb,
+            self.cpu_budget,
+            queue_config.max_concurrent_runs,
+            queue_config.tag_concurrency_limits,
+            self.starvation_seconds,
+        )
+        # Runs with the same cost value are admitted in queue order, so a
+        # per-value limit selects the same runs as the plan
+        running = Counter(run.tags.get(RUN_COST_TAG) for run in in_progress)
+        planned = Counter(run.tags.get(RUN_COST_TAG) for run in admitted)
+        values = {record.dagster_run.tags.get(RUN_COST_TAG) for record in queued} - {None}
+        logger.debug(f"Admitting {len(admitted)} of {len(queued)} queued runs within "
+                     f"{self.memory_budget_mb}MB and {self.cpu_budget} CPUs")
+        return [{"key": RUN_COST_TAG, "value": value, "limit": running[value] + planned[value]} for value in values]
@@ -0,0 +1,137 @@
+import math
+from .constants import (
+    CBCT_DIMENSIONS,
+    CBCT_JAWS,
+    IOS_DIMENSIONS,
+    RUN_MEMORY_TAG,
+    RUN_CPUS_TAG,
+    RUN_COST_TAG,
+    RUN_BASE_MEMORY_MB,
+    SEGMENTATION_BATCH_SIZE,
+)
+
+# Input volumes the estimates are derived from
+VOLUME_DIMENSIONS = {
+    "ios": IOS_DIMENSIONS,
+    "cbct": CBCT_DIMENSIONS,
+}
+
+# Estimated peak memory and CPUs of each asset's step. ``bytes_per_voxel``
+# is per voxel of each of the ``volumes`` input volumes it holds at once
+# (e.g. the int16 volume, its float32 normalization and the boolean mask
+# of both jaws for the teeth segmentation). Compare with the peak_rss_mb
+# recorded in the asset metrics when the pipeline changes. ``per_jaw``
+# steps have one asset per jaw, and cost a share of the estimate per jaw
+# selected.
+ASSET_COSTS = {
+    "ios_scan_data": {"volume": "ios", "volumes": 1, "bytes_per_voxel": 3.0, "cpus": 1},
+    "ios_segmentation": {"volume": "ios", "volumes": 1, "bytes_per_voxel": 7.0, "cpus": 1},
+    "cbct_scan_data": {"volume": "cbct", "volumes": 2, "bytes_per_voxel": 3.0, "cpus": 2, "per_jaw": True},
+    "cbct_teeth_preview": {"volume": "cbct", "volumes": 2, "bytes_per_voxel": 0.5, "cpus": 1, "per_jaw": True},
+    "cbct_teeth_segmentation": {"volume": "cbct", "volumes": 2, "bytes_per_voxel": 7.0, "cpus": 2, "per_jaw": True},
+    "cbct_gum_detection": {"volume": "cbct", "volumes": 2, "bytes_per_voxel": 3.0, "cpus": 2, "per_jaw": True},
+    "cbct_nerve_detection": {"volume": "cbct", "volumes": 1, "bytes_per_voxel": 3.0, "cpus": 1},
+    "aligned_model": {"volume": "cbct", "volumes": 2, "bytes_per_voxel": 2.0, "cpus": 2},
+    "crown_design": {"volume": "ios", "volumes": 1, "bytes_per_voxel": 2.0, "cpus": 1},
+}
+
+
+def asset_cost(asset_name, dimensions=None, jaws=None):
+    """
+    Estimated peak memory and CPUs of one asset's step.
+
+    Args:
+        asset_name (str): Key of ASSET_COSTS
+        dimensions (tuple, optional): Input volume dimensions, instead of
+            the configured CBCT or IOS ones
+        jaws (int, optional): Jaws selected of a per-jaw step, all of them if None
+
+    Returns:
+        tuple: (memory in MB, CPUs)
+    """
+    cost = ASSET_COSTS[asset_name]
+    voxels = math.prod(dimensions or VOLUME_DIMENSIONS[cost["volume"]])
+    memory_mb = voxels * cost["volumes"] * cost["bytes_per_voxel"] / (1024 * 1024)
+    cpus = cost["cpus"]
+    if cost.get("per_jaw") and jaws is not None:
+        share = min(jaws, len(CBCT_JAWS)) / len(CBCT_JAWS)
+        memory_mb *= share
+        cpus = max(1, int(math.ceil(cpus * share)))
+    return int(math.ceil(memory_mb)), cpus
+
+
+def asset_cost_metadata(asset_name, jaws=None):
+    """Asset definition metadata declaring the estimated cost of the asset"""
+    memory_mb, cpus = asset_cost(asset_name, jaws=jaws)
+    return {"estimated_memory_mb": memory_mb, "estimated_cpus": cpus}
+
+
+def _step_jaws(asset_names):
+    """
+    Jaws selected of each step, from asset names or keys.
+
+    Per-jaw keys like "cbct_scan_data/upper_jaw" count towards their step;
+    a bare step name selects all of its jaws (None).
+    """
+    steps = {}
+    for name in asset_names:
+        step, _, jaw = name.partition("/")
+        if step not in ASSET_COSTS:
+            continue
+        if not jaw or steps.get(step, 0) is None:
+            steps[step] = None
+        else:
+            steps[step] = steps.get(step, 0) + 1
+    return steps
+
+
+def job_cost(asset_names, max_concurrent=None, partitions=1):
+    """
+    Estimated peak memory and CPUs of a run materializing ``asset_names``.
+
+    Up to ``max_concurrent`` steps are assumed to run at once (all of them
+    if None), the most expensive ones. Runs covering several partitions
+    hold up to SEGMENTATION_BATCH_SIZE of them at once.
+
+    Returns:
+        tuple: (memory in MB, CPUs)
+    """
+    costs = sorted((asset_cost(step, jaws=jaws) for step, jaws in _step_jaws(asset_names).items()), reverse=True)
+    if max_concurrent is not None:
+        costs = costs[:max(1, max_concurrent)]
+    memory_mb = RUN_BASE_MEMORY_MB + sum(memory for memory, _ in costs)
+    cpus = max(1, sum(cpus for _, cpus in costs))
+    return scale_cost(memory_mb, cpus, partitions)
+
+
+def scale_cost(memory_mb, cpus, partitions):
+    """Cost of a run covering ``partitions`` partitions, from its single-partition cost"""
+    scale = max(1, min(int(partitions), SEGMENTATION_BATCH_SIZE))
+    return RUN_BASE_MEMORY_MB + scale * max(0, memory_mb - RUN_BASE_MEMORY_MB), cpus
+
+
+def run_cost_tags(memory_mb, cpus):
+    """Run tags declaring a run's estimated cost"""
+    return {
+        RUN_MEMORY_TAG: str(int(memory_mb)),
+        RUN_CPUS_TAG: str(int(cpus)),
+        RUN_COST_TAG: f"{int(memory_mb)}mb_{int(cpus)}cpu",
+    }
+
+
+def job_cost_tags(asset_names, max_concurrent=None):
+    """Run tags declaring the estimated cost of a job materializing ``asset_names``"""
+    return run_cost_tags(*job_cost(asset_names, max_concurrent))
+
+
+def parse_run_cost(tags):
+    """
+    The estimated cost declared by a run's tags.
+
+    Returns:
+        tuple: (memory in MB, CPUs), or None if the run declares no cost
+    """
+    try:
+        return int(tags[RUN_MEMORY_TAG]), int(tags[RUN_CPUS_TAG])
+    except (KeyError, ValueError):
+        return None
@@ -1,7 +1,9 @@
-import numpy as np
 from dagster import (
     get_dagster_logger,
 )
+from .lazy_imports import lazy_import
+
+np = lazy_import("numpy")
 
 logger = get_dagster_logger()
 
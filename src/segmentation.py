@@ -0,0 +1,228 @@
+from dagster import (
+    Config,
+    get_dagster_logger,
+)
+from .constants import (
+    COARSE_CHECK_CELLS,
+    COARSE_CHECK_TOLERANCE,
+    SEGMENTATION_BATCH_SIZE,
+    STREAMING_SLAB_SIZE,
+)
+from .compact_mask import CompactMask
+from .slabs import map_slabs
+from .lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+ndimage = lazy_import("scipy.ndimage")
+
+logger = get_dagster_logger()
+
+
+class SegmentationBatchConfig(Config):
+    """Run configuration shared by the batched segmentation assets"""
+    batch_size: int = SEGMENTATION_BATCH_SIZE  # Scans per vectorized model call
+
+
+def stack_volumes(scans, dtype="float32"):
+    """
+    Stack the normalized volumes of several scans into one batch array.
+
+    Scans of different dimensions are zero-padded to the largest extent
+    along each axis.
+
+    Args:
+        scans (list): DentalScan objects to stack
+        dtype: Float dtype of the batch
+
+    Returns:
+        ndarray: Array of shape (len(scans), X, Y, Z)
+    """
+    shape = tuple(max(scan.data.shape[axis] for scan in scans) for axis in range(3))
+    batch = np.zeros((len(scans),) + shape, dtype=dtype)
+    for index, scan in enumerate(scans):
+        batch[(index,) + _extent(scan.data.shape)] = scan.normalized(dtype)
+    return batch
+
+
+def segment_batch(scans, positive_fraction):
+    """
+    Segment several scans with a single vectorized call.
+
+    The simulated model thresholds the normalized intensities so that about
+    ``positive_fraction`` of the voxels of a uniformly distributed scan are
+    segmented. Padding is zero and is never segmented.
+
+    Args:
+        scans (list): DentalScan objects to segment
+        positive_fraction (float): Expected fraction of segmented voxels
+
+    Returns:
+        list: One boolean mask per scan, with the scan's own dimensions
+    """
+    if not scans:
+        return []
+    batch = stack_volumes(scans)
+    logger.debug(f"Segmenting batch of {len(scans)} scans with shape {batch.shape}")
+    masks = batch > (1.0 - positive_fraction)
+    return [masks[(index,) + _extent(scan.data.shape)] for index, scan in enumerate(scans)]
+
+
+def segment_streaming(scan, positive_fraction, slab_size, halo=0, path=None):
+    """
+    Segment one scan slab by slab, with bounded peak memory.
+
+    Each slab is read with ``halo`` planes of context on both sides, the
+    model runs on the padded slab and only the core planes of its output are
+    kept. The mask is bit-packed as the slabs arrive.
+
+    Args:
+        scan: DentalScan to segment
+        positive_fraction (float): Expected fraction of segmented voxels
+        slab_size (int): Planes per slab along the first axis
+        halo (int): Planes of context on each side of a slab
+        path (str, optional): .npy file the packed mask is written to
+
+    Returns:
+        CompactMask: The segmentation mask
+    """
+    threshold = 1.0 - positive_fraction
+    slabs = map_slabs(
+        lambda planes: scan.normalized(region=planes),
+        scan.data.shape[0],
+        lambda block: block > threshold,
+        slab_size,
+        halo,
+    )
+    return CompactMask.from_slabs(scan.data.shape, slabs, path=path)
+
+
+def coarse_disagreement(scan, positive_fraction, factor, coarse, where=None, cells=COARSE_CHECK_CELLS):
+    """
+    Fraction of full resolution decisions a coarse mask gets wrong.
+
+    Averaging a noisy volume pulls its values towards the mean, so a coarse
+    level may segment far fewer (or more) voxels than the scan itself, and
+    even have no boundary at all. A fixed sample of coarse voxels is
+    segmented again at full resolution and compared with the coarse mask.
+
+    Args:
+        scan: DentalScan the coarse mask was computed from
+        positive_fraction (float): Expected fraction of segmented voxels
+        factor (int): Downsampling factor of the coarse mask
+        coarse (ndarray): Boolean mask of the ``factor`` level
+        where (ndarray, optional): Coarse voxels to sample from, all by default
+        cells (int): Number of coarse voxels sampled
+
+    Returns:
+        float: Fraction of the sampled full resolution voxels that disagree
+    """
+    candidates = np.argwhere(np.ones(coarse.shape, dtype=bool) if where is None else where)
+    if not len(candidates):
+        return 0.0
+    # A fixed seed keeps the check, and the decision it leads to, reproducible
+    rng = np.random.default_rng(0)
+    sample = candidates[rng.choice(len(candidates), size=min(int(cells), len(candidates)), replace=False)]
+    z, y, x = _cell_voxels(sample, factor, scan.data.shape).reshape(-1, 3).T
+    fine = scan.normalize(scan.data[z, y, x]) > (1.0 - positive_fraction)
+    expected = np.repeat(coarse[tuple(sample.T)], factor ** 3)
+    return float(np.mean(fine != expected))
+
+
+def segment_coarse_to_fine(scan, positive_fraction, factor, margin=1, slab_size=STREAMING_SLAB_SIZE, path=None,
+                           tolerance=COARSE_CHECK_TOLERANCE):
+    """
+    Segment one scan at low resolution, refining only around the boundary.
+
+    The model first runs on the ``factor`` level of the scan's pyramid.
+    Coarse voxels within ``margin`` of the coarse boundary are uncertain:
+    only the full resolution voxels they cover are gathered and segmented
+    again, the others take the coarse decision. The mask is assembled and
+    bit-packed slab by slab.
+
+    The result only matches full resolution when the scan is smooth at the
+    coarse scale. A sample of the coarse voxels taking the coarse decision
+    is checked first (see coarse_disagreement); when more than
+    ``tolerance`` of their voxels disagree, e.g. on noise, the whole scan
+    is segmented at full resolution instead.
+
+    Args:
+        scan: DentalScan to segment
+        positive_fraction (float): Expected fraction of segmented voxels
+        factor (int): Downsampling factor of the coarse pass
+        margin (int): Coarse voxels refined on each side of the boundary
+        slab_size (int): Full resolution planes assembled at once
+        path (str, optional): .npy file the packed mask is written to
+        tolerance (float): Disagreement above which the coarse pass is not used
+
+    Returns:
+        tuple: (CompactMask, fraction of the voxels segmented at full resolution)
+    """
+    threshold = 1.0 - positive_fraction
+    shape = tuple(int(dim) for dim in scan.data.shape)
+    coarse = scan.level(factor).normalized() > threshold
+
+    # The border of the volume is not a boundary: outside counts as unchanged
+    structure = np.ones((3, 3, 3), dtype=bool)
+    iterations = max(1, int(margin))
+    uncertain = (
+        ndimage.binary_dilation(coarse, structure, iterations=iterations)
+        & ~ndimage.binary_erosion(coarse, structure, iterations=iterations, border_value=1)
+    )
+    disagreement = coarse_disagreement(scan, positive_fraction, factor, coarse, where=~uncertain)
+    if disagreement > tolerance:
+        logger.warning(
+            f"Coarse {factor}x pass of {scan.name} disagrees with full resolution on {disagreement:.1%} of the "
+            f"checked voxels, segmenting it at full resolution"
+        )
+        return segment_streaming(scan, positive_fraction, slab_size, path=path), 1.0
+
+    limits = np.array(shape)
+    refined = []
+
+    def slabs():
+        step = max(1, slab_size // factor)
+        for start in range(0, coarse.shape[0], step):
+            stop = min(start + step, coarse.shape[0])
+            first, last = start * factor, min(stop * factor, shape[0])
+            block = coarse[start:stop]
+            for axis, size in enumerate((last - first,) + shape[1:]):
+                block = np.repeat(block, factor, axis=axis)[(slice(None),) * axis + (slice(0, size),)]
+
+            cells = np.argwhere(uncertain[start:stop]) + [start, 0, 0]
+            if len(cells):
+                z, y, x = _cell_voxels(cells, factor, shape).reshape(-1, 3).T
+                block[z - first, y, x] = scan.normalize(scan.data[z, y, x]) > threshold
+                covered = np.minimum(factor, limits - cells * factor)
+                refined.append(int(covered.prod(axis=1).sum()))
+            yield block
+
+    mask = CompactMask.from_slabs(shape, slabs(), path=path)
+    total = int(np.prod(shape, dtype=np.int64))
+    return mask, (sum(refined) / total if total else 0.0)
+
+
+def iter_batches(items, batch_size):
+    """Split a list into consecutive batches of at most batch_size items"""
+    batch_size = max(1, int(batch_size))
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+def _cell_voxels(cells, factor, shape):
+    """
+    Full resolution voxels covered by coarse voxels.
+
+    Border cells cover fewer voxels: their clipped voxels repeat the last one.
+
+    Returns:
+        ndarray: (len(cells), factor ** 3, 3) voxel indices
+    """
+    offsets = np.indices((factor,) * 3).reshape(3, -1).T
+    voxels = cells[:, None, :] * factor + offsets
+    np.minimum(voxels, np.array(shape) - 1, out=voxels)
+    return voxels
+
+
+def _extent(shape):
+    """Slices selecting a volume of the given shape from the start of a padded array"""
+    return tuple(slice(0, size) for size in shape)
@@ -1,7 +1,13 @@
-import numpy as np
 from dagster import (
     get_dagster_logger,
 )
+from .compact_mask import CompactMask
+from .constants import MASK_FILL_CHUNK_BYTES
+from .slabs import iter_slabs
+from .voxel_grid import voxel_grid
+from .lazy_imports import lazy_import
+
+np = lazy_import("numpy")
 
 logger = get_dagster_logger()
 
@@ -9,7 +15,7 @@ class SegmentationResult:
     """
     A simple class to represent segmentation results.
     """
-    def __init__(self, name, source_scan, segmented_data=None):
+    def __init__(self, name, source_scan, segmented_data=None, positive_fraction=0.3, mask_path=None, rng=None):
         """
         Initialize a segmentation result.
 
@@ -17,9 +23,20 @@ class SegmentationResult:
             name (str): Name/identifier of the segmentation
             source_scan: The source dental scan that was segmented
             segmented_data (ndarray, optional): Pre-computed segmentation mask
+            positive_fraction (float): Fraction of segmented voxels in a simulated mask
+            mask_path (str, optional): .npy file the simulated mask is streamed to
+            rng (np.random.Generator, optional): Stream the simulated mask is
+                drawn from, a fresh unseeded generator by default
+
+        The mask is stored as a CompactMask; dense masks assigned to
+        ``data`` are encoded automatically. The voxel grid (``spacing``
+        and ``origin``, in mm) is the source scan's.
         """
         self.name = name
-        self.source_scan = source_scan
+        self.spacing, self.origin = voxel_grid(source_scan)
+        # Scans loaded through the VolumeIOManager are persisted as a reference
+        self.source_ref = getattr(source_scan, "asset_ref", None)
+        self._source_scan = source_scan
 
         # Handle the case where source_scan might not be a DentalScan
         try:
@@ -40,26 +57,43 @@ class SegmentationResult:
                 # Try to get shape from source scan
                 if hasattr(source_scan, 'data') and isinstance(source_scan.data, np.ndarray):
                     # Simulate segmentation with a boolean mask
-                    self.data = np.random.choice(
-                        [True, False],
-                        size=source_scan.data.shape,
-                        p=[0.3, 0.7]  # 30% of voxels are segmented
-                    )
+                    self.data = _simulated_mask(source_scan.data.shape, positive_fraction, mask_path, rng)
                 else:
                     # Fallback to default shape
-                    self.data = np.random.choice(
-                        [True, False],
-                        size=source_shape,
-                        p=[0.3, 0.7]
-                    )
+                    self.data = _simulated_mask(source_shape, positive_fraction, mask_path, rng)
                 logger.debug(f"Created segmentation mask with shape {self.data.shape}")
             except Exception as e:
                 logger.error(f"Error creating segmentation mask: {str(e)}")
                 # Create a small default array as fallback
-                self.data = np.random.choice([True, False], size=(10, 10, 10), p=[0.3, 0.7])
+                self.data = _simulated_mask((10, 10, 10), positive_fraction, rng=rng)
         else:
             self.data = segmented_data
 
+    @property
+    def data(self):
+        """The segmentation mask, as a CompactMask"""
+        return self._data
+
+    @data.setter
+    def data(self, mask):
+        if not isinstance(mask, CompactMask):
+            mask = CompactMask.from_dense(mask)
+        self._data = mask
+
+    @property
+    def source_scan(self):
+        """The source dental scan, re-hydrated from its reference on first access"""
+        if self._source_scan is None and self.source_ref is not None:
+            self._source_scan = self.source_ref.load()
+        return self._source_scan
+
+    def __getstate__(self):
+        """Drop the source scan from the pickled state when it can be re-hydrated"""
+        state = self.__dict__.copy()
+        if state.get("source_ref") is not None:
+            state["_source_scan"] = None
+        return state
+
     def get_source_name(self):
         """Get the name of the source scan, with error handling"""
         try:
@@ -72,4 +106,23 @@ class SegmentationResult:
     def __repr__(self):
         """String representation of the segmentation result"""
         source_name = self.get_source_name()
-        return f"SegmentationResult(name='{self.name}', source='{source_name}')"
\ No newline at end of file
+        return f"SegmentationResult(name='{self.name}', source='{source_name}')"
+
+
+def _simulated_mask(shape, positive_fraction, path=None, rng=None):
+    """
+    Random mask with about ``positive_fraction`` positive voxels.
+
+    Uniform float32 samples from ``rng`` are thresholded at
+    ``positive_fraction``. The mask is generated and bit-packed a few
+    planes at a time, so the temporaries stay under MASK_FILL_CHUNK_BYTES
+    whatever the volume size.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    plane_bytes = max(1, int(np.prod(shape[1:], dtype=np.int64)) * 4)
+    slab_size = max(1, MASK_FILL_CHUNK_BYTES // plane_bytes)
+    slabs = (
+        rng.random((core.stop - core.start,) + tuple(shape[1:]), dtype=np.float32) < positive_fraction
+        for core, _, _ in iter_slabs(shape[0], slab_size)
+    )
+    return CompactMask.from_slabs(shape, slabs, path=path)
@@ -1,4 +1,5 @@
 from .cbct_sensors import *
 from .ios_sensors import *
 from .alignment_sensors import *
-from .crown_design_sensors import *
\ No newline at end of file
+from .crown_design_sensors import *
+from .patient_sensors import *
@@ -1,7 +1,11 @@
-from dagster import multi_asset_sensor, DefaultSensorStatus, AssetKey, RunRequest
+from dagster import multi_asset_sensor, DefaultSensorStatus, AssetKey
+from .utils import complete_partition_run_requests
 
+# The lower jaw's CBCT chain ends with the nerve detection, the upper
+# jaw's with its gum detection
 @multi_asset_sensor(
   monitored_assets=[
+    AssetKey(["cbct_gum_detection", "upper_jaw"]),
     AssetKey("cbct_nerve_detection"),
     AssetKey("ios_segmentation")
   ],
@@ -9,8 +13,5 @@ from dagster import multi_asset_sensor, DefaultSensorStatus, AssetKey, RunReques
   default_status=DefaultSensorStatus.RUNNING,
 )
 def alignment_sensor(context):
-  asset_events = context.latest_materialization_records_by_key()
-  if any(asset_events.values()):
-      context.advance_all_cursors()
-      return RunRequest(run_key=context.cursor, run_config={})
-  return None
\ No newline at end of file
+  """Run alignment_job once per case, when all monitored upstreams were rematerialized"""
+  return complete_partition_run_requests(context)
\ No newline at end of file
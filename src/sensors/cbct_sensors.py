@@ -1,26 +1,36 @@
-from dagster import asset_sensor, DefaultSensorStatus, AssetKey, RunRequest
+from dagster import multi_asset_sensor, DefaultSensorStatus, AssetKey
+from ..constants import CBCT_JAWS
+from ..jaw_assets import jaw_keys
+from .utils import jaw_run_requests
 
-@asset_sensor(
-  asset_key=AssetKey("cbct_scan_data"),
+scan_keys = jaw_keys("cbct_scan_data")
+preview_keys = jaw_keys("cbct_teeth_preview")
+teeth_keys = jaw_keys("cbct_teeth_segmentation")
+gum_keys = jaw_keys("cbct_gum_detection")
+
+@multi_asset_sensor(
+  monitored_assets=list(scan_keys.values()),
   job_name="cbct_teeth_seg_job",
   default_status=DefaultSensorStatus.RUNNING,
 )
-def cbct_scan_data_sensor():
-  print("Running test_sensor...")
-  return RunRequest()
+def cbct_scan_data_sensor(context):
+  """Segment the teeth of the jaws whose scan was rematerialized"""
+  return jaw_run_requests(context, {scan_keys[jaw]: [preview_keys[jaw], teeth_keys[jaw]] for jaw in CBCT_JAWS})
 
-@asset_sensor(
-  asset_key=AssetKey("cbct_teeth_segmentation"),
+@multi_asset_sensor(
+  monitored_assets=list(teeth_keys.values()),
   job_name="cbct_gum_seg_job",
   default_status=DefaultSensorStatus.RUNNING,
 )
-def cbct_teeth_seg_sensor():
-  return RunRequest()
+def cbct_teeth_seg_sensor(context):
+  """Detect the gums of the jaws whose teeth segmentation was rematerialized"""
+  return jaw_run_requests(context, {teeth_keys[jaw]: [gum_keys[jaw]] for jaw in CBCT_JAWS})
 
-@asset_sensor(
-  asset_key=AssetKey("cbct_gum_detection"),
+@multi_asset_sensor(
+  monitored_assets=[gum_keys["lower_jaw"]],
   job_name="cbct_nerve_seg_job",
   default_status=DefaultSensorStatus.RUNNING,
 )
-def cbct_gum_seg_sensor():
-  return RunRequest()
\ No newline at end of file
+def cbct_gum_seg_sensor(context):
+  """Detect the nerves once the lower jaw's gums were rematerialized"""
+  return jaw_run_requests(context, {gum_keys["lower_jaw"]: [AssetKey("cbct_nerve_detection")]})
@@ -1,16 +1,15 @@
-from dagster import multi_asset_sensor, DefaultSensorStatus, AssetKey, RunRequest
+from dagster import multi_asset_sensor, DefaultSensorStatus, AssetKey
+from .utils import complete_partition_run_requests
 
 @multi_asset_sensor(
   monitored_assets=[
-    AssetKey("cbct_teeth_segmentation"),
+    AssetKey(["cbct_teeth_segmentation", "upper_jaw"]),
+    AssetKey(["cbct_teeth_segmentation", "lower_jaw"]),
     AssetKey("ios_segmentation")
   ],
   job_name="crown_design_job",
   default_status=DefaultSensorStatus.RUNNING,
 )
 def crown_design_sensor(context):
-  asset_events = context.latest_materialization_records_by_key()
-  if any(asset_events.values()):
-      context.advance_all_cursors()
-      return RunRequest(run_key=context.cursor, run_config={})
-  return None
\ No newline at end of file
+  """Run crown_design_job once per case, when all monitored upstreams were rematerialized"""
+  return complete_partition_run_requests(context)
\ No newline at end of file
@@ -1,9 +1,12 @@
-from dagster import asset_sensor, DefaultSensorStatus, AssetKey, RunRequest
+from dagster import asset_sensor, DefaultSensorStatus, AssetKey, SkipReason
+from .utils import is_fast_path_run, partition_run_request
 
 @asset_sensor(
   asset_key=AssetKey("ios_scan_data"),
   job_name="ios_seg_job",
   default_status=DefaultSensorStatus.RUNNING,
 )
-def ios_scan_data_sensor():
-  return RunRequest()
\ No newline at end of file
+def ios_scan_data_sensor(context, asset_event):
+  if is_fast_path_run(context.instance, asset_event.run_id):
+      return SkipReason("Materialized by a fast path run")
+  return partition_run_request(asset_event)
@@ -0,0 +1,55 @@
+import os
+from dagster import sensor, DefaultSensorStatus, RunRequest, SensorResult, SkipReason
+from ..constants import (
+  PATIENT_INTAKE_DIR,
+  EXECUTION_MODE_TAG,
+  FAST_PATH_MODE,
+  NEW_CASE_EXECUTION_MODE,
+)
+from ..partitions import patients_partitions
+from ..jobs import starting_job, patient_fast_path_job
+
+@sensor(
+  jobs=[starting_job, patient_fast_path_job],
+  default_status=DefaultSensorStatus.RUNNING,
+)
+def new_patient_sensor(context):
+  """
+  Register a patient partition for every new case directory and start it.
+
+  New cases go through the fast path job (whole case in one run) or through
+  the sensor chain starting at starting_job, depending on NEW_CASE_EXECUTION_MODE.
+  """
+  if not os.path.isdir(PATIENT_INTAKE_DIR):
+      return SkipReason(f"Patient intake directory {PATIENT_INTAKE_DIR} does not exist")
+
+  # Hidden directories are cases still being written (e.g. synthetic cohorts)
+  case_ids = sorted(
+      entry.name for entry in os.scandir(PATIENT_INTAKE_DIR)
+      if entry.is_dir() and not entry.name.startswith(".")
+  )
+  new_case_ids = [
+      case_id for case_id in case_ids
+      if not context.instance.has_dynamic_partition(patients_partitions.name, case_id)
+  ]
+  if not new_case_ids:
+      return SkipReason("No new patient cases")
+
+  if NEW_CASE_EXECUTION_MODE == FAST_PATH_MODE:
+      job_name = patient_fast_path_job.name
+  else:
+      job_name = starting_job.name
+
+  context.log.info(f"Registering {len(new_case_ids)} new patient cases for {job_name}")
+  return SensorResult(
+      run_requests=[
+          RunRequest(
+              run_key=case_id,
+              partition_key=case_id,
+              job_name=job_name,
+              tags={EXECUTION_MODE_TAG: NEW_CASE_EXECUTION_MODE},
+          )
+          for case_id in new_case_ids
+      ],
+      dynamic_partitions_requests=[patients_partitions.build_add_request(new_case_ids)],
+  )
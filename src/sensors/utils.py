@@ -0,0 +1,82 @@
+from dagster import RunRequest
+from ..constants import EXECUTION_MODE_TAG, FAST_PATH_MODE, SENSOR_CHAIN_MODE
+
+def is_fast_path_run(instance, run_id):
+  """Whether a run materialized the whole case at once, so the sensor chain must not follow up"""
+  run = instance.get_run_by_id(run_id)
+  return run is not None and run.tags.get(EXECUTION_MODE_TAG) == FAST_PATH_MODE
+
+def partition_run_request(asset_event):
+  """Run the next step for the same patient partition, once per materialization"""
+  partition_key = asset_event.dagster_event.partition
+  return RunRequest(
+    run_key=f"{partition_key}:{asset_event.run_id}",
+    partition_key=partition_key,
+    tags={EXECUTION_MODE_TAG: SENSOR_CHAIN_MODE},
+  )
+
+def complete_partition_run_requests(context):
+  """
+  Run requests for the patient partitions whose monitored assets all have
+  new materializations since their last trigger.
+
+  Partitions still waiting for one of the upstreams are left unconsumed so
+  they are picked up on a later tick. The run key is derived from the
+  consumed materializations, so retried ticks do not launch the same run
+  twice.
+  """
+  monitored_keys = set(context.asset_keys)
+  run_requests = []
+  waiting = 0
+  fast_path = 0
+  records_by_partition = context.latest_materialization_records_by_partition_and_asset()
+  for partition_key, records in sorted(records_by_partition.items()):
+      if set(records) != monitored_keys:
+          waiting += 1
+          continue
+      # Consume the materializations whatever happens to them below
+      context.advance_cursor(records)
+      if any(is_fast_path_run(context.instance, record.run_id) for record in records.values()):
+          fast_path += 1
+          continue
+      storage_ids = ":".join(str(records[key].storage_id) for key in sorted(records, key=lambda key: key.to_user_string()))
+      run_requests.append(RunRequest(
+          run_key=f"{partition_key}:{storage_ids}",
+          partition_key=partition_key,
+          tags={EXECUTION_MODE_TAG: SENSOR_CHAIN_MODE},
+      ))
+  context.log.info(
+    f"Triggered {len(run_requests)} partitions, {waiting} waiting for upstreams, "
+    f"{fast_path} skipped as fast path runs"
+  )
+  return run_requests
+
+def jaw_run_requests(context, downstream_keys):
+  """
+  Run requests following up the jaws rematerialized in each patient partition.
+
+  ``downstream_keys`` maps each monitored per-jaw asset key to the keys of
+  the next step for that jaw. The run of a partition only selects the
+  jaws with new materializations, so a re-scan of one jaw does not run the
+  other one again. Jaws reported up to date are followed up as well; their
+  next steps are cheap and report up to date in turn, so the downstream
+  sensors waiting for both jaws still trigger.
+  """
+  run_requests = []
+  fast_path = 0
+  records_by_partition = context.latest_materialization_records_by_partition_and_asset()
+  for partition_key, records in sorted(records_by_partition.items()):
+      context.advance_cursor(records)
+      if any(is_fast_path_run(context.instance, record.run_id) for record in records.values()):
+          fast_path += 1
+          continue
+      monitored = sorted(records, key=lambda key: key.to_user_string())
+      storage_ids = ":".join(str(records[key].storage_id) for key in monitored)
+      run_requests.append(RunRequest(
+          run_key=f"{partition_key}:{storage_ids}",
+          partition_key=partition_key,
+          asset_selection=[downstream for key in monitored for downstream in downstream_keys[key]],
+          tags={EXECUTION_MODE_TAG: SENSOR_CHAIN_MODE},
+      ))
+  context.log.info(f"Triggered {len(run_requests)} partitions, {fast_path} skipped as fast path runs")
+  return run_requests
@@ -0,0 +1,88 @@
+import os
+import uuid
+from dagster import (
+    Config,
+    get_dagster_logger,
+)
+from .constants import (
+    STREAMING_ENABLED,
+    STREAMING_SLAB_SIZE,
+    STREAMING_HALO,
+    STREAMING_SCRATCH_DIR,
+)
+from .lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+
+logger = get_dagster_logger()
+
+# Suffix of the files written while streaming; the VolumeIOManager moves
+# them into the asset store instead of copying them
+SCRATCH_SUFFIX = ".scratch.npy"
+
+
+class StreamingConfig(Config):
+    """Run configuration for slab-wise streaming of volumes"""
+    streaming: bool = STREAMING_ENABLED
+    slab_size: int = STREAMING_SLAB_SIZE  # Planes per slab along the first axis
+    halo: int = STREAMING_HALO  # Extra planes of context on each side of a slab
+    scratch_dir: str = STREAMING_SCRATCH_DIR
+
+    def scratch_file(self, name):
+        """Scratch .npy path to stream an array to, or None when streaming is off"""
+        return scratch_path(self.scratch_dir, name) if self.streaming else None
+
+
+def iter_slabs(length, slab_size, halo=0):
+    """
+    Split an axis of ``length`` planes into slabs with an optional halo.
+
+    Args:
+        length (int): Number of planes along the axis
+        slab_size (int): Planes per slab (the last slab may be shorter)
+        halo (int): Planes of context added on each side, clipped to the volume
+
+    Yields:
+        tuple: (core, padded, inner) slices. ``core`` selects the planes the
+            slab is responsible for, ``padded`` the planes to read including
+            the halo, and ``inner`` the core planes within the padded slab.
+    """
+    slab_size = max(1, int(slab_size))
+    for start in range(0, length, slab_size):
+        stop = min(start + slab_size, length)
+        low = max(0, start - halo)
+        high = min(length, stop + halo)
+        yield slice(start, stop), slice(low, high), slice(start - low, stop - low)
+
+
+def map_slabs(read, length, fn, slab_size, halo=0):
+    """
+    Apply ``fn`` slab by slab, so only one padded slab is in memory at a time.
+
+    Args:
+        read (callable): Returns the data for a slice of planes
+        length (int): Number of planes along the first axis
+        fn (callable): Processes a padded slab, returning an array of the same length
+        slab_size (int): Planes per slab
+        halo (int): Planes of context on each side of a slab
+
+    Yields:
+        ndarray: The core planes of ``fn``'s result for each slab
+    """
+    for core, padded, inner in iter_slabs(length, slab_size, halo):
+        yield fn(read(padded))[inner]
+
+
+def scratch_path(scratch_dir, name):
+    """
+    Path of a new scratch .npy file for incrementally written arrays.
+
+    Args:
+        scratch_dir (str): Directory for scratch files
+        name (str): Human readable part of the file name
+
+    Returns:
+        str: Unique file path ending with SCRATCH_SUFFIX
+    """
+    os.makedirs(scratch_dir, exist_ok=True)
+    return os.path.join(scratch_dir, f"{name}-{uuid.uuid4().hex}{SCRATCH_SUFFIX}")
@@ -0,0 +1,322 @@
+import functools
+import os
+import string
+from dagster import (
+    get_dagster_logger,
+)
+from .constants import STL_ASCII_CHUNK_BYTES
+from .lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+
+logger = get_dagster_logger()
+
+BINARY_HEADER_BYTES = 84  # 80 byte header + uint32 triangle count
+
+# One binary STL record: normal, three vertices and the attribute byte count.
+# The dtype is unaligned so it matches the 50 byte on-disk layout exactly.
+BINARY_TRIANGLE_FIELDS = [
+    ("normal", "<f4", (3,)),
+    ("vertices", "<f4", (3, 3)),
+    ("attributes", "<u2"),
+]
+
+# ASCII keywords are blanked with a single translate: every letter but
+# "e"/"E" and every whitespace character becomes a space. The "e"s left
+# over from keywords then follow a space, unlike exponents in numbers.
+_ASCII_BLANKED = (string.ascii_letters.replace("e", "").replace("E", "") + "\t\r\n\v\f").encode()
+_ASCII_TABLE = bytes.maketrans(_ASCII_BLANKED, b" " * len(_ASCII_BLANKED))
+_ASCII_FACET_END = b"endfacet"
+
+
+@functools.lru_cache(maxsize=None)
+def binary_triangle_dtype():
+    """NumPy dtype of the BINARY_TRIANGLE_FIELDS records"""
+    return np.dtype(BINARY_TRIANGLE_FIELDS)
+
+
+class StlMesh:
+    """
+    A triangle mesh loaded from an STL file.
+
+    Vertices shared between triangles are stored once; ``faces`` index
+    into ``vertices``.
+    """
+    def __init__(self, name, vertices, faces, normals, file_format):
+        """
+        Initialize a mesh from already parsed arrays.
+
+        Args:
+            name (str): The name/identifier of the mesh
+            vertices (ndarray): (V, 3) float32 unique vertex positions
+            faces (ndarray): (F, 3) vertex indices of each triangle
+            normals (ndarray): (F, 3) float32 facet normals as stored in the file
+            file_format (str): "binary" or "ascii"
+        """
+        self.name = name
+        self.vertices = vertices
+        self.faces = faces
+        self.normals = normals
+        self.file_format = file_format
+
+    @property
+    def triangle_count(self):
+        return int(self.faces.shape[0])
+
+    @property
+    def vertex_count(self):
+        return int(self.vertices.shape[0])
+
+    def bounds(self):
+        """(min, max) corners of the axis-aligned bounding box"""
+        if self.vertex_count == 0:
+            zero = np.zeros(3, dtype=np.float32)
+            return zero, zero
+        return self.vertices.min(axis=0), self.vertices.max(axis=0)
+
+    def __repr__(self):
+        """String representation of the mesh"""
+        return f"StlMesh(name='{self.name}', triangles={self.triangle_count}, vertices={self.vertex_count})"
+
+
+def is_binary_stl(path):
+    """
+    Whether an STL file is binary.
+
+    ASCII files start with "solid", but so do some binary headers, so the
+    file size is checked against the triangle count first.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as stl_file:
+        header = stl_file.read(BINARY_HEADER_BYTES)
+    if len(header) == BINARY_HEADER_BYTES:
+        count = int(np.frombuffer(header, dtype="<u4", offset=80)[0])
+        if size == BINARY_HEADER_BYTES + count * binary_triangle_dtype().itemsize:
+            return True
+    return not header.lstrip().startswith(b"solid")
+
+
+def read_binary_triangles(path):
+    """
+    Map the triangles of a binary STL file without copying them.
+
+    Returns:
+        ndarray: Read-only memmap of binary_triangle_dtype() records
+    """
+    size = os.path.getsize(path)
+    count = (size - BINARY_HEADER_BYTES) // binary_triangle_dtype().itemsize
+    if count <= 0:
+        return np.zeros(0, dtype=binary_triangle_dtype())
+    return np.memmap(path, dtype=binary_triangle_dtype(), mode="r", offset=BINARY_HEADER_BYTES, shape=(count,))
+
+
+def iter_ascii_facets(path, chunk_bytes=STL_ASCII_CHUNK_BYTES):
+    """
+    Parse an ASCII STL file chunk by chunk.
+
+    Each chunk is cut after its last complete facet, stripped of keywords
+    and solid lines, and parsed with a single np.fromstring call, so no
+    Python object is created per triangle.
+
+    Args:
+        path (str): STL file path
+        chunk_bytes (int): Bytes read per chunk
+
+    Yields:
+        ndarray: (N, 12) float32 rows of normal followed by three vertices
+    """
+    carry = b""
+    with open(path, "rb") as stl_file:
+        while True:
+            block = stl_file.read(chunk_bytes)
+            data = carry + block
+            if block:
+                cut = data.rfind(_ASCII_FACET_END)
+                if cut < 0:
+                    carry = data
+                    continue
+                cut += len(_ASCII_FACET_END)
+                data, carry = data[:cut], data[cut:]
+            else:
+                carry = b""
+
+            values = _parse_ascii_numbers(data)
+            if values.size % 12:
+                raise ValueError(f"Malformed ASCII STL {path}: {values.size} values is not a whole number of facets")
+            if values.size:
+                yield values.reshape(-1, 12)
+            if not block:
+                return
+
+
+def _parse_ascii_numbers(data):
+    """All numbers of an ASCII STL fragment, keywords removed"""
+    data = b" " + _strip_solid_lines(data).translate(_ASCII_TABLE)
+    data = data.replace(b" e", b"  ").replace(b" E", b"  ")
+    if not data.strip():
+        return np.zeros(0, dtype=np.float32)
+    return np.fromstring(data, dtype=np.float32, sep=" ")
+
+
+def _strip_solid_lines(data):
+    """Remove the "solid <name>" / "endsolid <name>" lines, whose names may hold digits"""
+    pieces = []
+    position = 0
+    while True:
+        index = data.find(b"solid", position)
+        if index < 0:
+            break
+        line_start = data.rfind(b"\n", 0, index) + 1
+        line_end = data.find(b"\n", index)
+        if line_end < 0:
+            line_end = len(data)
+        pieces.append(data[position:line_start])
+        position = line_end
+    pieces.append(data[position:])
+    return b"".join(pieces)
+
+
+def deduplicate_vertices(corners):
+    """
+    Merge identical vertices.
+
+    Rows are compared as raw bytes through a void view, which lets
+    np.unique sort them as single keys instead of lexicographically.
+
+    Args:
+        corners (ndarray): (F, 3, 3) float32 triangle corners
+
+    Returns:
+        tuple: ((V, 3) unique vertices, (F, 3) uint32 faces)
+    """
+    flat = np.ascontiguousarray(corners, dtype=np.float32).reshape(-1, 3)
+    # -0.0 and 0.0 differ in bytes but are the same position
+    flat = flat + np.float32(0.0)
+    rows = flat.view(np.dtype((np.void, flat.dtype.itemsize * 3))).ravel()
+    _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+    index_dtype = np.uint32 if first.size < 2 ** 32 else np.int64
+    return flat[first], inverse.astype(index_dtype).reshape(-1, 3)
+
+
+def read_stl(path, name=None):
+    """
+    Load a binary or ASCII STL file.
+
+    Args:
+        path (str): STL file path
+        name (str, optional): Mesh name, the file name by default
+
+    Returns:
+        StlMesh: The mesh with deduplicated vertices
+    """
+    name = name or os.path.splitext(os.path.basename(path))[0]
+    if is_binary_stl(path):
+        triangles = read_binary_triangles(path)
+        corners = triangles["vertices"]
+        normals = np.array(triangles["normal"], dtype=np.float32)
+        file_format = "binary"
+    else:
+        facets = list(iter_ascii_facets(path))
+        rows = np.concatenate(facets) if facets else np.zeros((0, 12), dtype=np.float32)
+        corners = rows[:, 3:].reshape(-1, 3, 3)
+        normals = np.ascontiguousarray(rows[:, :3])
+        file_format = "ascii"
+
+    vertices, faces = deduplicate_vertices(corners)
+    mesh = StlMesh(name, vertices, faces, normals, file_format)
+    logger.debug(f"Loaded {file_format} STL {path}: {mesh}")
+    return mesh
+
+
+def write_binary_stl(path, vertices, faces, header=b""):
+    """
+    Write a triangle mesh as a binary STL file.
+
+    Facet normals are computed from the winding of each triangle.
+
+    Args:
+        path (str): STL file path
+        vertices (ndarray): (V, 3) vertex coordinates
+        faces (ndarray): (F, 3) vertex indices of each triangle
+        header (bytes): Free text of the 80 byte header, truncated to fit
+    """
+    corners = np.asarray(vertices, dtype=np.float32)[np.asarray(faces, dtype=np.int64)]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    np.divide(normals, lengths, out=normals, where=lengths > 0)
+
+    triangles = np.zeros(len(corners), dtype=binary_triangle_dtype())
+    triangles["normal"] = normals
+    triangles["vertices"] = corners
+    # Binary headers must not start with "solid", or readers take them for ASCII
+    header = header[:80].ljust(80, b" ")
+    if header.startswith(b"solid"):
+        header = b"binary" + header[6:]
+    with open(path, "wb") as stl_file:
+        stl_file.write(header)
+        stl_file.write(np.uint32(len(triangles)).astype("<u4").tobytes())
+        stl_file.write(triangles.tobytes())
+    logger.debug(f"Wrote binary STL {path} with {len(triangles)} triangles")
+
+
+def _common_bounds(meshes):
+    """Lowest corner and extent of the common bounding box of non-empty meshes"""
+    low = np.min([mesh.bounds()[0] for mesh in meshes], axis=0).astype(np.float64)
+    high = np.max([mesh.bounds()[1] for mesh in meshes], axis=0).astype(np.float64)
+    return low, np.where(high > low, high - low, 1.0)
+
+
+def voxelize_grid(meshes, dimensions):
+    """
+    Voxel grid of the volume voxelize produces for the same meshes.
+
+    Args:
+        meshes (list): StlMesh objects sharing a coordinate system
+        dimensions (tuple): Shape of the volume
+
+    Returns:
+        tuple: (spacing, origin) in the meshes' units (mm), with the origin
+            at the centre of voxel (0, 0, 0)
+    """
+    meshes = [mesh for mesh in meshes if mesh.vertex_count]
+    if not meshes:
+        return (1.0, 1.0, 1.0), (0.0, 0.0, 0.0)
+    low, extent = _common_bounds(meshes)
+    spacing = extent / np.array([int(dim) for dim in dimensions])
+    return tuple(spacing.tolist()), tuple((low + spacing / 2).tolist())
+
+
+def voxelize(meshes, dimensions):
+    """
+    Rasterize mesh vertices into an occupancy volume.
+
+    The volume spans the common bounding box of the meshes, so voxels are
+    generally not cubes; voxelize_grid gives their size and position. Each
+    voxel holds the number of vertices falling into it, normalized to [0, 1].
+
+    Args:
+        meshes (list): StlMesh objects sharing a coordinate system
+        dimensions (tuple): Shape of the volume
+
+    Returns:
+        ndarray: float32 volume of the given dimensions
+    """
+    dimensions = tuple(int(dim) for dim in dimensions)
+    volume_size = int(np.prod(dimensions, dtype=np.int64))
+    meshes = [mesh for mesh in meshes if mesh.vertex_count]
+    if not meshes:
+        return np.zeros(dimensions, dtype=np.float32)
+
+    low, extent = _common_bounds(meshes)
+    shape = np.array(dimensions)
+
+    counts = np.zeros(volume_size, dtype=np.int64)
+    for mesh in meshes:
+        cells = ((mesh.vertices - low) / extent * shape).astype(np.int64)
+        np.clip(cells, 0, shape - 1, out=cells)
+        flat = np.ravel_multi_index(cells.T, dimensions)
+        counts += np.bincount(flat, minlength=volume_size)
+
+    volume = counts.astype(np.float32)
+    volume /= np.float32(max(1, counts.max()))
+    return volume.reshape(dimensions)
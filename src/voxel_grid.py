@@ -0,0 +1,57 @@
+from .lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+
+# Voxel grid assumed for objects that do not record one: 1 mm voxels at the origin
+DEFAULT_SPACING = (1.0, 1.0, 1.0)
+DEFAULT_ORIGIN = (0.0, 0.0, 0.0)
+
+
+def voxel_grid(obj):
+    """
+    Voxel size and position of an object's volume.
+
+    Args:
+        obj: DentalScan, SegmentationResult or any object with ``spacing``
+            and ``origin`` attributes
+
+    Returns:
+        tuple: (spacing, origin), the size of a voxel along each axis and
+            the position of voxel (0, 0, 0), both in mm
+    """
+    spacing = getattr(obj, "spacing", None) or DEFAULT_SPACING
+    origin = getattr(obj, "origin", None) or DEFAULT_ORIGIN
+    return tuple(float(value) for value in spacing), tuple(float(value) for value in origin)
+
+
+def to_millimetres(points, obj):
+    """
+    Map (N, 3) voxel coordinates of an object's volume to positions in mm.
+
+    Args:
+        points (ndarray): Voxel coordinates, voxel centres at integers
+        obj: Object whose voxel grid the coordinates refer to (see voxel_grid)
+
+    Returns:
+        ndarray: (N, 3) float64 positions
+    """
+    spacing, origin = voxel_grid(obj)
+    return np.asarray(points, dtype=np.float64) * np.asarray(spacing) + np.asarray(origin)
+
+
+def downsampled_grid(obj, factor):
+    """Voxel grid of an object's volume after block averaging ``factor``-sized cubes"""
+    spacing, origin = voxel_grid(obj)
+    # A cube's value sits at the centre of the voxels it averages
+    return (
+        tuple(value * factor for value in spacing),
+        tuple(position + (factor - 1) / 2 * value for position, value in zip(origin, spacing)),
+    )
+
+
+def cropped_grid(obj, box):
+    """Voxel grid of the part of an object's volume inside ``box`` (slices, or None)"""
+    spacing, origin = voxel_grid(obj)
+    if box is None:
+        return spacing, origin
+    return spacing, tuple(position + region.start * value for position, region, value in zip(origin, box, spacing))
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from dagster import AssetKey
+
+from src.asset_reference import AssetReference, StaleReferenceError
+from src.dental_scan import DentalScan
+from src.io_managers.volume_io_manager import content_hash_of, read_volume_object, write_volume_object
+from src.segmentation_result import SegmentationResult
+
+
+def _write_segmentation(path, seed):
+    mask = np.random.default_rng(seed).random((8, 16, 16)) < 0.3
+    scan = DentalScan("scan", "CBCT", dimensions=mask.shape, rng=np.random.default_rng(0))
+    write_volume_object(path, SegmentationResult("teeth", scan, segmented_data=mask), min_array_bytes=0)
+
+
+def test_loading_a_rematerialized_reference_raises(tmp_path):
+    path = str(tmp_path / "teeth")
+    _write_segmentation(path, seed=1)
+    reference = AssetReference(AssetKey("teeth"), None, path,
+                               content_hash=content_hash_of(read_volume_object(path), path))
+
+    assert reference.load().data.count() > 0
+
+    _write_segmentation(path, seed=2)
+    with pytest.raises(StaleReferenceError):
+        reference.load()
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from src.compact_mask import ENCODINGS, CompactMask
+
+SHAPE = (7, 9, 11)
+
+
+def _masks():
+    rng = np.random.default_rng(0)
+    blob = np.zeros(SHAPE, dtype=bool)
+    blob[2:5, 3:8, 1:10] = True
+    return {
+        "empty": np.zeros(SHAPE, dtype=bool),
+        "full": np.ones(SHAPE, dtype=bool),
+        "sparse": rng.random(SHAPE) < 0.02,
+        "noisy": rng.random(SHAPE) < 0.5,
+        "blob": blob,
+    }
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+@pytest.mark.parametrize("name", sorted(_masks()))
+def test_encodings_round_trip(encoding, name):
+    mask = _masks()[name]
+
+    compact = CompactMask.from_dense(mask, encoding=encoding)
+
+    assert compact.encoding == encoding
+    assert compact.count() == int(mask.sum())
+    assert np.array_equal(compact.to_dense(), mask)
+    assert compact.mean() == pytest.approx(mask.mean())
+
+
+def test_smallest_encoding_is_picked():
+    shape = (32, 32, 32)
+    block = np.zeros(shape, dtype=bool)
+    block[8:16, 8:16, 4:28] = True
+    points = np.zeros(shape, dtype=bool)
+    points[(3, 17, 30), (5, 9, 31), (0, 12, 2)] = True
+
+    assert CompactMask.from_dense(_masks()["noisy"]).encoding == "packed"
+    assert CompactMask.from_dense(block).encoding == "rle"
+    assert CompactMask.from_dense(points).encoding == "sparse"
+
+
+def test_from_slabs_matches_from_dense(tmp_path):
+    mask = _masks()["noisy"]
+    # Planes of 99 voxels do not end on byte boundaries
+    slabs = (mask[start:start + 1] for start in range(SHAPE[0]))
+
+    compact = CompactMask.from_slabs(SHAPE, slabs, path=str(tmp_path / "mask.npy"))
+
+    assert compact.count() == int(mask.sum())
+    assert np.array_equal(compact.to_dense(), mask)
+    assert np.array_equal(np.load(tmp_path / "mask.npy"), np.packbits(mask.ravel()))
+
+
+def test_from_slabs_rejects_missing_planes():
+    with pytest.raises(ValueError):
+        CompactMask.from_slabs(SHAPE, [np.zeros((2,) + SHAPE[1:], dtype=bool)])
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+@pytest.mark.parametrize("key", [
+    3,
+    -1,
+    slice(2, 5),
+    slice(1, None, 2),
+    slice(None, None, -1),
+    (4, slice(2, 6), 7),
+    (slice(1, 6), Ellipsis, 3),
+    [0, 5],
+])
+def test_slicing_matches_the_dense_mask(encoding, key):
+    mask = _masks()["blob"] ^ _masks()["sparse"]
+    compact = CompactMask.from_dense(mask, encoding=encoding)
+
+    assert np.array_equal(compact[key], mask[key])
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from src.dicom_series import DicomSeries, write_series
+
+
+def test_read_clips_rescaled_values_to_int16(tmp_path):
+    series_uid = write_series(str(tmp_path), np.zeros((1, 2, 2), dtype=np.int16))
+    # The second slice is stored ten times coarser than the series-wide scale
+    write_series(str(tmp_path), np.array([[[5000, -5000], [100, 0]]], dtype=np.int16), slope=10.0,
+                 first_index=1, series_uid=series_uid)
+
+    volume = DicomSeries.index(str(tmp_path)).read()
+
+    assert volume.dtype == np.int16
+    assert volume[1].tolist() == [[32767, -32768], [1000, 0]]
+
+
+def test_write_series_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    volume = rng.integers(-1000, 3000, size=(6, 5, 7), dtype=np.int16)
+    spacing = (0.4, 0.25, 0.3)
+    # Written in two calls sharing the series
+    series_uid = write_series(str(tmp_path), volume[:4], spacing, slope=0.5, intercept=-1024.0, patient_id="case")
+    write_series(str(tmp_path), volume[4:], spacing, slope=0.5, intercept=-1024.0, patient_id="case",
+                 first_index=4, series_uid=series_uid)
+
+    series = DicomSeries.index(str(tmp_path))
+
+    assert series.shape == volume.shape
+    assert series.rescale == (0.5, -1024.0)
+    grid_spacing, origin = series.grid()
+    assert grid_spacing == pytest.approx(spacing)
+    assert origin == (0.0, 0.0, 0.0)
+    assert series.grid(slice(3, None))[1] == pytest.approx((3 * spacing[0], 0.0, 0.0))
+    assert np.array_equal(series.read(), volume)
+    assert np.array_equal(series.read(slice(2, 5), workers=1), volume[2:5])
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from dagster import Output
+
+from src.instrumentation import _STEP_METRICS, instrumented, pop_step_metrics, record_input_load
+
+
+def _context(step_key):
+    step_context = SimpleNamespace(run_id="run", step=SimpleNamespace(key=step_key))
+    return SimpleNamespace(get_step_execution_context=lambda: step_context)
+
+
+def _jaw(value):
+    return SimpleNamespace(data=np.full((4, 4, 4), value, dtype=np.int16))
+
+
+@instrumented
+def both_jaws(context, produced):
+    for jaw in ("upper_jaw", "lower_jaw"):
+        produced.append(jaw)
+        yield Output(_jaw(1), output_name=jaw)
+
+
+def test_outputs_are_passed_on_as_they_are_produced():
+    context = _context("cbct_scan_data")
+    step_context = context.get_step_execution_context()
+    produced = []
+    outputs = both_jaws(context, produced)
+
+    upper = next(outputs)
+    # The IO manager stores the upper jaw before the lower jaw is computed
+    assert produced == ["upper_jaw"]
+    assert upper.metadata["arrays"].value == {"data": "(4, 4, 4) int16"}
+    metrics = pop_step_metrics(step_context)
+    assert metrics["arrays"] == {"data": "(4, 4, 4) int16"}
+    assert metrics["wall_seconds"] == pytest.approx(upper.metadata["compute_seconds"].value)
+
+    lower = next(outputs)
+    assert produced == ["upper_jaw", "lower_jaw"]
+    assert "compute_seconds" in lower.metadata
+    assert "wall_seconds" in pop_step_metrics(step_context)
+    assert list(outputs) == []
+
+
+def test_inputs_count_towards_the_output_they_were_loaded_for():
+    context = _context("cbct_teeth_segmentation")
+    step_context = context.get_step_execution_context()
+
+    @instrumented
+    def loading(context):
+        for jaw in ("upper_jaw", "lower_jaw"):
+            record_input_load(step_context, 1.0, 1024 * 1024)
+            yield Output(_jaw(0), output_name=jaw)
+
+    for output in loading(context):
+        assert output.metadata["input_seconds"].value == 1.0
+        assert pop_step_metrics(step_context)["input_mb"] == 1.0
+
+
+def test_metrics_left_by_a_failed_step_are_dropped():
+    context = _context("cbct_gum_detection")
+    step_context = context.get_step_execution_context()
+
+    @instrumented
+    def failing(context):
+        record_input_load(step_context, 1.0, 1024)
+        raise ValueError("No gums found")
+        yield
+
+    with pytest.raises(ValueError):
+        list(failing(context))
+    assert ("run", "cbct_gum_detection") not in _STEP_METRICS
@@ -0,0 +1,177 @@
+import os
+import shutil
+
+import numpy as np
+from dagster import (
+    BackfillPolicy,
+    DagsterInstance,
+    Definitions,
+    MetadataValue,
+    Output,
+    ResourceParam,
+    StaticPartitionsDefinition,
+    define_asset_job,
+    multi_asset,
+)
+
+from src.constants import CBCT_JAWS
+from src.dental_scan import DentalScan
+from src.io_managers.volume_io_manager import HEADER_FILE, VolumeIOManager
+from src.jaw_assets import (
+    UP_TO_DATE_METADATA,
+    DataVersionConfig,
+    array_version,
+    derived_version,
+    is_up_to_date,
+    jaw_inputs,
+    jaw_keys,
+    jaw_outputs,
+    load_selected_jaws,
+    selected_jaws,
+    up_to_date_output,
+)
+
+partitions = StaticPartitionsDefinition(["case_a", "case_b"])
+source_keys = jaw_keys("source")
+derived_keys = jaw_keys("derived")
+# Values the source asset produces, per (partition, jaw); tests edit them
+SOURCE_VALUES = {}
+# (partition keys, jaw) of every derived jaw actually computed
+COMPUTED = []
+
+
+def _scan(value):
+    return DentalScan.from_values("scan", "CBCT", np.full((4, 4, 4), value, dtype=np.float32))
+
+
+@multi_asset(outs=jaw_outputs("source"), partitions_def=partitions, can_subset=True,
+             backfill_policy=BackfillPolicy.single_run())
+def source(context):
+    for jaw in selected_jaws(context):
+        scans = {key: _scan(SOURCE_VALUES.get((key, jaw), 0.0)) for key in context.partition_keys}
+        if len(scans) == 1:
+            scan, = scans.values()
+            yield Output(scan, output_name=jaw, data_version=array_version(scan.data))
+        else:
+            yield Output(scans, output_name=jaw)
+
+
+@multi_asset(
+    outs=jaw_outputs("derived", code_version="1"),
+    ins=jaw_inputs("scan", source_keys),
+    internal_asset_deps={jaw: {source_keys[jaw]} for jaw in CBCT_JAWS},
+    partitions_def=partitions,
+    can_subset=True,
+    backfill_policy=BackfillPolicy.single_run(),
+)
+def derived(context, config: DataVersionConfig, io_manager: ResourceParam[VolumeIOManager]):
+    scans = load_selected_jaws(context, io_manager, source_keys)
+    for jaw in selected_jaws(context):
+        version = derived_version(context, derived_keys[jaw], factor=2)
+        if is_up_to_date(context, config, derived_keys[jaw], version):
+            yield up_to_date_output(version, jaw)
+            continue
+        COMPUTED.append((tuple(context.partition_keys), jaw))
+        yield Output(scans[jaw], output_name=jaw, data_version=version,
+                     metadata={"computed": MetadataValue.bool(True)})
+
+
+def _run(tmp_path, instance, selection, partition_key=None, partition_range=None):
+    defs = Definitions(
+        assets=[source, derived],
+        jobs=[define_asset_job("run", selection=selection)],
+        resources={"io_manager": VolumeIOManager(base_dir=str(tmp_path), metrics_file="")},
+    )
+    tags = {}
+    if partition_range is not None:
+        tags = {
+            "dagster/asset_partition_range_start": partition_range[0],
+            "dagster/asset_partition_range_end": partition_range[1],
+        }
+    result = defs.get_job_def("run").execute_in_process(instance=instance, partition_key=partition_key, tags=tags)
+    assert result.success
+    return {
+        event.asset_key: event.step_materialization_data.materialization.metadata
+        for event in result.get_asset_materialization_events()
+    }
+
+
+def _header_inode(tmp_path, jaw, partition_key="case_a"):
+    return os.stat(os.path.join(str(tmp_path), "derived", jaw, partition_key, HEADER_FILE)).st_ino
+
+
+def setup_function():
+    SOURCE_VALUES.clear()
+    COMPUTED.clear()
+
+
+def test_unchanged_upstream_is_reported_up_to_date(tmp_path):
+    with DagsterInstance.ephemeral() as instance:
+        _run(tmp_path, instance, [source, derived], partition_key="case_a")
+        inodes = {jaw: _header_inode(tmp_path, jaw) for jaw in CBCT_JAWS}
+        COMPUTED.clear()
+
+        materializations = _run(tmp_path, instance, [derived], partition_key="case_a")
+
+        assert COMPUTED == []
+        for jaw, key in derived_keys.items():
+            assert materializations[key][UP_TO_DATE_METADATA].value is True
+            assert "stored_arrays" not in materializations[key]
+            # The stored value was neither rewritten nor swapped
+            assert _header_inode(tmp_path, jaw) == inodes[jaw]
+
+
+def test_changed_upstream_jaw_is_recomputed(tmp_path):
+    with DagsterInstance.ephemeral() as instance:
+        _run(tmp_path, instance, [source, derived], partition_key="case_a")
+        COMPUTED.clear()
+
+        SOURCE_VALUES["case_a", "lower_jaw"] = 1.0
+        materializations = _run(tmp_path, instance, [source, derived], partition_key="case_a")
+
+        assert COMPUTED == [(("case_a",), "lower_jaw")]
+        assert materializations[derived_keys["lower_jaw"]]["computed"].value is True
+        assert UP_TO_DATE_METADATA in materializations[derived_keys["upper_jaw"]]
+
+
+def test_skip_unchanged_can_be_disabled(tmp_path):
+    with DagsterInstance.ephemeral() as instance:
+        _run(tmp_path, instance, [source, derived], partition_key="case_a")
+        COMPUTED.clear()
+
+        defs = Definitions(
+            assets=[source, derived],
+            resources={"io_manager": VolumeIOManager(base_dir=str(tmp_path), metrics_file="")},
+        )
+        job = defs.get_implicit_global_asset_job_def().get_subset(asset_selection=set(derived_keys.values()))
+        result = job.execute_in_process(
+            instance=instance, partition_key="case_a",
+            run_config={"ops": {"derived": {"config": {"skip_unchanged": False}}}},
+        )
+
+        assert result.success
+        assert sorted(jaw for _, jaw in COMPUTED) == sorted(CBCT_JAWS)
+
+
+def test_runs_over_several_partitions_never_skip(tmp_path):
+    with DagsterInstance.ephemeral() as instance:
+        for partition_key in partitions.get_partition_keys():
+            _run(tmp_path, instance, [source, derived], partition_key=partition_key)
+        COMPUTED.clear()
+
+        materializations = _run(tmp_path, instance, [derived], partition_range=("case_a", "case_b"))
+
+        assert sorted(COMPUTED) == sorted((("case_a", "case_b"), jaw) for jaw in CBCT_JAWS)
+        assert not any(UP_TO_DATE_METADATA in metadata for metadata in materializations.values())
+
+
+def test_subset_runs_only_load_the_selected_jaws(tmp_path):
+    with DagsterInstance.ephemeral() as instance:
+        _run(tmp_path, instance, [source], partition_key="case_a")
+        # The upper jaw output never reads the lower jaw scan
+        shutil.rmtree(os.path.join(str(tmp_path), "source", "lower_jaw"))
+
+        materializations = _run(tmp_path, instance, [derived_keys["upper_jaw"]], partition_key="case_a")
+
+        assert list(materializations) == [derived_keys["upper_jaw"]]
+        assert COMPUTED == [(("case_a",), "upper_jaw")]
@@ -0,0 +1,33 @@
+import numpy as np
+
+from src.dental_scan import DentalScan
+from src.mesh_export import export_surfaces
+from src.segmentation_result import SegmentationResult
+
+
+def _ply_vertices(path):
+    with open(path, "rb") as ply_file:
+        data = ply_file.read()
+    header, body = data.split(b"end_header\n", 1)
+    count = int(next(line.split()[2] for line in header.splitlines() if line.startswith(b"element vertex")))
+    return np.frombuffer(body[:count * 12], dtype="<f4").reshape(count, 3)
+
+
+def test_surfaces_are_exported_in_millimetres_and_transformed(tmp_path):
+    mask = np.zeros((6, 6, 6), dtype=bool)
+    mask[2:4, 2:4, 2:4] = True
+    scan = DentalScan.from_stored("scan", "CBCT", np.zeros(mask.shape, dtype=np.int16),
+                                  spacing=(0.5, 1.0, 2.0), origin=(10.0, 20.0, 30.0))
+    segmentation = SegmentationResult("teeth", scan, segmented_data=mask)
+    shift = np.eye(4)
+    shift[:3, 3] = (1.0, 2.0, 3.0)
+
+    plain = export_surfaces({"cbct": segmentation}, str(tmp_path / "plain"), formats=["ply"])
+    moved = export_surfaces({"ios": segmentation}, str(tmp_path / "moved"), formats=["ply"],
+                            transforms={"ios": shift})
+
+    vertices = _ply_vertices(plain["files"]["ply"])
+    # Voxels 2 and 3 are positive: the surface spans indices 1.5 to 3.5
+    assert np.allclose(vertices.min(axis=0), (10.75, 21.5, 33.0), atol=1e-4)
+    assert np.allclose(vertices.max(axis=0), (11.75, 23.5, 37.0), atol=1e-4)
+    assert np.allclose(_ply_vertices(moved["files"]["ply"]), vertices + shift[:3, 3], atol=1e-4)
@@ -0,0 +1,27 @@
+import numpy as np
+
+from src.dental_scan import DentalScan
+from src.registration import icp, surface_points
+from src.stl import StlMesh, voxelize, voxelize_grid
+from src.synthetic_cohort import generate_case
+from src.voxel_grid import to_millimetres
+
+
+def test_icp_in_millimetres_recovers_the_ios_transform():
+    case = generate_case("registration_case", seed=0, dimensions=(40, 64, 64), ios_triangles=4000)
+    mesh = StlMesh("ios", case.ios_vertices, case.ios_faces, np.zeros_like(case.ios_vertices), "binary")
+    ios_dimensions = (50, 60, 70)
+    spacing, origin = voxelize_grid([mesh], ios_dimensions)
+    ios_scan = DentalScan.from_values("ios", "IOS", voxelize([mesh], ios_dimensions), spacing=spacing, origin=origin)
+
+    source = to_millimetres(np.argwhere(ios_scan.data > 0), ios_scan)
+    target = np.concatenate([
+        to_millimetres(surface_points(case.masks[jaw]["teeth"], 3000, seed=index), case.scans[jaw])
+        for index, jaw in enumerate(("lower_jaw", "upper_jaw"))
+    ])
+    registration = icp(source, target)
+
+    # The IOS surface was moved by ios_transform; registering it back undoes it
+    expected = np.linalg.inv(case.ios_transform)
+    assert np.allclose(registration["transform"][:3, :3], expected[:3, :3], atol=0.02)
+    assert np.allclose(registration["transform"][:3, 3], expected[:3, 3], atol=0.5)
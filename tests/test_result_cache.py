@@ -0,0 +1,76 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+from dagster import AssetKey
+
+from src.dental_scan import DentalScan
+from src.resources.result_cache import SegmentationCache
+
+ASSET_KEY = AssetKey("cbct_teeth_preview")
+# Large enough to be stored as a separate array rather than inline in the header
+ENTRY_BYTES = 256 * 1024
+
+
+def _context(code_version="1"):
+    # Only what key_for reads from an asset execution context
+    assets_def = SimpleNamespace(code_versions_by_key={ASSET_KEY: code_version})
+    return SimpleNamespace(asset_key=ASSET_KEY, assets_def=assets_def)
+
+
+def _scan(value=0.0):
+    return DentalScan.from_values("scan", "CBCT", np.full((4, 4, 4), value, dtype=np.float32))
+
+
+def _value(fill):
+    return np.full(ENTRY_BYTES, fill, dtype=np.uint8)
+
+
+def _set_last_used(cache, key, timestamp):
+    os.utime(os.path.join(cache.base_dir, key), (timestamp, timestamp))
+
+
+def test_key_changes_with_code_version_params_and_input(tmp_path):
+    cache = SegmentationCache(base_dir=str(tmp_path))
+    key = cache.key_for(_context(), _scan(), factor=2)
+
+    assert cache.key_for(_context(), _scan(), factor=2) == key
+    assert cache.key_for(_context(code_version="2"), _scan(), factor=2) != key
+    assert cache.key_for(_context(), _scan(), factor=4) != key
+    assert cache.key_for(_context(), _scan(1.0), factor=2) != key
+    assert cache.key_for(_context(), _scan(), asset_key=AssetKey("other"), factor=2) != key
+
+
+def test_get_returns_the_stored_value(tmp_path):
+    cache = SegmentationCache(base_dir=str(tmp_path))
+
+    assert cache.get("missing") is None
+    cache.put("entry", _value(7))
+
+    assert np.array_equal(cache.get("entry"), _value(7))
+    assert SegmentationCache(base_dir=str(tmp_path), enabled=False).get("entry") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    # Room for two entries, not three
+    cache = SegmentationCache(base_dir=str(tmp_path), max_bytes=int(2.5 * ENTRY_BYTES))
+    cache.put("first", _value(1))
+    cache.put("second", _value(2))
+    _set_last_used(cache, "first", 1_000)
+    _set_last_used(cache, "second", 2_000)
+
+    # Reading the oldest entry makes it the most recently used one
+    assert cache.get("first") is not None
+    cache.put("third", _value(3))
+
+    assert sorted(os.listdir(cache.base_dir)) == ["first", "third"]
+    assert cache.get("second") is None
+
+
+def test_entry_larger_than_the_store_is_kept(tmp_path):
+    cache = SegmentationCache(base_dir=str(tmp_path), max_bytes=ENTRY_BYTES // 2)
+    cache.put("first", _value(1))
+    cache.put("second", _value(2))
+
+    assert os.listdir(cache.base_dir) == ["second"]
+    assert np.array_equal(cache.get("second"), _value(2))
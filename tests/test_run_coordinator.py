@@ -0,0 +1,117 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from dagster import AssetKey, DagsterInstance, DagsterRun
+
+from src.constants import FAST_PATH_MAX_CONCURRENT
+from src.partitions import patients_partitions
+from src.run_coordinator import PRIORITY_TAG, BudgetedRunCoordinator, plan_admissions
+from src.run_costs import ASSET_COSTS, job_cost, job_cost_tags, parse_run_cost, run_cost_tags, scale_cost
+
+NOW = 1_000_000.0
+
+
+def _run(run_id, memory_mb=None, cpus=None, **tags):
+    if memory_mb is not None:
+        tags.update(run_cost_tags(memory_mb, cpus))
+    return DagsterRun(job_name="materialize_all", run_id=run_id, tags=tags)
+
+
+def _queued(run, queued_seconds=0.0):
+    created = datetime.fromtimestamp(NOW - queued_seconds, tz=timezone.utc)
+    return SimpleNamespace(dagster_run=run, create_timestamp=created)
+
+
+def _admitted(queued, in_progress=(), memory_budget_mb=1000, cpu_budget=4, **kwargs):
+    admitted = plan_admissions(queued, list(in_progress), memory_budget_mb, cpu_budget, now=NOW, **kwargs)
+    return [run.run_id for run in admitted]
+
+
+def test_runs_are_admitted_while_they_fit_in_what_the_running_ones_leave():
+    running = [_run("running", 600, 2)]
+    queued = [_queued(_run("large", 500, 1)), _queued(_run("small", 300, 1)), _queued(_run("cpu", 100, 2))]
+
+    # "large" does not fit next to the running run; smaller runs behind it do
+    assert _admitted(queued, running) == ["small"]
+
+
+def test_a_starving_run_holds_the_budget():
+    running = [_run("running", 600, 2)]
+    queued = [_queued(_run("large", 500, 1), queued_seconds=700), _queued(_run("small", 300, 1))]
+
+    assert _admitted(queued, running, starvation_seconds=600) == []
+    assert _admitted(queued, running, starvation_seconds=None) == ["small"]
+
+
+def test_a_run_larger_than_the_budget_runs_alone():
+    queued = [_queued(_run("huge", 5000, 16)), _queued(_run("small", 100, 1))]
+
+    assert _admitted(queued) == ["huge"]
+    assert _admitted(queued, [_run("running", 100, 1)], starvation_seconds=None) == ["small"]
+
+
+def test_priority_order_max_runs_and_runs_without_a_cost():
+    queued = [
+        _queued(_run("first", 100, 1)),
+        _queued(_run("urgent", 100, 1, **{PRIORITY_TAG: "5"})),
+        _queued(_run("uncosted")),
+    ]
+
+    assert _admitted(queued) == ["urgent", "first", "uncosted"]
+    assert _admitted(queued, max_runs=2) == ["urgent", "first"]
+
+
+def test_static_tag_limits_are_respected():
+    queued = [_queued(_run("a", 100, 1, team="x")), _queued(_run("b", 100, 1, team="x"))]
+    limits = [{"key": "team", "value": "x", "limit": 1}]
+
+    assert _admitted(queued, static_limits=limits) == ["a"]
+
+
+def test_static_limits_on_a_key_and_per_unique_value():
+    running = [_run("running", 100, 1, team="x")]
+    queued = [_queued(_run(run_id, 100, 1, team=team)) for run_id, team in [("a", "x"), ("b", "y"), ("c", "y")]]
+
+    assert _admitted(queued, running, static_limits=[{"key": "team", "limit": 2}]) == ["a"]
+    per_team = [{"key": "team", "value": {"applyLimitPerUniqueValue": True}, "limit": 1}]
+    assert _admitted(queued, running, static_limits=per_team) == ["b"]
+
+
+def _submitted_cost(run, partition_keys=()):
+    """The cost a run declares once tagged on submission by the budgeted coordinator"""
+    with DagsterInstance.ephemeral() as instance:
+        instance.add_dynamic_partitions(patients_partitions.name, list(partition_keys))
+        coordinator = BudgetedRunCoordinator()
+        coordinator.register_instance(instance)
+        instance.add_run(run)
+        # What submit_run does before queueing; queueing needs a code location origin
+        coordinator._tag_run_cost(run)
+        return parse_run_cost(instance.get_run_by_id(run.run_id).tags)
+
+
+def test_runs_narrowed_to_one_jaw_declare_the_cost_of_that_jaw():
+    job_assets = ["cbct_teeth_preview", "cbct_teeth_segmentation"]
+    lower_jaw = [AssetKey([name, "lower_jaw"]) for name in job_assets]
+    run = DagsterRun(job_name="cbct_teeth_seg_job", run_id="lower", tags=job_cost_tags(job_assets),
+                     asset_selection=frozenset(lower_jaw))
+
+    assert _submitted_cost(run) == job_cost([key.to_user_string() for key in lower_jaw])
+    assert _submitted_cost(run) < job_cost(job_assets)
+
+
+def test_runs_of_the_whole_job_keep_its_cost():
+    tags = job_cost_tags(ASSET_COSTS, FAST_PATH_MAX_CONCURRENT)
+    everything = frozenset(AssetKey(name) for name in ASSET_COSTS)
+
+    assert _submitted_cost(DagsterRun(job_name="materialize_all", run_id="job", tags=tags)) == parse_run_cost(tags)
+    # Recomputed without the job's concurrency limit, the full selection would cost more
+    run = DagsterRun(job_name="materialize_all", run_id="selection", tags=tags, asset_selection=everything)
+    assert _submitted_cost(run) == parse_run_cost(tags)
+
+
+def test_backfill_runs_scale_with_their_partition_range():
+    tags = {**job_cost_tags(["crown_design"]), "dagster/asset_partition_range_start": "case_b",
+            "dagster/asset_partition_range_end": "case_c"}
+    run = DagsterRun(job_name="crown_design_job", run_id="backfill", tags=tags)
+
+    assert _submitted_cost(run, ["case_a", "case_b", "case_c"]) == scale_cost(*job_cost(["crown_design"]), 2)
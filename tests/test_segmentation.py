@@ -0,0 +1,32 @@
+import numpy as np
+
+from src.dental_scan import DentalScan
+from src.segmentation import coarse_disagreement, segment_coarse_to_fine
+
+SHAPE = (40, 48, 56)
+
+
+def _full_resolution(scan, positive_fraction):
+    return scan.normalized() > 1.0 - positive_fraction
+
+
+def test_coarse_to_fine_matches_full_resolution_on_smooth_scans():
+    ramp = np.indices(SHAPE).sum(axis=0) / (sum(SHAPE) - 3) * 3000.0
+    scan = DentalScan.from_values("smooth", "CBCT", ramp, dtype="int16", value_range=(0.0, 3000.0))
+
+    mask, refined = segment_coarse_to_fine(scan, 0.3, factor=4)
+
+    assert np.array_equal(mask[:], _full_resolution(scan, 0.3))
+    assert 0.0 < refined < 0.5
+
+
+def test_coarse_to_fine_falls_back_to_full_resolution_on_noise():
+    scan = DentalScan("noise", "CBCT", SHAPE, dtype="int16", value_range=(0.0, 3000.0),
+                      rng=np.random.default_rng(0))
+    coarse = scan.level(4).normalized() > 0.7
+    assert coarse_disagreement(scan, 0.3, 4, coarse) > 0.2
+
+    mask, refined = segment_coarse_to_fine(scan, 0.3, factor=4)
+
+    assert np.array_equal(mask[:], _full_resolution(scan, 0.3))
+    assert refined == 1.0
@@ -0,0 +1,148 @@
+from dagster import (
+    AssetKey,
+    DagsterInstance,
+    Definitions,
+    Output,
+    asset,
+    build_multi_asset_sensor_context,
+    materialize,
+    multi_asset,
+)
+
+from src.constants import CBCT_JAWS, EXECUTION_MODE_TAG, FAST_PATH_MODE, SENSOR_CHAIN_MODE
+from src.jaw_assets import jaw_keys, jaw_outputs, selected_jaws
+from src.partitions import patients_partitions
+from src.sensors.cbct_sensors import cbct_scan_data_sensor
+from src.sensors.crown_design_sensors import crown_design_sensor
+
+
+# Stand-ins for the monitored assets, with the same keys and partitions
+@multi_asset(outs=jaw_outputs("cbct_scan_data"), partitions_def=patients_partitions, can_subset=True)
+def cbct_scan_data(context):
+    for jaw in selected_jaws(context):
+        yield Output(None, output_name=jaw)
+
+
+@multi_asset(outs=jaw_outputs("cbct_teeth_segmentation"), partitions_def=patients_partitions, can_subset=True)
+def cbct_teeth_segmentation(context):
+    for jaw in selected_jaws(context):
+        yield Output(None, output_name=jaw)
+
+
+@asset(partitions_def=patients_partitions)
+def ios_segmentation():
+    return None
+
+
+STAND_INS = [cbct_scan_data, cbct_teeth_segmentation, ios_segmentation]
+scan_keys = jaw_keys("cbct_scan_data")
+teeth_keys = jaw_keys("cbct_teeth_segmentation")
+# Assets monitored by each sensor under test
+MONITORED = {
+    crown_design_sensor.name: [*teeth_keys.values(), ios_segmentation.key],
+    cbct_scan_data_sensor.name: list(scan_keys.values()),
+}
+
+
+def _instance(partition_keys=("case_a",)):
+    instance = DagsterInstance.ephemeral()
+    instance.add_dynamic_partitions(patients_partitions.name, list(partition_keys))
+    return instance
+
+
+def _materialize(instance, keys, partition_key="case_a", fast_path=False):
+    tags = {EXECUTION_MODE_TAG: FAST_PATH_MODE} if fast_path else {}
+    result = materialize(STAND_INS, selection=list(keys), partition_key=partition_key, instance=instance, tags=tags)
+    assert result.success
+
+
+def _tick(sensor, instance, cursor=None):
+    """Evaluate one sensor tick; returns its run requests and the cursor after it"""
+    # Invoked directly: evaluate_tick resolves dynamic partitions through an instance ref the built context lacks
+    context = build_multi_asset_sensor_context(
+        monitored_assets=MONITORED[sensor.name], instance=instance, cursor=cursor,
+        definitions=Definitions(assets=STAND_INS),
+    )
+    run_requests = sensor(context)
+    return list(run_requests), context.cursor
+
+
+def test_crown_design_waits_for_every_upstream():
+    with _instance() as instance:
+        _materialize(instance, [teeth_keys["upper_jaw"], ios_segmentation.key])
+
+        requests, cursor = _tick(crown_design_sensor, instance)
+        assert requests == []
+
+        _materialize(instance, [teeth_keys["lower_jaw"]])
+        requests, cursor = _tick(crown_design_sensor, instance, cursor)
+
+        request, = requests
+        assert request.partition_key == "case_a"
+        assert request.tags[EXECUTION_MODE_TAG] == SENSOR_CHAIN_MODE
+        # The upper jaw and IOS materializations waited for the lower jaw: they were not consumed before
+        assert request.run_key.startswith("case_a:")
+        assert len(request.run_key.split(":")) == 1 + 3
+
+
+def test_crown_design_triggers_once_per_set_of_materializations():
+    with _instance(["case_a", "case_b"]) as instance:
+        for partition_key in ("case_a", "case_b"):
+            _materialize(instance, [*teeth_keys.values(), ios_segmentation.key], partition_key)
+
+        requests, cursor = _tick(crown_design_sensor, instance)
+        assert sorted(request.partition_key for request in requests) == ["case_a", "case_b"]
+        assert len({request.run_key for request in requests}) == 2
+
+        # Consumed: the next tick has nothing to do
+        assert _tick(crown_design_sensor, instance, cursor)[0] == []
+
+        # A new materialization of every upstream triggers again, under a new run key
+        _materialize(instance, [*teeth_keys.values(), ios_segmentation.key], "case_a")
+        rerun, = _tick(crown_design_sensor, instance, cursor)[0]
+        assert rerun.partition_key == "case_a"
+        assert rerun.run_key not in {request.run_key for request in requests}
+
+
+def test_crown_design_skips_fast_path_runs():
+    with _instance() as instance:
+        _materialize(instance, [*teeth_keys.values(), ios_segmentation.key], fast_path=True)
+
+        requests, cursor = _tick(crown_design_sensor, instance)
+        assert requests == []
+        # The fast path materializations were consumed, not left waiting
+        assert _tick(crown_design_sensor, instance, cursor)[0] == []
+
+
+def test_jaw_requests_only_select_the_rematerialized_jaw():
+    with _instance() as instance:
+        _materialize(instance, [scan_keys["lower_jaw"]])
+
+        request, = _tick(cbct_scan_data_sensor, instance)[0]
+
+        assert request.partition_key == "case_a"
+        assert request.tags[EXECUTION_MODE_TAG] == SENSOR_CHAIN_MODE
+        assert set(request.asset_selection) == {
+            AssetKey(["cbct_teeth_preview", "lower_jaw"]), AssetKey(["cbct_teeth_segmentation", "lower_jaw"]),
+        }
+
+
+def test_jaw_requests_select_both_jaws_when_both_are_fresh():
+    with _instance() as instance:
+        _materialize(instance, list(scan_keys.values()))
+
+        request, = _tick(cbct_scan_data_sensor, instance)[0]
+
+        assert set(request.asset_selection) == {
+            AssetKey([name, jaw]) for name in ("cbct_teeth_preview", "cbct_teeth_segmentation") for jaw in CBCT_JAWS
+        }
+
+
+def test_jaw_requests_skip_fast_path_runs():
+    with _instance() as instance:
+        _materialize(instance, list(scan_keys.values()), fast_path=True)
+
+        requests, cursor = _tick(cbct_scan_data_sensor, instance)
+
+        assert requests == []
+        assert _tick(cbct_scan_data_sensor, instance, cursor)[0] == []
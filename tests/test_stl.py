@@ -0,0 +1,82 @@
+import numpy as np
+
+from src.stl import binary_triangle_dtype, is_binary_stl, iter_ascii_facets, read_stl, write_binary_stl
+
+# Two triangles of a unit square, sharing an edge
+VERTICES = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [1.0, 1.0, 0.0], [0.0, 1.0, 0.0]], dtype=np.float32)
+FACES = np.array([[0, 1, 2], [0, 2, 3]])
+
+ASCII_STL = """solid square_2
+  facet normal 0 0 1
+    outer loop
+      vertex 0 0 0
+      vertex 1.0e0 0 0
+      vertex 1 1 0
+    endloop
+  endfacet
+  facet normal 0.0E+00 -0 1
+    outer loop
+      vertex 0 0 0
+      vertex 1 1 0
+      vertex 0 1e-0 -0.0
+    endloop
+  endfacet
+endsolid square_2
+"""
+
+
+def _corners(mesh):
+    return mesh.vertices[mesh.faces]
+
+
+def test_binary_round_trip(tmp_path):
+    path = str(tmp_path / "square.stl")
+    write_binary_stl(path, VERTICES, FACES, header=b"solid looking header")
+
+    mesh = read_stl(path)
+
+    assert is_binary_stl(path)
+    assert mesh.file_format == "binary"
+    assert mesh.name == "square"
+    assert mesh.triangle_count == 2
+    assert mesh.vertex_count == 4
+    assert np.array_equal(_corners(mesh), VERTICES[FACES])
+    assert np.allclose(mesh.normals, [[0, 0, 1], [0, 0, 1]])
+
+
+def test_binary_header_starting_with_solid(tmp_path):
+    path = str(tmp_path / "solid_header.stl")
+    triangles = np.zeros(2, dtype=binary_triangle_dtype())
+    triangles["vertices"] = VERTICES[FACES]
+    with open(path, "wb") as stl_file:
+        stl_file.write(b"solid exported by some CAD tool".ljust(80, b" "))
+        stl_file.write(np.uint32(2).astype("<u4").tobytes())
+        stl_file.write(triangles.tobytes())
+
+    mesh = read_stl(path)
+
+    assert mesh.file_format == "binary"
+    assert np.array_equal(_corners(mesh), VERTICES[FACES])
+
+
+def test_ascii_reading(tmp_path):
+    path = tmp_path / "square.stl"
+    path.write_text(ASCII_STL)
+
+    mesh = read_stl(str(path), name="ascii_square")
+
+    assert not is_binary_stl(str(path))
+    assert mesh.file_format == "ascii"
+    assert mesh.name == "ascii_square"
+    assert mesh.vertex_count == 4
+    assert np.array_equal(_corners(mesh), VERTICES[FACES])
+    assert np.allclose(mesh.normals, [[0, 0, 1], [0, 0, 1]])
+
+
+def test_ascii_chunks_split_inside_facets(tmp_path):
+    path = tmp_path / "square.stl"
+    path.write_text(ASCII_STL)
+
+    for chunk_bytes in (7, 64, 1 << 20):
+        rows = np.concatenate(list(iter_ascii_facets(str(path), chunk_bytes=chunk_bytes)))
+        assert np.array_equal(rows[:, 3:].reshape(-1, 3, 3), VERTICES[FACES])
@@ -0,0 +1,59 @@
+import json
+import os
+
+import numpy as np
+
+from src.compact_mask import CompactMask
+from src.dental_scan import DentalScan
+from src.io_managers.volume_io_manager import (
+    MANIFEST_FILE,
+    content_hash_of,
+    read_volume_object,
+    write_volume_object,
+)
+from src.segmentation_result import SegmentationResult
+
+
+def _segmentation(mask):
+    scan = DentalScan("scan", "CBCT", dimensions=mask.shape, rng=np.random.default_rng(0))
+    return SegmentationResult("teeth", scan, segmented_data=CompactMask.from_dense(mask, encoding="packed"))
+
+
+def _stored_hash(tmp_path, name, obj, min_array_bytes):
+    path = str(tmp_path / name)
+    write_volume_object(path, obj, min_array_bytes=min_array_bytes)
+    return content_hash_of(read_volume_object(path), path)
+
+
+def test_content_hash_covers_the_mask_bits(tmp_path):
+    rng = np.random.default_rng(1)
+    mask = rng.random((8, 16, 16)) < 0.3
+    changed = mask.copy()
+    changed[0, 0, 0] = not changed[0, 0, 0]
+
+    for min_array_bytes in (0, 1 << 30):
+        first = _stored_hash(tmp_path, f"first-{min_array_bytes}", _segmentation(mask), min_array_bytes)
+        again = _stored_hash(tmp_path, f"again-{min_array_bytes}", _segmentation(mask), min_array_bytes)
+        other = _stored_hash(tmp_path, f"other-{min_array_bytes}", _segmentation(changed), min_array_bytes)
+        assert first is not None
+        assert first == again
+        assert first != other
+
+
+def test_stored_arrays_keep_their_manifest_digest(tmp_path):
+    first = str(tmp_path / "first")
+    write_volume_object(first, _segmentation(np.ones((8, 16, 16), dtype=bool)), min_array_bytes=0)
+    manifest_path = os.path.join(first, MANIFEST_FILE)
+    with open(manifest_path) as manifest_file:
+        manifest = json.load(manifest_file)
+    # A digest the data cannot hash to: it can only be copied from the manifest
+    manifest = {file_name: f"stored-{digest}" for file_name, digest in manifest.items()}
+    with open(manifest_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+
+    second = str(tmp_path / "second")
+    write_volume_object(second, read_volume_object(first), min_array_bytes=0)
+
+    with open(os.path.join(second, MANIFEST_FILE)) as manifest_file:
+        digests = set(json.load(manifest_file).values())
+    assert digests == set(manifest.values())